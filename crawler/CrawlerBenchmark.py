@@ -0,0 +1,299 @@
+"""
+Offline throughput benchmark for the image crawler.
+Starts a local stub server that imitates Google/Yandex result pages and an image
+CDN with configurable latency, server errors and 429 responses, then drives
+ImageCrawler.process_csv_file end to end against it.
+"""
+
+import os
+import io
+import csv
+import json
+import shutil
+import time
+import random
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+logger = logging.getLogger("crawler_benchmark")
+
+# Поиск и "CDN" обслуживаются одним сервером, но под разными именами хоста,
+# чтобы ограничитель частоты запросов вел для них отдельные корзины
+SEARCH_HOST = "127.0.0.1"
+CDN_HOST = "localhost"
+
+
+class StubStats:
+    """Thread-safe counters of the stub server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.statuses: Dict[int, int] = {}
+        self.bytes_sent = 0
+        self.paths: Dict[str, int] = {}
+
+    def record(self, kind: str, path: str, status: int, size: int) -> None:
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes_sent += size
+            self.paths[path] = self.paths.get(path, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'statuses': dict(self.statuses),
+                'bytes_sent': self.bytes_sent,
+                'paths': dict(self.paths),
+            }
+
+
+@lru_cache(maxsize=4096)
+def render_image(key: str, size: int) -> bytes:
+    """Renders a distinct PNG for a URL, so deduplication does not discard stub images."""
+    rng = random.Random(hashlib.sha1(key.encode('utf-8')).hexdigest())
+    small = Image.new('RGB', (8, 8))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64)])
+    buffer = io.BytesIO()
+    small.resize((size, size), Image.BILINEAR).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def make_handler(config: argparse.Namespace, stats: StubStats, port_holder: Dict[str, int]):
+    """Creates the request handler class bound to the benchmark settings."""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, kind: str, status: int, body: bytes, content_type: str,
+                  headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            stats.record(kind, self.path, status, len(body))
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            kind = 'image' if parsed.path.startswith('/img/') else 'search'
+            latency = (config.search_latency_ms if kind == 'search' else config.image_latency_ms) / 1000.0
+            if latency:
+                time.sleep(latency * random.uniform(0.5, 1.5))
+
+            roll = random.random()
+            if roll < config.throttle_rate:
+                self._send(kind, 429, b'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+                return
+            if roll < config.throttle_rate + config.error_rate:
+                self._send(kind, 503, b'Service Unavailable', 'text/plain')
+                return
+
+            if kind == 'image':
+                body = render_image(parsed.path, config.image_size)
+                self._send(kind, 200, body, 'image/png')
+                return
+
+            params = parse_qs(parsed.query)
+            engine = 'yandex' if parsed.path.startswith('/yandex') else 'google'
+            query = (params.get('text') or params.get('q') or [''])[0]
+            query_id = hashlib.sha1(f"{engine}{query}".encode('utf-8')).hexdigest()[:12]
+            urls = [f"http://{CDN_HOST}:{port_holder['port']}/img/{engine}/{query_id}/{i}.png"
+                    for i in range(config.results_per_page)]
+            if engine == 'yandex':
+                items = ','.join(json.dumps({'orig_url': url}, separators=(',', ':')) for url in urls)
+                html = f'<html><body><div data-state=\'{{"items":[{items}]}}\'></div></body></html>'
+            else:
+                html = '<html><body>' + ''.join(f'<img src="{url}" />' for url in urls) + '</body></html>'
+            self._send(kind, 200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    return StubHandler
+
+
+def start_stub_server(config: argparse.Namespace, stats: StubStats) -> ThreadingHTTPServer:
+    """Starts the stub server on a free local port in a background thread."""
+    port_holder: Dict[str, int] = {}
+    server = ThreadingHTTPServer((SEARCH_HOST, 0), make_handler(config, stats, port_holder))
+    server.daemon_threads = True
+    port_holder['port'] = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Тестовый сервер запущен на порту {port_holder['port']}")
+    return server
+
+
+def write_risks_csv(csv_dir: Path, risks: int) -> Path:
+    """Writes a CSV file with the given number of synthetic risks."""
+    csv_path = csv_dir / "diseases_пшеница_cereals.csv"
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'english_name'])
+        for i in range(risks):
+            writer.writerow([f'Болезнь {i}', f'disease {i}'])
+    return csv_path
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_benchmark(config: argparse.Namespace) -> List[Dict]:
+    """
+    Runs the crawler against the stub server and collects metrics.
+
+    Every run downloads into a fresh image directory, while the search cache is
+    shared between runs, so later runs show the effect of caching.
+
+    Args:
+        config: Parsed command line arguments
+
+    Returns:
+        List with one metrics dictionary per run
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix='crawler_benchmark_'))
+    # Хранилища читают настройки при первом использовании, поэтому задаем их до импорта краулера
+    os.environ['IMAGE_STORE_DIR'] = str(work_dir / 'store')
+    os.environ['SEARCH_CACHE_DIR'] = str(work_dir / 'search_cache')
+    os.environ['DOMAIN_STATS_DB'] = str(work_dir / 'domain_stats.db')
+    os.environ['IMAGE_MIN_WIDTH'] = os.environ['IMAGE_MIN_HEIGHT'] = str(min(200, config.image_size))
+
+    import ImageCrawler
+    import yandex_crawler
+    from rate_limiter import get_rate_limiter
+    from crawl_state import CrawlState
+
+    logging.getLogger("image_crawler").setLevel(logging.INFO if config.verbose else logging.WARNING)
+
+    stats = StubStats()
+    server = start_stub_server(config, stats)
+    port = server.server_address[1]
+    ImageCrawler.GOOGLE_SEARCH_URL = f"http://{SEARCH_HOST}:{port}/search?q={{query}}"
+    yandex_crawler.YANDEX_SEARCH_URL = f"http://{SEARCH_HOST}:{port}/yandex?text={{query}}"
+
+    limiter = get_rate_limiter()
+    limiter.configure_host(SEARCH_HOST, rate=config.search_rate, burst=1)
+    limiter.configure_host(CDN_HOST, rate=config.cdn_rate, burst=config.cdn_burst)
+
+    # Замер времени каждой загрузки изображения
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+    download_image = ImageCrawler.download_image
+
+    def timed_download(url, save_path):
+        started = time.perf_counter()
+        try:
+            return download_image(url, save_path)
+        finally:
+            with latencies_lock:
+                latencies.append(time.perf_counter() - started)
+
+    ImageCrawler.download_image = timed_download
+    csv_path = write_risks_csv(work_dir, config.risks)
+
+    results = []
+    try:
+        for run in range(1, config.runs + 1):
+            # Индекс почти дубликатов хранится рядом с папкой изображений, поэтому у каждого запуска своя папка
+            ImageCrawler.DOWNLOAD_DIR = work_dir / f'run_{run}' / 'images'
+            state = CrawlState(work_dir / f'state_{run}.db') if config.state else None
+            latencies.clear()
+            before = stats.snapshot()
+
+            started = time.perf_counter()
+            ImageCrawler.process_csv_file(csv_path, search_engine=config.engine, max_images=config.max_images,
+                                          delay=0, max_concurrent=config.concurrency, workers=config.workers,
+                                          state=state)
+            elapsed = time.perf_counter() - started
+
+            after = stats.snapshot()
+            if state is not None:
+                state.close()
+            images = sum(1 for path in ImageCrawler.DOWNLOAD_DIR.rglob('*') if path.is_file())
+            results.append({
+                'run': run,
+                'seconds': round(elapsed, 3),
+                'images': images,
+                'images_per_second': round(images / elapsed, 2) if elapsed else 0.0,
+                'download_p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+                'download_p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+                'bytes_transferred': after['bytes_sent'] - before['bytes_sent'],
+                'search_requests': after['requests'].get('search', 0) - before['requests'].get('search', 0),
+                'image_requests': after['requests'].get('image', 0) - before['requests'].get('image', 0),
+                # Повторные запросы одного и того же пути за запуск - это повторы клиента
+                'retries': sum(max(0, count - before['paths'].get(path, 0) - 1)
+                               for path, count in after['paths'].items()),
+                'status_429': after['statuses'].get(429, 0) - before['statuses'].get(429, 0),
+                'status_5xx': after['statuses'].get(503, 0) - before['statuses'].get(503, 0),
+            })
+    finally:
+        ImageCrawler.download_image = download_image
+        server.shutdown()
+        if not config.keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    """Parses arguments, runs the benchmark and prints the report."""
+    parser = argparse.ArgumentParser(description='Offline throughput benchmark of ImageCrawler against a stub server.')
+    parser.add_argument('--risks', type=int, default=20, help='Number of risks in the generated CSV (default: 20)')
+    parser.add_argument('--max-images', type=int, default=10, help='Images per risk (default: 10)')
+    parser.add_argument('--engine', choices=['google', 'yandex', 'both'], default='google',
+                        help='Search engine to imitate (default: google)')
+    parser.add_argument('--workers', type=int, default=4, help='Risks processed simultaneously (default: 4)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Simultaneous downloads per risk (default: 8)')
+    parser.add_argument('--runs', type=int, default=2,
+                        help='Number of runs sharing one search cache (default: 2)')
+    parser.add_argument('--search-latency-ms', type=float, default=300, help='Search page latency (default: 300)')
+    parser.add_argument('--image-latency-ms', type=float, default=100, help='Image latency (default: 100)')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='Share of 503 responses (default: 0.02)')
+    parser.add_argument('--throttle-rate', type=float, default=0.01, help='Share of 429 responses (default: 0.01)')
+    parser.add_argument('--results-per-page', type=int, default=20, help='Image URLs per result page (default: 20)')
+    parser.add_argument('--image-size', type=int, default=256, help='Side of served images in pixels (default: 256)')
+    parser.add_argument('--search-rate', type=float, default=5.0,
+                        help='Allowed search requests per second (default: 5)')
+    parser.add_argument('--cdn-rate', type=float, default=200.0, help='Allowed image requests per second (default: 200)')
+    parser.add_argument('--cdn-burst', type=int, default=32, help='Image request burst (default: 32)')
+    parser.add_argument('--state', action='store_true', help='Record crawl state (SQLite) during the runs')
+    parser.add_argument('--keep-files', action='store_true', help='Keep the temporary download directory')
+    parser.add_argument('--output', type=str, default=None, help='Save the results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show crawler log messages')
+    config = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    results = run_benchmark(config)
+
+    columns = ['run', 'seconds', 'images', 'images_per_second', 'download_p50_ms', 'download_p95_ms',
+               'bytes_transferred', 'search_requests', 'image_requests', 'retries', 'status_429', 'status_5xx']
+    print(' | '.join(columns))
+    for result in results:
+        print(' | '.join(str(result[column]) for column in columns))
+
+    if config.output:
+        with open(config.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(config), 'results': results}, f, ensure_ascii=False, indent=2)
+        logger.info(f"Результаты сохранены в {config.output}")
+
+
+if __name__ == "__main__":
+    main()
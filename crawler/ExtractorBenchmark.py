@@ -0,0 +1,199 @@
+"""
+Micro-benchmark of image URL extraction from saved search result pages.
+Reads the pages stored by the search cache (or given .html / .html.gz files),
+runs the previous findall-and-filter extraction and search_extractors on each
+of them, and reports the time per page and the number of URLs found. If no
+saved pages are found, synthetic result pages are generated.
+
+Usage:
+    python ExtractorBenchmark.py                          # pages from SEARCH_CACHE_DIR
+    python ExtractorBenchmark.py cache/search/google -n 20
+    python ExtractorBenchmark.py --synthetic 50
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import random
+import logging
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from search_cache import DEFAULT_CACHE_DIR
+from search_extractors import EXTRACTORS
+
+logger = logging.getLogger("extractor_benchmark")
+
+ENGINES = tuple(EXTRACTORS)
+
+
+def legacy_google(html: str) -> List[str]:
+    """Extraction as done before search_extractors (reference for the comparison)."""
+    found_urls = re.findall(r'https?://[^"\']+\.(?:jpg|jpeg|png|webp)', html)
+    return [url for url in found_urls if any(ext in url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp'])]
+
+
+def legacy_yandex(html: str) -> List[str]:
+    """Extraction as done before search_extractors (reference for the comparison)."""
+    urls = []
+    for url in re.findall(r'"orig_url":"(https?://[^"]+\.(?:jpg|jpeg|png|webp))"', html):
+        url = url.replace("\\", "")
+        if any(ext in url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
+            urls.append(url)
+    return urls
+
+
+LEGACY = {'google': legacy_google, 'yandex': legacy_yandex}
+
+
+def engine_of(path: Path, default: Optional[str]) -> Optional[str]:
+    """Guesses the engine of a saved page from its path (search cache layout <engine>/<xx>/<key>.html.gz)."""
+    for part in reversed(path.parts):
+        if part in ENGINES:
+            return part
+    return default
+
+
+def read_page(path: Path) -> str:
+    if path.suffix == '.gz':
+        with gzip.open(path, 'rt', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    return path.read_text(encoding='utf-8', errors='replace')
+
+
+def load_pages(paths: List[Path], default_engine: Optional[str]) -> List[Tuple[str, str, str]]:
+    """
+    Loads saved result pages.
+
+    Args:
+        paths: Files or directories (searched recursively for *.html and *.html.gz)
+        default_engine: Engine of pages whose path does not name one
+
+    Returns:
+        (engine, file name, html) for every page with a known engine
+    """
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.name.endswith(('.html', '.html.gz'))))
+        elif path.is_file():
+            files.append(path)
+    pages = []
+    for file in files:
+        engine = engine_of(file, default_engine)
+        if engine is None:
+            logger.warning(f"Не удалось определить поисковую систему страницы {file}, используйте --engine")
+            continue
+        pages.append((engine, file.name, read_page(file)))
+    return pages
+
+
+def synthetic_pages(count: int, urls_per_page: int = 100, seed: int = 1) -> List[Tuple[str, str, str]]:
+    """
+    Generates result pages shaped like real ones.
+
+    Google pages carry the URLs in markup and in escaped JSON among long scripts;
+    Yandex pages keep them in the data-state JSON of the result list.
+    """
+    rng = random.Random(seed)
+    filler = 'var _g=' + json.dumps({'k': ['x' * 40] * 200}) + ';'
+    pages = []
+    for i in range(count):
+        urls = [f'https://cdn{rng.randrange(20)}.example.com/img/{rng.getrandbits(48):x}.'
+                f'{rng.choice(("jpg", "jpeg", "png", "webp"))}' for _ in range(urls_per_page)]
+        thumbs = ''.join(f'<img src="https://encrypted-tbn0.gstatic.com/images?q=tbn:{rng.getrandbits(64):x}">'
+                         for _ in range(urls_per_page))
+        data = json.dumps([[url, 800, 600] for url in urls]).replace('/', '\\/')
+        google = f'<html><head><script>{filler * 20}</script></head><body>{thumbs}<script>AF_init({data});</script>' \
+                 + ''.join(f'<a href="/imgres?imgurl={url}">' for url in urls[::3]) + '</body></html>'
+        items = ','.join(json.dumps({'orig_url': url, 'w': 800, 'h': 600, 'snippet': 'x' * 200},
+                                    separators=(',', ':')) for url in urls)
+        yandex = f'<html><body><script>{filler * 20}</script><div data-state=\'{{"items":[{items}]}}\'></div></body></html>'
+        pages.append(('google', f'synthetic_{i}.html', google))
+        pages.append(('yandex', f'synthetic_{i}.html', yandex))
+    return pages
+
+
+def measure(extract: Callable[[str], List[str]], pages: List[str], repeat: int) -> Tuple[float, int]:
+    """Returns the best total time over repeat passes and the number of URLs found in one pass."""
+    best = float('inf')
+    found = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = sum(len(extract(html)) for html in pages)
+        best = min(best, time.perf_counter() - started)
+    return best, found
+
+
+def run_benchmark(pages: List[Tuple[str, str, str]], repeat: int, limit: int) -> List[Dict]:
+    """
+    Times the extractors on every engine's pages.
+
+    Returns:
+        One row per engine and method with ms per page, MB/s and URLs found
+    """
+    results = []
+    for engine in ENGINES:
+        htmls = [html for page_engine, _, html in pages if page_engine == engine]
+        if not htmls:
+            continue
+        size = sum(len(html) for html in htmls)
+        extract = EXTRACTORS[engine]
+        methods = [('legacy', LEGACY[engine]), ('compiled', lambda html: extract(html)),
+                   (f'compiled, limit {limit}', lambda html: extract(html, limit))]
+        baseline = None
+        for name, function in methods:
+            seconds, found = measure(function, htmls, repeat)
+            baseline = baseline or seconds
+            results.append({
+                'engine': engine,
+                'method': name,
+                'pages': len(htmls),
+                'ms_per_page': round(seconds / len(htmls) * 1000, 3),
+                'mb_per_second': round(size / seconds / 1e6, 1) if seconds else 0.0,
+                'urls': found,
+                'speedup': round(baseline / seconds, 2) if seconds else 0.0,
+            })
+    return results
+
+
+def main():
+    """Parses arguments, runs the benchmark and prints the report."""
+    parser = argparse.ArgumentParser(description='Micro-benchmark of image URL extraction from search result pages.')
+    parser.add_argument('paths', nargs='*', help='Saved pages or directories (default: the search cache directory)')
+    parser.add_argument('--engine', choices=ENGINES, default=None,
+                        help='Engine of pages whose path does not name one')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Generate this many synthetic pages per engine instead of reading saved ones')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Passes over the pages; the best is reported (default: 5)')
+    parser.add_argument('--limit', type=int, default=10, help='max_images for the early-stop run (default: 10)')
+    parser.add_argument('--output', type=str, default=None, help='Save the results as JSON to this file')
+    config = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if config.synthetic:
+        pages = synthetic_pages(config.synthetic)
+    else:
+        paths = [Path(p) for p in config.paths] or [Path(os.getenv('SEARCH_CACHE_DIR', DEFAULT_CACHE_DIR))]
+        pages = load_pages(paths, config.engine)
+        if not pages:
+            logger.warning(f"Сохраненные страницы не найдены в {', '.join(map(str, paths))}, генерируем 20 синтетических")
+            pages = synthetic_pages(20)
+    results = run_benchmark(pages, max(1, config.repeat), config.limit)
+
+    columns = ['engine', 'method', 'pages', 'ms_per_page', 'mb_per_second', 'urls', 'speedup']
+    print(' | '.join(columns))
+    for result in results:
+        print(' | '.join(str(result[column]) for column in columns))
+
+    if config.output:
+        with open(config.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(config), 'results': results}, f, ensure_ascii=False, indent=2)
+        logger.info(f"Результаты сохранены в {config.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,39 +7,50 @@ import os
 import csv
 import time
 import logging
-import urllib.request
+import threading
 import urllib.parse
 import concurrent.futures
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, NamedTuple, Optional, Tuple, Iterable, Callable
 import hashlib
 import re
 import random
 import uuid
-from bs4 import BeautifulSoup
-import requests
-import urllib.parse
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("crawler.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import itertools
+import functools
+import http_client
+from rate_limiter import get_rate_limiter
+from image_store import get_image_store
+from phash_index import dhash, get_phash_index
+from crawl_state import CrawlState, STATE_FILE_NAME
+from search_cache import get_search_cache
+from image_probe import ImageRejected, get_image_probe
+from search_extractors import extract_google_image_urls
+from search_fanout import stream_image_urls
+from domain_stats import domain_of, get_domain_stats
+from cli_setup import setup_logging
+
+# Логирование настраивается в main(), импорт модуля ничего не настраивает
 logger = logging.getLogger("image_crawler")
 
-# Настройка кодировки консоли для корректного отображения кириллицы
-import sys
-sys.stdout.reconfigure(encoding='utf-8')
-
 # Константы
 # Используем абсолютный путь относительно расположения скрипта
 BASE_DIR = Path(__file__).resolve().parent.parent
 CSV_DIR = BASE_DIR / "crawler" / "csv_output"
+# Состояние обхода для возобновления после прерывания
+STATE_DB = CSV_DIR.parent / STATE_FILE_NAME
 DOWNLOAD_DIR = BASE_DIR / "crawler" / "download" / "images"  # Исправлено согласно ТЗ
+# Максимальное число одновременных загрузок изображений для одного риска
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '8'))
+# Число рисков, обрабатываемых одновременно
+CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', '4'))
+# Файлы меньше этого размера не считаются изображениями
+MIN_IMAGE_BYTES = 1000
+# HTTP-статусы, при которых повторная загрузка URL бессмысленна
+PERMANENT_HTTP_STATUSES = {404, 410}
+# Хосты поисковых систем, для которых действует параметр --delay
+SEARCH_ENGINE_HOSTS = ["www.google.com", "yandex.ru"]
+GOOGLE_SEARCH_URL = "https://www.google.com/search?q={query}&tbm=isch&tbs=isz:l"
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
@@ -127,292 +138,7 @@ def extract_culture_risk_info(file_path: Path) -> Tuple[str, str, str]:
 # Functions for downloading images
 def create_search_query(risk_name: str, culture: str, risk_type: str, search_engine: str = "google") -> str:
     """Creates a search query for images.
-import os
-import requests
-import time
-import re
-import random
-import shutil
-from bs4 import BeautifulSoup
-from urllib.parse import quote, urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-class ImageCrawler:
-    def __init__(self, base_dir="D:/crawler/download/images", timeout=10, download_limit=30):
-        self.base_dir = base_dir
-        self.timeout = timeout
-        self.download_limit = download_limit
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        }
-        self.chrome_options = Options()
-        self.chrome_options.add_argument('--headless')
-        self.chrome_options.add_argument('--disable-gpu')
-        self.chrome_options.add_argument('--no-sandbox')
-        self.chrome_options.add_argument(f'user-agent={self.headers["User-Agent"]}')
-
-        # Поисковые движки для разных языков
-        self.search_engines = [
-            'https://www.google.com/search?q={}&tbm=isch',
-            'https://yandex.ru/images/search?text={}',
-            'https://www.bing.com/images/search?q={}',
-            'https://duckduckgo.com/?q={}&ia=images&iax=images'
-        ]
-
-        # Создаем директорию weeds, если она не существует
-        if not os.path.exists(os.path.join(self.base_dir, 'weeds')):
-            os.makedirs(os.path.join(self.base_dir, 'weeds'))
-            print(f"Создана папка {os.path.join(self.base_dir, 'weeds')}")
-
-    def get_translation_pairs(self, term):
-        """Создает пары запросов на русском и английском языках"""
-        translations = {
-            # Болезни сахарной свеклы
-            'бурая_гниль': ['brown rot sugar beet', 'бурая гниль сахарной свеклы', 'rhizoctonia root rot sugar beet'],
-
-            # Болезни гороха
-            'антракноз_гороха': ['pea anthracnose', 'антракноз гороха', 'colletotrichum pisi'],
-            'аскохитоз_гороха': ['ascochyta blight pea', 'аскохитоз гороха', 'mycosphaerella pinodes'],
-
-            # Вредители льна
-            'льняная_блошка': ['flax flea beetle', 'льняная блошка', 'longitarsus parvulus'],
-            'совка_гамма': ['silver y moth flax', 'совка-гамма на льне', 'autographa gamma'],
-
-            # Вредители зерновых
-            'хлебный_жук': ['cereal leaf beetle', 'хлебный жук', 'zabrus tenebrioides'],
-            'злаковая_муха': ['frit fly', 'шведская муха', 'oscinella frit'],
-
-            # Сорняки
-            'амброзия': ['common ragweed', 'амброзия полыннолистная', 'ambrosia artemisiifolia'],
-            'осот_полевой': ['field thistle', 'осот полевой', 'sonchus arvensis'],
-            'пырей_ползучий': ['couch grass', 'пырей ползучий', 'elymus repens'],
-            'вьюнок_полевой': ['field bindweed', 'вьюнок полевой', 'convolvulus arvensis'],
-            'щирица': ['redroot pigweed', 'щирица запрокинутая', 'amaranthus retroflexus']
-        }
 
-        # Если для данного термина нет перевода, используем сам термин
-        if term not in translations:
-            return [term, term]
-
-        return translations[term]
-
-    def create_search_query(self, term, category, crop=None):
-        """Создает поисковые запросы для разных категорий"""
-        query_templates = {
-            'diseases': [
-                '{} disease {}',
-                '{} symptoms {}',
-                '{} pathogen {}',
-                '{} infection {}'
-            ],
-            'pests': [
-                '{} pest {}',
-                '{} insect {}',
-                '{} damage {}',
-                '{} larvae {}'
-            ],
-            'weeds': [
-                '{} weed',
-                '{} weed identification',
-                '{} in field',
-                '{} invasive plant'
-            ]
-        }
-
-        # Получаем переводы для термина
-        term_translations = self.get_translation_pairs(term)
-
-        queries = []
-
-        for translation in term_translations:
-            if category == 'weeds':
-                for template in query_templates[category]:
-                    queries.append(template.format(translation))
-            else:
-                for template in query_templates[category]:
-                    if crop:
-                        queries.append(template.format(translation, crop))
-                    else:
-                        queries.append(template.format(translation, ''))
-
-        return queries
-
-    def fetch_image_urls(self, query, engine_index=0, max_links=100):
-        """Получает URLs изображений из поисковых систем"""
-        image_urls = set()
-        search_url = self.search_engines[engine_index].format(quote(query))
-
-        # Используем Selenium для получения динамического контента
-        try:
-            driver = webdriver.Chrome(options=self.chrome_options)
-            driver.get(search_url)
-
-            # Прокручиваем страницу для загрузки большего количества изображений
-            for _ in range(5):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-
-            # Ищем элементы изображений в зависимости от поисковой системы
-            if engine_index == 0:  # Google
-                images = driver.find_elements(By.CSS_SELECTOR, 'img.rg_i')
-                for img in images:
-                    try:
-                        img.click()
-                        time.sleep(1)
-                        actual_images = driver.find_elements(By.CSS_SELECTOR, '.n3VNCb')
-                        for actual_image in actual_images:
-                            if actual_image.get_attribute('src') and 'http' in actual_image.get_attribute('src'):
-                                image_urls.add(actual_image.get_attribute('src'))
-                    except:
-                        continue
-            elif engine_index == 1:  # Yandex
-                images = driver.find_elements(By.CSS_SELECTOR, '.serp-item__thumb')
-                for img in images:
-                    try:
-                        img.click()
-                        time.sleep(1)
-                        actual_image = WebDriverWait(driver, 5).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, '.MMImage-Origin'))
-                        )
-                        if actual_image.get_attribute('src'):
-                            image_urls.add(actual_image.get_attribute('src'))
-                    except:
-                        continue
-            else:  # Bing и DuckDuckGo
-                images = driver.find_elements(By.CSS_SELECTOR, 'img.mimg, img.tile--img')
-                for img in images:
-                    if img.get_attribute('src') and 'http' in img.get_attribute('src'):
-                        image_urls.add(img.get_attribute('src'))
-
-        except Exception as e:
-            print(f"Ошибка при получении URL изображений: {e}")
-        finally:
-            driver.quit()
-
-        return list(image_urls)[:max_links]
-
-    def download_image(self, url, save_path):
-        """Загружает изображение по URL и сохраняет его"""
-        try:
-            response = requests.get(url, headers=self.headers, stream=True, timeout=self.timeout)
-            if response.status_code == 200:
-                with open(save_path, 'wb') as f:
-                    response.raw.decode_content = True
-                    shutil.copyfileobj(response.raw, f)
-                return True
-            return False
-        except Exception as e:
-            print(f"Ошибка при загрузке изображения {url}: {e}")
-            return False
-
-    def process_category(self, category, subcategories):
-        """Обрабатывает категорию и загружает изображения для всех подкатегорий"""
-        category_dir = os.path.join(self.base_dir, category)
-        if not os.path.exists(category_dir):
-            os.makedirs(category_dir)
-
-        for crop, terms in subcategories.items():
-            crop_dir = os.path.join(category_dir, crop)
-            if not os.path.exists(crop_dir):
-                os.makedirs(crop_dir)
-
-            for term in terms:
-                term_dir = os.path.join(crop_dir, term)
-                # Удаляем папку 'заказать' если она существует
-                order_dir = os.path.join(crop_dir, 'заказать')
-                if os.path.exists(order_dir):
-                    shutil.rmtree(order_dir)
-                    print(f"Удалена папка {order_dir}")
-
-                if not os.path.exists(term_dir):
-                    os.makedirs(term_dir)
-
-                # Если папка пуста или содержит менее 5 изображений, заполняем ее
-                image_count = len([f for f in os.listdir(term_dir) if os.path.isfile(os.path.join(term_dir, f))])
-                if image_count < 5:
-                    print(f"Загрузка изображений для {term} ({crop}) в категории {category}...")
-                    self.download_images_for_term(term, category, crop, term_dir)
-                else:
-                    print(f"В папке {term_dir} уже есть {image_count} изображений. Пропускаем.")
-
-    def download_images_for_term(self, term, category, crop, save_dir):
-        """Загружает изображения для конкретного термина"""
-        # Создаем поисковые запросы для термина
-        queries = self.create_search_query(term, category, crop)
-
-        # Ограничиваем количество запросов для ускорения
-        if len(queries) > 3:
-            queries = queries[:3]
-
-        # Счетчик загруженных изображений
-        downloaded_count = 0
-
-        for query in queries:
-            # Используем разные поисковые системы для каждого запроса
-            for engine_index in range(len(self.search_engines)):
-                print(f"Поиск в {self.search_engines[engine_index].split('/')[2]} по запросу: {query}")
-
-                # Получаем URLs изображений
-                image_urls = self.fetch_image_urls(query, engine_index)
-
-                # Загружаем изображения
-                for i, url in enumerate(image_urls):
-                    if downloaded_count >= self.download_limit:
-                        print(f"Достигнут лимит загрузки ({self.download_limit}) для {term}")
-                        return
-
-                    # Формируем имя файла
-                    file_extension = os.path.splitext(urlparse(url).path)[1]
-                    if not file_extension or file_extension.lower() not in ['.jpg', '.jpeg', '.png', '.gif']:
-                        file_extension = '.jpg'
-
-                    filename = f"{term}_{engine_index}_{i}{file_extension}"
-                    save_path = os.path.join(save_dir, filename)
-
-                    # Загружаем изображение
-                    if self.download_image(url, save_path):
-                        downloaded_count += 1
-                        print(f"Загружено {downloaded_count}/{self.download_limit} изображений для {term}")
-
-                    # Пауза между запросами, чтобы не нагружать сервер
-                    time.sleep(random.uniform(0.5, 1.5))
-
-                # Если загрузили достаточно изображений с одного поисковика, переходим к следующему
-                if downloaded_count >= self.download_limit // len(self.search_engines):
-                    break
-
-    def run(self):
-        """Запускает процесс сканирования и загрузки изображений"""
-        # Определяем структуру категорий и подкатегорий
-        categories = {
-            'diseases': {
-                'sugar': ['бурая_гниль', 'церкоспороз', 'мучнистая_роса'],
-                'pea': ['антракноз_гороха', 'аскохитоз_гороха', 'ржавчина_гороха']
-            },
-            'pests': {
-                'flax': ['льняная_блошка', 'совка_гамма', 'льняной_трипс'],
-                'cereals': ['хлебный_жук', 'злаковая_муха', 'хлебная_жужелица']
-            },
-            'weeds': {
-                'common': ['амброзия', 'осот_полевой', 'пырей_ползучий', 'вьюнок_полевой', 'щирица']
-            }
-        }
-
-        # Обрабатываем каждую категорию
-        for category, subcategories in categories.items():
-            self.process_category(category, subcategories)
-
-        print("Процесс загрузки изображений завершен.")
-
-# Запуск краулера
-if __name__ == "__main__":
-    crawler = ImageCrawler()
-    crawler.run()
     Args:
         risk_name: Name of the risk (disease or pest)
         culture: Crop name
@@ -438,6 +164,10 @@ def get_google_image_urls(query: str, max_images: int = 500) -> List[str]:
     """
     Gets image URLs from Google Images for a given query.
 
+    Result pages are cached on disk, so a repeated query sends no request
+    until the cache entry expires. Only the first max_images URLs of a page are
+    extracted; a later query asking for more re-reads the cached page.
+
     Args:
         query: Search query
         max_images: Maximum number of images to download
@@ -445,8 +175,17 @@ def get_google_image_urls(query: str, max_images: int = 500) -> List[str]:
     Returns:
         List of image URLs
     """
-    query_encoded = urllib.parse.quote(query)
-    search_url = f"https://www.google.com/search?q={query_encoded}&tbm=isch&tbs=isz:l"
+    cache = get_search_cache()
+    cached_urls = cache.get('google', query)
+    if cached_urls is not None and len(cached_urls) < max_images:
+        html = cache.get_html('google', query)
+        if html is not None:
+            cached_urls = extract_google_image_urls(html, max_images)
+    if cached_urls is not None:
+        logger.info(f"Результаты Google для '{query}' взяты из кеша ({len(cached_urls)} URL)")
+        return cached_urls[:max_images]
+
+    search_url = GOOGLE_SEARCH_URL.format(query=urllib.parse.quote(query))
     
     headers = {
         "User-Agent": random.choice(USER_AGENTS),
@@ -463,93 +202,266 @@ def get_google_image_urls(query: str, max_images: int = 500) -> List[str]:
     }
     
     try:
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = http_client.get(search_url, headers=headers, timeout=10)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
         # Извлечение URL изображений из HTML
-        image_urls = []
-        
-        # Регулярное выражение для поиска URL изображений
-        pattern = r'https://[^"\']+\.(?:jpg|jpeg|png|webp)'
-        found_urls = re.findall(pattern, response.text)
+        image_urls = extract_google_image_urls(response.text, max_images)
         
-        # Фильтрация URL, чтобы получить только изображения
-        for url in found_urls:
-            if any(ext in url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
-                image_urls.append(url)
-                if len(image_urls) >= max_images:
-                    break
+        # Пустую выдачу не кешируем: обычно это блокировка или капча
+        if image_urls:
+            cache.put('google', query, response.text, image_urls)
         
-        return image_urls
+        return image_urls[:max_images]
     except Exception as e:
         logger.error(f"Ошибка при получении изображений из Google: {e}")
         return []
 
-def download_image(url: str, save_path: Path) -> bool:
+class DownloadResult(NamedTuple):
+    """Outcome of one image download; true if the image was saved."""
+    path: Optional[Path]
+    reason: Optional[str] = None
+    # Отказ повторится при любой следующей попытке (404, не изображение, размеры)
+    permanent: bool = False
+
+    def __bool__(self) -> bool:
+        return self.path is not None
+
+def download_image(url: str, save_path: Path) -> DownloadResult:
     """
     Downloads an image by URL and saves it to the specified path.
 
+    The body is streamed: the format is taken from the magic bytes and the
+    dimensions from the image header, so non-images, undersized and oversized
+    files are rejected after the first chunk. The image is written once into the
+    content-addressed store and linked to save_path; exact duplicates are dropped
+    while streaming, and near-duplicates of an image already in the same folder
+    are rejected by the perceptual-hash index. Outcomes that depend on the source
+    (transport errors, HTTP status, non-images, size and dimension checks) are
+    recorded in the domain scoreboard with their duration, the bytes received and
+    the failure reason; duplicates and local write errors are not.
+
     Args:
         url: Image URL
-        save_path: Path to save the image
+        save_path: Path to save the image; its suffix is replaced by the detected format
 
     Returns:
-        True if download is successful, otherwise False
+        The saved path, or the failure reason and whether the failure is permanent
     """
+    import requests
+
+    started = time.monotonic()
+    probe = None
+
+    def finish(reason: Optional[str] = None, record: bool = True, permanent: bool = False) -> DownloadResult:
+        if record:
+            get_domain_stats().record(url, reason is None, time.monotonic() - started,
+                                      probe.bytes_read if probe is not None else 0, reason)
+        return DownloadResult(save_path if reason is None else None, reason, permanent)
+
     try:
         headers = {"User-Agent": random.choice(USER_AGENTS)}
-        request = urllib.request.Request(url, headers=headers)
-        try:
-            with urllib.request.urlopen(request, timeout=10) as response:
-                if response.status == 200:
-                    content_type = response.headers.get('Content-Type', '')
-                    if not content_type.startswith('image/'):
-                        logger.warning(f"Пропуск URL {url}: не изображение (Content-Type: {content_type})")
-                        return False
-
-                    # Determine the file extension based on content type
-                    extension = 'jpg'  # Default extension
-                    if 'image/jpeg' in content_type.lower():
-                        extension = 'jpg'
-                    elif 'image/png' in content_type.lower():
-                        extension = 'png'
-                    elif 'image/webp' in content_type.lower():
-                        extension = 'webp'
-                    elif 'image/gif' in content_type.lower():
-                        extension = 'gif'
-
-                    # Update file path if needed
-                    if not str(save_path).lower().endswith(f'.{extension}'):
-                        save_path = Path(str(save_path).rsplit('.', 1)[0] + f'.{extension}')
-
-                    try:
-                        with open(save_path, 'wb') as out_file:
-                            image_data = response.read()
-                            if len(image_data) < 1000:  # Проверка минимального размера файла
-                                logger.warning(f"Пропуск URL {url}: подозрительно маленький размер ({len(image_data)} байт)")
-                                return False
-                            out_file.write(image_data)
-                        logger.info(f"Загружено изображение: {url} -> {save_path}")
-                        return True
-                    except (IOError, OSError) as e:
-                        logger.error(f"Ошибка записи файла {save_path}: {e}")
-                        return False
-                else:
-                    logger.warning(f"Ошибка HTTP-статуса при загрузке {url}: {response.status}")
+        with http_client.get(url, headers=headers, timeout=10, stream=True) as response:
+            if response.status_code != 200:
+                logger.warning(f"Ошибка HTTP-статуса при загрузке {url}: {response.status_code}")
+                return finish(f"HTTP {response.status_code}",
+                              permanent=response.status_code in PERMANENT_HTTP_STATUSES)
+
+            # Content-Type не всегда верен (CDN отдают application/octet-stream),
+            # поэтому сразу отбрасываем только явно текстовые ответы, остальное решают сигнатуры
+            content_type = response.headers.get('Content-Type', '')
+            if content_type.startswith('text/'):
+                logger.warning(f"Пропуск URL {url}: не изображение (Content-Type: {content_type})")
+                return finish(f"не изображение ({content_type})", permanent=True)
+
+            probe = get_image_probe()
+            chunks = response.iter_content(chunk_size=65536)
+            try:
+                probe.check_content_length(response.headers.get('Content-Length'))
+                head = probe.read_head(chunks)
+            except ImageRejected as e:
+                logger.warning(f"Пропуск URL {url}: {e} (прочитано {probe.bytes_read} байт)")
+                return finish(str(e), permanent=True)
+
+            # Determine the file extension based on the detected format
+            save_path = save_path.with_suffix(probe.extension)
+
+            index = get_phash_index(DOWNLOAD_DIR)
+            hashes = []
+            # (причина, зависит ли отказ от источника); такие отказы учитываются
+            # в статистике домена и повторятся при следующей попытке
+            rejection = []
+
+            def is_unique(tmp_path: Path) -> bool:
+                try:
+                    value = dhash(tmp_path)
+                except Exception as e:
+                    logger.warning(f"Пропуск URL {url}: не удалось декодировать изображение ({e})")
+                    rejection.append(("не удалось декодировать изображение", True))
                     return False
-        except urllib.error.HTTPError as e:
-            logger.error(f"HTTP ошибка при загрузке {url}: {e.code} {e.reason}")
-            return False
-        except urllib.error.URLError as e:
-            logger.error(f"URL ошибка при загрузке {url}: {e.reason}")
-            return False
+                duplicate = index.add_if_unique(save_path, value)
+                if duplicate:
+                    logger.info(f"Пропуск URL {url}: почти дубликат {duplicate}")
+                    rejection.append(("почти дубликат", False))
+                    return False
+                hashes.append(value)
+                return True
+
+            try:
+                # Проверка минимального размера файла выполняется хранилищем
+                stored = get_image_store().add_stream(probe.stream(head, chunks), save_path,
+                                                      min_size=MIN_IMAGE_BYTES, accept=is_unique)
+            except ImageRejected as e:
+                logger.warning(f"Пропуск URL {url}: {e}")
+                rejection.append((str(e), True))
+                stored = None
+            except requests.RequestException:
+                # Обрыв соединения во время чтения тела - сетевая ошибка, а не ошибка записи
+                raise
+            except (IOError, OSError) as e:
+                logger.error(f"Ошибка записи файла {save_path}: {e}")
+                rejection.append(("ошибка записи файла", False))
+                stored = None
+
+        if stored is None:
+            if hashes:
+                index.remove(save_path)
+            if not rejection:
+                # Хранилище отбрасывает слишком маленькие файлы и дубликаты
+                if probe.bytes_read < MIN_IMAGE_BYTES:
+                    rejection.append(("слишком маленький файл", True))
+                else:
+                    rejection.append(("дубликат", False))
+            reason, by_source = rejection[0]
+            logger.info(f"Изображение {url} не сохранено ({reason})")
+            return finish(reason, record=by_source, permanent=by_source)
+        index.add(save_path, hashes[0])
+        logger.info(f"Загружено изображение: {url} -> {save_path}")
+        return finish()
+    except requests.RequestException as e:
+        logger.error(f"Сетевая ошибка при загрузке {url}: {e}")
+        return finish(f"сетевая ошибка: {type(e).__name__}")
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при загрузке {url}: {e}")
-        return False
+        return finish(f"ошибка: {type(e).__name__}")
+
+async def download_images_async(jobs: Iterable[Tuple[str, Path]], limit: int,
+                                max_concurrent: int = MAX_CONCURRENT_DOWNLOADS,
+                                on_result: Optional[Callable[[str, DownloadResult], None]] = None) -> int:
+    """
+    Downloads images concurrently with a bounded number of simultaneous fetches.
+
+    Jobs are consumed lazily, one at a time, and may come from a blocking
+    iterator such as a search stream. No new fetch is started once the number of
+    successful plus in-flight downloads reaches the limit, so the limit is never exceeded.
+
+    Args:
+        jobs: Iterable of (url, save_path) pairs
+        limit: Maximum number of images to download
+        max_concurrent: Maximum number of simultaneous fetches
+        on_result: Optional callback receiving (url, result) for every finished fetch
 
-def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: str, search_engine: str = 'google', max_images: int = 500) -> None:
+    Returns:
+        Number of successfully downloaded images
+    """
+    import asyncio
+
+    jobs_iter = iter(jobs)
+    state = {'downloaded': 0, 'in_flight': 0}
+    condition = asyncio.Condition()
+    # Задания берутся по одному, но ожидание источника не должно держать condition
+    next_lock = asyncio.Lock()
+
+    def has_free_slot() -> bool:
+        return state['downloaded'] >= limit or state['downloaded'] + state['in_flight'] < limit
+
+    async def release_slot(success: bool) -> None:
+        async with condition:
+            state['in_flight'] -= 1
+            if success:
+                state['downloaded'] += 1
+            condition.notify_all()
+
+    async def worker() -> None:
+        while True:
+            async with condition:
+                await condition.wait_for(has_free_slot)
+                if state['downloaded'] >= limit:
+                    return
+                # Слот занимается до получения задания, поэтому лимит не превышается
+                state['in_flight'] += 1
+
+            async with next_lock:
+                # Источник заданий может ждать ответа поисковой системы, поэтому не блокируем цикл событий
+                job = await asyncio.to_thread(next, jobs_iter, None)
+            if job is None:
+                await release_slot(False)
+                return
+
+            url, save_path = job
+            try:
+                # download_image блокирующая, поэтому выполняется в пуле потоков
+                result = await asyncio.to_thread(download_image, url, save_path)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке {url}: {e}")
+                result = DownloadResult(None, f"ошибка: {type(e).__name__}")
+
+            if on_result is not None:
+                on_result(url, result)
+
+            await release_slot(bool(result))
+
+    if limit <= 0:
+        return 0
+
+    await asyncio.gather(*(worker() for _ in range(max(1, max_concurrent))))
+    return state['downloaded']
+
+# Блокировки папок рисков: один и тот же риск может встретиться в нескольких CSV
+_risk_dir_locks: Dict[str, threading.Lock] = {}
+_risk_dir_locks_guard = threading.Lock()
+
+def get_risk_dir_lock(risk_dir: Path) -> threading.Lock:
+    """Returns the lock serializing downloads into one risk folder."""
+    with _risk_dir_locks_guard:
+        return _risk_dir_locks.setdefault(str(risk_dir), threading.Lock())
+
+def search_images(engine: str, query: str, max_images: int, state: Optional[CrawlState] = None) -> List[str]:
+    """
+    Gets image URLs from one search engine, reusing the result of an already resolved query.
+
+    Args:
+        engine: Search engine ('google' or 'yandex')
+        query: Search query
+        max_images: Maximum number of image URLs
+        state: Crawl state used to skip queries resolved in previous runs
+
+    Returns:
+        List of image URLs
+    """
+    if state is not None:
+        urls = state.get_query_urls(engine, query, max_images)
+        if urls is not None:
+            logger.info(f"Запрос '{query}' ({engine}) уже выполнен ранее, найдено {len(urls)} URL")
+            return urls[:max_images]
+
+    if engine == 'yandex':
+        try:
+            import yandex_crawler
+            urls = yandex_crawler.get_yandex_image_urls(query, max_images=max_images)
+        except ImportError:
+            logger.error("Модуль yandex_crawler не найден, используем Google")
+            return search_images('google', query, max_images, state)
+    else:
+        urls = get_google_image_urls(query, max_images=max_images)
+
+    if state is not None:
+        state.save_query(engine, query, urls, max_images)
+    return urls
+
+def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: str, search_engine: str = 'google',
+                      max_images: int = 500, max_concurrent: int = MAX_CONCURRENT_DOWNLOADS,
+                      state: Optional[CrawlState] = None) -> None:
     """
     Processes one risk item (disease or pest).
 
@@ -560,7 +472,13 @@ def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: s
         risk_type: Risk type (diseases or pests)
         search_engine: Search engine to use ('google', 'yandex', or 'both')
         max_images: Maximum number of images to download per risk
+        max_concurrent: Maximum number of simultaneous image downloads
+        state: Crawl state for resuming an interrupted crawl
     """
+    import asyncio
+
+    risk_lock = None
+    ranked_urls = None
     try:
         # Get risk name (pest or disease name)
         risk_name_ru = item.get('name', '').strip()
@@ -589,11 +507,23 @@ def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: s
             logger.error(f"Не удалось создать директорию для {risk_name_ru}: {e}")
             return
 
+        # Один риск из разных CSV не обрабатывается параллельно, иначе имена файлов совпадут
+        risk_lock = get_risk_dir_lock(risk_dir)
+        risk_lock.acquire()
+
+        # Риск уже обработан в одном из прошлых запусков
+        risk_key = risk_dir.relative_to(DOWNLOAD_DIR).as_posix()
+        if state is not None and state.is_risk_finished(risk_key, max_images):
+            logger.info(f"Риск {risk_name_en} уже обработан ранее, пропускаем")
+            return
+
         # Check if we need to download images
         try:
             existing_images = list(risk_dir.glob('*'))
             if len(existing_images) >= max_images:
                 logger.info(f"Уже имеется {len(existing_images)} изображений для {risk_name_en}, пропускаем")
+                if state is not None:
+                    state.finish_risk(risk_key, max_images, len(existing_images))
                 return
         except Exception as e:
             logger.error(f"Ошибка при проверке существующих изображений для {risk_name_en}: {e}")
@@ -603,76 +533,56 @@ def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: s
         query = create_search_query(risk_name_ru, culture_ru, risk_type, search_engine)
         logger.info(f"Поиск изображений для: {query} с использованием {search_engine}")
 
-        # Get image URLs based on search engine
-        image_urls = []
-        if search_engine.lower() == 'google':
-            image_urls = get_google_image_urls(query, max_images=max_images)
-        elif search_engine.lower() == 'yandex':
-            try:
-                import yandex_crawler
-                image_urls = yandex_crawler.get_yandex_image_urls(query, max_images=max_images)
-            except ImportError:
-                logger.error("Модуль yandex_crawler не найден, используем Google")
-                image_urls = get_google_image_urls(query, max_images=max_images)
-        elif search_engine.lower() == 'both':
-            try:
-                import yandex_crawler
-                # Получаем изображения из обоих источников и объединяем результаты
-                yandex_urls = yandex_crawler.get_yandex_image_urls(query, max_images=max_images//2)
-                google_urls = get_google_image_urls(query, max_images=max_images//2)
-                # Объединяем результаты, чередуя источники для разнообразия
-                image_urls = []
-                for i in range(max(len(yandex_urls), len(google_urls))):
-                    if i < len(yandex_urls):
-                        image_urls.append(yandex_urls[i])
-                    if i < len(google_urls):
-                        image_urls.append(google_urls[i])
-                # Ограничиваем количество URL до максимального
-                image_urls = image_urls[:max_images]
-            except ImportError:
-                logger.error("Модуль yandex_crawler не найден, используем только Google")
-                image_urls = get_google_image_urls(query, max_images=max_images)
+        # Все выбранные поисковые системы опрашиваются одновременно, URL поступают по мере ответов
+        engine = search_engine.lower()
+        if engine == 'both':
+            engines = ['yandex', 'google']
         else:  # По умолчанию используем Google
-            image_urls = get_google_image_urls(query, max_images=max_images)
-
-        if not image_urls:
+            engine = 'yandex' if engine == 'yandex' else 'google'
+            engines = [engine]
+        # URL ранжируются по ожидаемому выходу их домена по статистике прошлых загрузок
+        domain_stats = get_domain_stats()
+        search = functools.partial(search_images, state=state)
+        ranked_urls = stream_image_urls(query, engines, max_images, search, domain_stats.expected_yield)
+        first_url = next(ranked_urls, None)
+
+        if first_url is None:
             logger.warning(f"Не удалось найти изображения для запроса: {query}")
             # Попробуем альтернативный запрос без указания типа риска
             alt_query = f"{risk_name_ru} {culture_ru} фото"
             logger.info(f"Пробуем альтернативный запрос: {alt_query}")
 
-            if search_engine.lower() == 'yandex':
-                try:
-                    import yandex_crawler
-                    image_urls = yandex_crawler.get_yandex_image_urls(alt_query, max_images=max_images)
-                except ImportError:
-                    image_urls = get_google_image_urls(alt_query, max_images=max_images)
-            else:
-                image_urls = get_google_image_urls(alt_query, max_images=max_images)
-
-            if not image_urls:
+            ranked_urls = stream_image_urls(alt_query, ['yandex' if engine == 'yandex' else 'google'], max_images,
+                                            search, domain_stats.expected_yield)
+            first_url = next(ranked_urls, None)
+
+            if first_url is None:
                 logger.error(f"Не удалось найти изображения даже с альтернативным запросом: {alt_query}")
                 return
 
-        # Download images
-        downloads_count = 0
-        for i, url in enumerate(image_urls):
-            if len(existing_images) + downloads_count >= max_images:
-                logger.info(f"Достигнут предел в {max_images} изображений для {risk_name_en}")
-                break
-
-            try:
-                # Create filename based on required pattern: risk_type_culture_guid_number.jpg
-                # Extract GUID from item or generate one based on risk name to ensure consistency
-                # Use the same GUID for all images of the same risk/disease
-                if 'guid' in item:
-                    guid = item['guid']
-                else:
-                    # Generate deterministic GUID based on risk name and culture to ensure all photos 
-                    # of the same disease have the same GUID
-                    guid_seed = f"{risk_type}_{culture_en}_{risk_name_en}".lower()
-                    guid = str(uuid.uuid5(uuid.NAMESPACE_DNS, guid_seed))
-
+        # Create filename based on required pattern: risk_type_culture_guid_number.jpg
+        # Extract GUID from item or generate one based on risk name to ensure consistency
+        # Use the same GUID for all images of the same risk/disease
+        if 'guid' in item:
+            guid = item['guid']
+        else:
+            # Generate deterministic GUID based on risk name and culture to ensure all photos
+            # of the same disease have the same GUID
+            guid_seed = f"{risk_type}_{culture_en}_{risk_name_en}".lower()
+            guid = str(uuid.uuid5(uuid.NAMESPACE_DNS, guid_seed))
+
+        def iter_download_jobs():
+            # Загрузка первых URL начинается, пока более медленные поисковые системы еще отвечают
+            for i, candidate in enumerate(itertools.chain([first_url], ranked_urls)):
+                url = candidate.url
+                # URL, уже скачанные или признанные негодными в прошлых запусках, не запрашиваем повторно
+                if state is not None and state.is_url_done(url):
+                    continue
+                # Домены, с которых загрузки постоянно не удаются, пропускаем без запроса
+                domain = domain_of(url)
+                if domain_stats.is_bad(domain):
+                    logger.debug(f"Пропуск URL {url}: домен {domain} в списке негодных")
+                    continue
                 # Format filename according to the required pattern
                 file_number = i + len(existing_images) + 1
                 file_ext = os.path.splitext(url)[1]
@@ -686,65 +596,131 @@ def process_risk_item(item: Dict, culture_ru: str, culture_en: str, risk_type: s
                     logger.debug(f"Файл {save_path} уже существует, пропускаем")
                     continue
 
-                # Download image
-                if download_image(url, save_path):
-                    downloads_count += 1
-
-                # Small delay to avoid blocking
-                time.sleep(random.uniform(1.0, 3.0))
-            except Exception as e:
-                logger.error(f"Ошибка при обработке URL {url} для {risk_name_ru}: {e}")
-                continue
+                yield url, save_path
+
+        def record_result(url: str, result: DownloadResult) -> None:
+            # Временные отказы (таймауты, 5xx, 429, дубликаты) не записываются,
+            # чтобы URL был запрошен снова в следующем запуске
+            if result or result.permanent:
+                state.record_url(url, result.path, bool(result))
+
+        # Download images concurrently
+        downloads_count = asyncio.run(download_images_async(
+            iter_download_jobs(),
+            limit=max_images - len(existing_images),
+            max_concurrent=max_concurrent,
+            on_result=record_result if state is not None else None
+        ))
+        get_phash_index(DOWNLOAD_DIR).save()
+        if state is not None:
+            state.finish_risk(risk_key, max_images, len(existing_images) + downloads_count)
+        if len(existing_images) + downloads_count >= max_images:
+            logger.info(f"Достигнут предел в {max_images} изображений для {risk_name_en}")
 
         logger.info(f"Загружено {downloads_count} новых изображений для {risk_name_ru}")
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при обработке риска: {e}")
         return
+    finally:
+        if ranked_urls is not None:
+            ranked_urls.close()
+        if risk_lock is not None:
+            risk_lock.release()
+
+def configure_search_engine_limits(delay: float) -> None:
+    """Limits every search engine host to one request per delay seconds."""
+    # Вежливость к поисковым системам обеспечивает общий ограничитель по хостам,
+    # остальные хосты (CDN изображений) не ждут друг друга
+    if delay > 0:
+        limiter = get_rate_limiter()
+        for host in SEARCH_ENGINE_HOSTS:
+            limiter.configure_host(host, rate=1.0 / delay, burst=1)
+
+def iter_risk_tasks(csv_files: Iterable[Path]) -> Iterable[Tuple[Dict, str, str, str]]:
+    """
+    Flattens CSV files into risk tasks.
+
+    Args:
+        csv_files: CSV files with risks
 
-def process_csv_file(file_path: Path, search_engine: str = 'google', max_images: int = 10, delay: float = 2.0) -> None:
+    Yields:
+        (item, culture_ru, culture_en, risk_type) for every row
     """
-    Processes one CSV file, extracting risk data and downloading images.
+    for file_path in csv_files:
+        # Extract information about crop and risk type from filename
+        culture_ru, culture_en, risk_type = extract_culture_risk_info(file_path)
+        logger.info(f"Извлечена информация о культуре: {culture_ru} ({culture_en}), тип риска: {risk_type}")
+
+        # Read data from CSV
+        data = read_csv_data(file_path)
+        logger.info(f"Найдено {len(data)} элементов в {file_path}")
+        for item in data:
+            yield item, culture_ru, culture_en, risk_type
+
+def run_crawl(csv_files: List[Path], search_engine: str = 'google', max_images: int = 10, delay: float = 2.0,
+              max_concurrent: int = MAX_CONCURRENT_DOWNLOADS, workers: int = CRAWL_WORKERS,
+              state: Optional[CrawlState] = None) -> int:
+    """
+    Processes the risks of all CSV files on a pool of workers.
+
+    All rows are put into one queue, and every free worker takes the next risk,
+    so a slow risk never holds up the rest of its CSV file. Per-host politeness is
+    kept by the shared rate limiter, and the crawl state is updated after every risk.
 
     Args:
-        file_path: Path to CSV file
+        csv_files: CSV files to process
         search_engine: Search engine to use ('google', 'yandex', or 'both')
         max_images: Maximum number of images to download per risk
-        delay: Delay between processing items in seconds
-    """
-    logger.info(f"Обработка файла: {file_path}")
+        delay: Minimum interval in seconds between requests to one search engine
+        max_concurrent: Maximum number of simultaneous image downloads per risk
+        workers: Number of risks processed simultaneously
+        state: Crawl state for resuming an interrupted crawl
 
-    # Extract information about crop and risk type from filename
-    culture_ru, culture_en, risk_type = extract_culture_risk_info(file_path)
-    logger.info(f"Извлечена информация о культуре: {culture_ru} ({culture_en}), тип риска: {risk_type}")
-
-    # Read data from CSV
-    data = read_csv_data(file_path)
-    logger.info(f"Найдено {len(data)} элементов в {file_path}")
+    Returns:
+        Number of processed risks
+    """
+    configure_search_engine_limits(delay)
+    tasks = list(iter_risk_tasks(csv_files))
+    logger.info(f"В очереди {len(tasks)} рисков из {len(csv_files)} CSV файлов, обработчиков: {workers}")
 
-    # Process each risk item
     successful_items = 0
-    for i, item in enumerate(data):
-        logger.info(f"Обработка элемента {i+1}/{len(data)}")
-        try:
-            # Передаем дополнительные параметры в process_risk_item
-            process_risk_item(
-                item, 
-                culture_ru, 
-                culture_en, 
-                risk_type, 
-                search_engine=search_engine,
-                max_images=max_images
-            )
-            successful_items += 1
-        except Exception as e:
-            logger.error(f"Ошибка при обработке элемента {item.get('name', 'неизвестно')}: {e}")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(process_risk_item, item, culture_ru, culture_en, risk_type,
+                            search_engine=search_engine, max_images=max_images,
+                            max_concurrent=max_concurrent, state=state): item
+            for item, culture_ru, culture_en, risk_type in tasks
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            item = futures[future]
+            try:
+                future.result()
+                successful_items += 1
+            except Exception as e:
+                logger.error(f"Ошибка при обработке элемента {item.get('name', 'неизвестно')}: {e}")
+            logger.info(f"Обработано рисков: {done}/{len(tasks)}")
 
-        # Small delay between processing items
-        delay_time = random.uniform(delay * 0.8, delay * 1.2)
-        logger.debug(f"Пауза между запросами: {delay_time:.2f} секунд")
-        time.sleep(delay_time)
+    logger.info(f"Успешно обработано {successful_items} из {len(tasks)} рисков")
+    return successful_items
+
+def process_csv_file(file_path: Path, search_engine: str = 'google', max_images: int = 10, delay: float = 2.0,
+                     max_concurrent: int = MAX_CONCURRENT_DOWNLOADS, state: Optional[CrawlState] = None,
+                     workers: int = 1) -> None:
+    """
+    Processes one CSV file, extracting risk data and downloading images.
 
-    logger.info(f"Успешно обработано {successful_items} из {len(data)} элементов в файле {file_path.name}")
+    Args:
+        file_path: Path to CSV file
+        search_engine: Search engine to use ('google', 'yandex', or 'both')
+        max_images: Maximum number of images to download per risk
+        delay: Minimum interval in seconds between requests to one search engine
+        max_concurrent: Maximum number of simultaneous image downloads per risk
+        state: Crawl state for resuming an interrupted crawl
+        workers: Number of risks processed simultaneously
+    """
+    logger.info(f"Обработка файла: {file_path}")
+    run_crawl([file_path], search_engine=search_engine, max_images=max_images, delay=delay,
+              max_concurrent=max_concurrent, workers=workers, state=state)
 
 def main():
     """Main function to start the crawler."""
@@ -759,10 +735,19 @@ def main():
     parser.add_argument('--csv-file', type=str, default=None,
                         help='Process specific CSV file instead of all files')
     parser.add_argument('--delay', type=float, default=2.0,
-                        help='Delay between requests in seconds (default: 2.0)')
+                        help='Minimum interval between requests to one search engine in seconds (default: 2.0)')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENT_DOWNLOADS,
+                        help=f'Maximum number of simultaneous image downloads per risk (default: {MAX_CONCURRENT_DOWNLOADS})')
+    parser.add_argument('--workers', type=int, default=CRAWL_WORKERS,
+                        help=f'Number of risks processed simultaneously across all CSV files (default: {CRAWL_WORKERS})')
+    parser.add_argument('--state-db', type=str, default=str(STATE_DB),
+                        help=f'SQLite file with the crawl state used to resume an interrupted crawl (default: {STATE_DB})')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Discard the saved crawl state and start from scratch')
 
     args = parser.parse_args()
 
+    setup_logging("crawler.log")
     logger.info("Starting image crawler")
     logger.info(f"Используемый поисковый движок: {args.engine}")
     logger.info(f"Максимум изображений на риск: {args.max_images}")
@@ -785,12 +770,26 @@ def main():
     # Create download directories if they don't exist
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+    # Учитываем в индексе почти дубликатов файлы, появившиеся с прошлого запуска
+    phash_index = get_phash_index(DOWNLOAD_DIR)
+    phash_index.update()
+    phash_index.save()
+
     # Check if CSV directory exists
     if not CSV_DIR.exists():
         CSV_DIR.mkdir(parents=True, exist_ok=True)
         logger.warning(f"Директория CSV файлов не существовала и была создана: {CSV_DIR}")
         logger.info(f"Поместите файлы CSV с рисками в директорию {CSV_DIR} перед запуском краулера")
 
+    # Открываем состояние обхода
+    state_db = Path(args.state_db)
+    if args.no_resume:
+        for suffix in ('', '-wal', '-shm'):
+            Path(f"{state_db}{suffix}").unlink(missing_ok=True)
+        logger.info("Сохраненное состояние обхода удалено, начинаем заново")
+    state = CrawlState(state_db)
+    logger.info(f"Состояние обхода: {state_db} {state.stats()}")
+
     # Get list of CSV files
     if args.csv_file:
         # Если указан конкретный файл, используем только его
@@ -812,13 +811,20 @@ def main():
         for file_path in csv_files:
             logger.info(f"  - {file_path.name}")
 
-        # Process each file sequentially
-        for file_path in csv_files:
-            logger.info(f"Начало обработки файла {file_path.name}")
-            process_csv_file(file_path, search_engine=args.engine, max_images=args.max_images, delay=args.delay)
+        # Все риски всех файлов обрабатываются из общей очереди
+        run_crawl(csv_files, search_engine=args.engine, max_images=args.max_images, delay=args.delay,
+                  max_concurrent=args.concurrency, workers=args.workers, state=state)
     else:
         logger.warning(f"CSV файлы не найдены в директории {CSV_DIR}. Загрузка изображений невозможна.")
 
+    logger.info(f"Итоговое состояние обхода: {state.stats()}")
+    state.close()
+
+    domain_stats = get_domain_stats()
+    for score in domain_stats.bad_domains()[:10]:
+        logger.info(f"Негодный домен {score.domain}: {score.successes}/{score.attempts} успешных загрузок, "
+                    f"последние причины: {'; '.join(domain_stats.recent_failures(score.domain)[:3])}")
+
     logger.info("Краулер завершил работу")
 
 if __name__ == "__main__":
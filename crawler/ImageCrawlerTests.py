@@ -4,21 +4,63 @@
 """
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, PropertyMock
 from pathlib import Path
 import tempfile
 import csv
 import os
+import asyncio
+import threading
+import time
+import io
+import sys
+import random
+import subprocess
+import json
+from PIL import Image
 
 # Импортируем модуль, который будем тестировать
-from image_crawler import (
+from ImageCrawler import (
     get_csv_files, 
     read_csv_data, 
     extract_culture_risk_info,
     create_search_query,
     get_google_image_urls,
-    download_image
+    DownloadResult,
+    download_image,
+    download_images_async,
+    process_risk_item,
+    run_crawl
 )
+from crawl_state import CrawlState
+from search_cache import SearchCache
+from search_extractors import extract_google_image_urls, extract_yandex_image_urls
+from search_fanout import stream_image_urls
+from domain_stats import DomainStats
+from image_store import ImageStore
+from phash_index import PHashIndex, dhash
+from image_probe import ImageProbe, ImageRejected, parse_dimensions, sniff_format
+from webdriver_pool import WebDriverPool
+from page_fetcher import FetchedPage, PageFetcher, METHOD_BROWSER, METHOD_HTTP
+from page_state import PageState, page_fingerprint, stable_id
+from streaming_csv import StreamingCsvWriter
+from crop_index import EntityCropIndex
+from betaren_parser import extract_agro_links, parse_detail_page
+from image_queue import ImageQueue
+from debug_archive import DebugArchive, is_sampled, latest_by_url, read_index, read_page
+from term_tagger import KIND_CROP, KIND_RISK, KIND_SECTION, TermTagger, build_default_tagger, load_risk_terms
+from translator import StubBackend, TranslationCache, Translator, get_translator
+from selenium.common.exceptions import WebDriverException
+
+
+def make_image_bytes(seed: int, size: int = 256, fmt: str = 'PNG') -> bytes:
+    """Создает изображение из случайных пикселей и возвращает его байты."""
+    rng = random.Random(seed)
+    image = Image.new('L', (8, 8))
+    image.putdata([rng.randrange(256) for _ in range(64)])
+    buffer = io.BytesIO()
+    image.resize((size, size), Image.BILINEAR).convert('RGB').save(buffer, format=fmt)
+    return buffer.getvalue()
 
 class TestImageCrawler(unittest.TestCase):
     
@@ -35,9 +77,19 @@ class TestImageCrawler(unittest.TestCase):
             writer.writerow(['name', 'description'])
             writer.writerow(['Ржавчина', 'Описание ржавчины'])
             writer.writerow(['Септориоз', 'Описание септориоза'])
+
+        # Статистика доменов пишется во временную базу, а не в кеш краулера
+        self.stats_dir = tempfile.TemporaryDirectory()
+        self.domain_stats_db = Path(self.stats_dir.name) / 'domain_stats.db'
+        self.domain_stats = DomainStats(self.domain_stats_db)
+        self.domain_stats_patch = patch('ImageCrawler.get_domain_stats', return_value=self.domain_stats)
+        self.domain_stats_patch.start()
     
     def tearDown(self):
         """Очищает тестовую среду."""
+        self.domain_stats_patch.stop()
+        self.domain_stats.close()
+        self.stats_dir.cleanup()
         self.temp_dir.cleanup()
     
     def test_read_csv_data(self):
@@ -75,10 +127,11 @@ class TestImageCrawler(unittest.TestCase):
         query = create_search_query('Тля', 'пшеница', 'pests')
         self.assertEqual(query, 'Тля вредитель пшеница фото')
     
-    @patch('requests.get')
-    def test_get_google_image_urls(self, mock_get):
+    @patch('ImageCrawler.get_search_cache')
+    @patch('http_client.get')
+    def test_get_google_image_urls(self, mock_get, mock_cache):
         """Тестирует получение URL изображений."""
-        # Создаем мок для ответа requests.get
+        # Создаем мок для ответа http_client.get
         mock_response = MagicMock()
         mock_response.text = """
         <html>
@@ -91,25 +144,39 @@ class TestImageCrawler(unittest.TestCase):
         """
         mock_response.raise_for_status.return_value = None
         mock_get.return_value = mock_response
+        mock_cache.return_value = SearchCache(self.temp_path / 'cache')
         
         urls = get_google_image_urls('тестовый запрос', max_images=3)
         
         # Проверяем, что функция вызвана с правильными параметрами
         mock_get.assert_called_once()
         
+        # Повторный запрос (в другом написании и с другим лимитом) берется из кеша
+        cached_urls = get_google_image_urls('  Тестовый   запрос ', max_images=1)
+        mock_get.assert_called_once()
+        self.assertEqual(cached_urls, urls[:1])
+        self.assertIn('image1.jpg', mock_cache.return_value.get_html('google', 'тестовый запрос'))
+        
         # В этом тесте мы не можем точно проверить результат,
         # так как извлечение URL зависит от структуры HTML,
         # которая может меняться
         self.assertIsInstance(urls, list)
     
-    @patch('urllib.request.urlopen')
-    @patch('urllib.request.Request')
-    def test_download_image(self, mock_request, mock_urlopen):
+    @patch('ImageCrawler.get_phash_index')
+    @patch('ImageCrawler.get_image_store')
+    @patch('http_client.get')
+    def test_download_image(self, mock_get, mock_store, mock_index):
         """Тестирует скачивание изображения."""
+        image_data = make_image_bytes(1, fmt='JPEG')
         # Создаем моки
         mock_response = MagicMock()
-        mock_response.read.return_value = b'fake image data'
-        mock_urlopen.return_value.__enter__.return_value = mock_response
+        mock_response.status_code = 200
+        mock_response.headers = {'Content-Type': 'image/jpeg'}
+        mock_response.iter_content.side_effect = lambda chunk_size: iter([image_data])
+        mock_get.return_value.__enter__.return_value = mock_response
+        store = ImageStore(self.temp_path / 'store')
+        mock_store.return_value = store
+        mock_index.return_value = PHashIndex(self.temp_path)
         
         # Тестируем функцию
         save_path = self.temp_path / 'test_image.jpg'
@@ -121,7 +188,747 @@ class TestImageCrawler(unittest.TestCase):
         
         # Проверяем содержимое файла
         with open(save_path, 'rb') as f:
-            self.assertEqual(f.read(), b'fake image data')
+            self.assertEqual(f.read(), image_data)
+
+        # Расширение определяется по сигнатуре файла, а не по Content-Type
+        image_data = make_image_bytes(3)
+        result = download_image('https://example.com/image3.jpg', self.temp_path / 'image3.jpg')
+        self.assertEqual(result.path, self.temp_path / 'image3.png')
+        self.assertTrue((self.temp_path / 'image3.png').exists())
+        store_stats = store.stats()
+
+        # Повторное скачивание того же изображения в ту же папку отбрасывается,
+        # в другую папку - создает ссылку на тот же блоб
+        image_data = make_image_bytes(1, fmt='JPEG')
+        self.assertFalse(download_image('https://example.com/copy.jpg', self.temp_path / 'copy.jpg'))
+        self.assertFalse((self.temp_path / 'copy.jpg').exists())
+        other_path = self.temp_path / 'other' / 'test_image.jpg'
+        self.assertTrue(download_image('https://example.com/image.jpg', other_path))
+        self.assertEqual(store.stats(), (store_stats[0], store_stats[1] + 1))
+
+        # Уменьшенная и пережатая копия в той же папке отбрасывается как почти дубликат
+        image_data = make_image_bytes(1, size=224, fmt='JPEG')
+        self.assertFalse(download_image('https://example.com/small.jpg', self.temp_path / 'small.jpg'))
+        self.assertFalse((self.temp_path / 'small.jpg').exists())
+
+        # Дубликаты не портят статистику домена, а слишком маленький файл учитывается
+        buffer = io.BytesIO()
+        Image.new('RGB', (256, 256)).save(buffer, format='PNG')
+        image_data = buffer.getvalue()
+        self.assertTrue(download_image('https://example.com/tiny.jpg', self.temp_path / 'tiny.jpg').permanent)
+        self.assertEqual(self.domain_stats.recent_failures('example.com'), ['слишком маленький файл'])
+        self.assertEqual(self.domain_stats.get('example.com').attempts, 4)
+
+    def test_resume_from_crawl_state(self):
+        """Тестирует возобновление: решенные запросы и известные URL не запрашиваются повторно."""
+        state = CrawlState(self.temp_path / 'state.db')
+        urls = [f'https://example.com/{i}.jpg' for i in range(5)]
+        downloaded = []
+
+        def fake_download(url, save_path):
+            downloaded.append(url)
+            # Предпоследний URL отдает 404, последний не ответил вовремя
+            if url.endswith('3.jpg'):
+                return DownloadResult(None, 'HTTP 404', permanent=True)
+            if url.endswith('4.jpg'):
+                return DownloadResult(None, 'сетевая ошибка: ReadTimeout')
+            return DownloadResult(save_path.with_suffix('.png'))
+
+        item = {'name': 'Ржавчина', 'english_name': 'rust'}
+        with patch('ImageCrawler.DOWNLOAD_DIR', self.temp_path / 'images'), \
+                patch('ImageCrawler.get_phash_index'), \
+                patch('ImageCrawler.get_google_image_urls', return_value=urls) as mock_search, \
+                patch('ImageCrawler.download_image', side_effect=fake_download), \
+                patch.object(state, 'record_url', wraps=state.record_url) as record_url:
+            # Первый запуск прерван после двух загрузок
+            state.save_query('google', create_search_query('Ржавчина', 'пшеница', 'diseases'), urls, 10)
+            state.record_url(urls[0], None, True)
+            state.record_url(urls[1], None, False)
+            process_risk_item(item, 'пшеница', 'cereals', 'diseases', max_images=10, state=state)
+            self.assertEqual(mock_search.call_count, 0)
+            self.assertEqual(sorted(downloaded), urls[2:])
+            # Записывается путь с расширением по фактическому формату
+            self.assertEqual(record_url.call_args_list[2].args[1].suffix, '.png')
+            # Временный отказ не записывается: URL будет запрошен снова
+            self.assertFalse(state.is_url_done(urls[4]))
+
+            # Риск завершен: повторный запуск ничего не делает
+            downloaded.clear()
+            process_risk_item(item, 'пшеница', 'cereals', 'diseases', max_images=10, state=state)
+            self.assertEqual(downloaded, [])
+        stats = state.stats()
+        self.assertEqual((stats['downloaded'], stats['failed'], stats['pending']), (2, 2, 1))
+        state.close()
+
+    def test_run_crawl_parallel(self):
+        """Тестирует обработку рисков из нескольких CSV общей очередью обработчиков."""
+        second_csv = self.temp_path / "pests_кукуруза_corn.csv"
+        with open(second_csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'description'])
+            for i in range(6):
+                writer.writerow([f'Вредитель {i}', ''])
+
+        lock = threading.Lock()
+        counters = {'active': 0, 'peak': 0}
+        processed = []
+
+        def fake_process(item, culture_ru, culture_en, risk_type, **kwargs):
+            with lock:
+                counters['active'] += 1
+                counters['peak'] = max(counters['peak'], counters['active'])
+            time.sleep(0.02)
+            with lock:
+                counters['active'] -= 1
+                processed.append((risk_type, culture_en, item['name']))
+
+        with patch('ImageCrawler.process_risk_item', side_effect=fake_process):
+            result = run_crawl([self.csv_path, second_csv], max_images=5, delay=0, workers=4)
+
+        self.assertEqual(result, 8)
+        self.assertEqual(len(set(processed)), 8)
+        self.assertGreater(counters['peak'], 1)
+        self.assertLessEqual(counters['peak'], 4)
+
+    def test_image_probe(self):
+        """Тестирует определение формата и размеров по заголовку без декодирования."""
+        image = Image.new('RGB', (320, 240), 'green')
+        for fmt, name in [('JPEG', 'jpeg'), ('PNG', 'png'), ('GIF', 'gif'), ('WEBP', 'webp')]:
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt, **({'lossless': True} if fmt == 'WEBP' else {}))
+            data = buffer.getvalue()
+            self.assertEqual(sniff_format(data), name)
+            self.assertEqual(tuple(parse_dimensions(data, name)), (320, 240), fmt)
+
+        # Маленькие изображения, не изображения и слишком большие файлы отклоняются по первым байтам
+        probe = ImageProbe(min_width=400, min_height=400)
+        with self.assertRaises(ImageRejected):
+            probe.read_head(iter([data]))
+        with self.assertRaises(ImageRejected):
+            ImageProbe().read_head(iter([b'<html>' + b' ' * 2000]))
+        probe = ImageProbe(min_width=100, min_height=100, max_bytes=len(data) + 10)
+        head = probe.read_head(iter([data[:64]]))
+        with self.assertRaises(ImageRejected):
+            list(probe.stream(head, iter([data[64:], b'x' * 100])))
+
+    def test_phash_index(self):
+        """Тестирует поиск почти дубликатов и постоянство индекса."""
+        images_dir = self.temp_path / 'images'
+        for name, seed, size in [('a/1.png', 1, 64), ('b/1.png', 1, 40), ('a/2.png', 2, 64)]:
+            path = images_dir / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(make_image_bytes(seed, size))
+
+        index = PHashIndex(images_dir)
+        self.assertEqual(index.update(), (3, 0))
+        matches = [key for _, key in index.find(dhash(images_dir / 'a/1.png'))]
+        self.assertIn('b/1.png', matches)
+        self.assertNotIn('a/2.png', matches)
+
+        clusters = index.clusters()
+        self.assertEqual(clusters['a/1.png'], clusters['b/1.png'])
+        self.assertNotEqual(clusters['a/1.png'], clusters['a/2.png'])
+
+        # Сохраненный индекс не пересчитывает неизмененные файлы
+        index.save()
+        (images_dir / 'a/2.png').unlink()
+        self.assertEqual(PHashIndex(images_dir).update(), (0, 1))
+
+    def test_download_images_async(self):
+        """Тестирует ограничение параллелизма и лимит параллельной загрузки."""
+        lock = threading.Lock()
+        counters = {'active': 0, 'peak': 0, 'calls': 0}
+
+        def fake_download(url, save_path):
+            with lock:
+                counters['active'] += 1
+                counters['calls'] += 1
+                counters['peak'] = max(counters['peak'], counters['active'])
+            time.sleep(0.02)
+            with lock:
+                counters['active'] -= 1
+            # Каждое третье изображение "не скачивается"
+            return DownloadResult(None if url.endswith('_2.jpg') else save_path)
+
+        jobs = [(f'https://example.com/{i}_{i % 3}.jpg', self.temp_path / f'{i}.jpg') for i in range(30)]
+        with patch('ImageCrawler.download_image', side_effect=fake_download):
+            downloaded = asyncio.run(download_images_async(jobs, limit=10, max_concurrent=4))
+
+        self.assertEqual(downloaded, 10)
+        self.assertLessEqual(counters['peak'], 4)
+        self.assertGreater(counters['peak'], 1)
+        # Новые загрузки не запускаются после достижения лимита
+        self.assertLess(counters['calls'], len(jobs))
+
+        # Заданий меньше, чем потоков: слоты освобождаются, когда источник исчерпан
+        with patch('ImageCrawler.download_image', side_effect=fake_download):
+            downloaded = asyncio.run(download_images_async(iter(jobs[:2]), limit=10, max_concurrent=4))
+        self.assertEqual(downloaded, 2)
+
+    def test_webdriver_pool(self):
+        """Тестирует повторное использование, перезапуск и замену сломанных браузеров в пуле."""
+        created = []
+
+        def factory():
+            driver = MagicMock()
+            created.append(driver)
+            return driver
+
+        pool = WebDriverPool(factory, size=2, max_pages=3)
+        for _ in range(3):
+            with pool.driver():
+                pass
+        # Один браузер на три страницы, после третьей он закрыт
+        self.assertEqual(len(created), 1)
+        created[0].quit.assert_called_once()
+
+        with self.assertRaises(WebDriverException):
+            with pool.driver():
+                raise WebDriverException("chrome not reachable")
+        created[1].quit.assert_called_once()
+
+        # Браузер, не прошедший проверку при выдаче, заменяется новым
+        with pool.driver():
+            pass
+        type(created[2]).current_url = PropertyMock(side_effect=WebDriverException("dead"))
+        with pool.driver() as driver:
+            self.assertIs(driver, created[3])
+        pool.close()
+        self.assertEqual(len(created), 4)
+        created[3].quit.assert_called_once()
+
+    @patch('page_fetcher.http_client.get')
+    def test_page_fetcher(self, mock_get):
+        """Тестирует загрузку по HTTP с переходом на браузер и запоминанием способа по шаблону URL."""
+        filler = '<p>' + 'текст ' * 200 + '</p>'
+        listing = f'<html><body><div class="agro-item"><a class="title" href="/x">x</a></div>{filler}</body></html>'
+        captcha = f'<html><body><div class="g-recaptcha" data-sitekey="k"></div>{filler}</body></html>'
+        pages = {
+            'https://betaren.ru/harmful/bolezni/': listing,
+            'https://betaren.ru/harmful/vrediteli/a/b': captcha,
+        }
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(status_code=200, text=pages[url])
+        browser = MagicMock(return_value=listing.replace('agro-item', 'harmful-detail'))
+        fetcher = PageFetcher(browser)
+
+        self.assertEqual(fetcher.fetch('https://betaren.ru/harmful/bolezni/'), listing)
+        browser.assert_not_called()
+        self.assertEqual(fetcher.method_for('https://betaren.ru/harmful/bolezni/'), METHOD_HTTP)
+
+        self.assertIn('harmful-detail', fetcher.fetch('https://betaren.ru/harmful/vrediteli/a/b'))
+        self.assertEqual(fetcher.method_for('https://betaren.ru/harmful/vrediteli/c/d'), METHOD_BROWSER)
+        # Для страниц того же шаблона HTTP-запрос больше не отправляется
+        mock_get.reset_mock()
+        fetcher.fetch('https://betaren.ru/harmful/vrediteli/c/d')
+        mock_get.assert_not_called()
+        self.assertEqual(browser.call_count, 2)
+
+    def test_betaren_pipeline_order(self):
+        """Тестирует порядок записей при параллельной обработке Betaren и продолжение после сбоя."""
+        import _betaren
+
+        cultures = [{'name': f'Культура {c}', 'url': f'https://betaren.ru/harmful/bolezni/c{c}/'} for c in range(3)]
+        fields = ['name_en', 'scientific_name', 'description_ru', 'description_ua', 'description_en',
+                  'symptoms_ru', 'symptoms_ua', 'symptoms_en', 'development_conditions_ru',
+                  'development_conditions_ua', 'development_conditions_en', 'control_measures_ru',
+                  'control_measures_ua', 'control_measures_en']
+        scraped = []
+
+        def fake_links(culture_url):
+            return [{'name': f'{culture_url} {i}', 'url': f'{culture_url}d{i}'} for i in range(4)]
+
+        def fake_scrape(page_url, category_type, download_images=True):
+            time.sleep(random.uniform(0, 0.01))
+            scraped.append(page_url)
+            if page_url == crash_url:
+                raise KeyboardInterrupt
+            item = {field: '' for field in fields}
+            item.update({'id': stable_id(page_url), 'name': page_url, 'source_urls': page_url, 'crops': ['пшеница'],
+                         'images': [], 'image_urls': [f'{page_url}/{i}.jpg' for i in range(3)],
+                         'is_active': True, 'version': 1})
+            return item
+
+        def fake_download(image_url, filepath, filename, referer):
+            time.sleep(random.uniform(0, 0.01))
+            return None if image_url.endswith('1.jpg') else {'image_url': image_url, 'image_path': filepath}
+
+        def read_csv(name):
+            with open(self.temp_path / name, encoding='utf-8', newline='') as f:
+                return list(csv.DictReader(f))
+
+        expected = [link['url'] for culture in cultures for link in fake_links(culture['url'])][:10]
+        with patch('_betaren.get_subcategory_links', return_value=cultures), \
+                patch('_betaren.get_detail_links_from_culture', side_effect=fake_links), \
+                patch('_betaren.scrape_detail_page', side_effect=fake_scrape), \
+                patch('_betaren.download_item_image', side_effect=fake_download), \
+                patch('_betaren.OUTPUT_DIR', str(self.temp_path)), \
+                patch('_betaren.CHECKPOINT_EVERY', 5), patch('_betaren.RESUME', True):
+            # Первый запуск прерывается на восьмой странице
+            crash_url = expected[7]
+            with self.assertRaises(KeyboardInterrupt):
+                _betaren.process_category_universal('diseases', max_items=10)
+            crash_url = None
+            scraped.clear()
+            self.assertEqual(_betaren.process_category_universal('diseases', max_items=10), 10)
+
+        # Элементы, записанные до прерывания, не обрабатываются повторно
+        self.assertEqual(sorted(scraped), expected[7:])
+        self.assertEqual([row['name'] for row in read_csv('diseases.csv')], expected)
+        images = read_csv('disease_images.csv')
+        self.assertEqual([row['image_url'] for row in images],
+                         [f'{url}/{i}.jpg' for url in expected for i in (0, 2)])
+        self.assertEqual(len({row['id'] for row in images}), len(images))
+
+    def test_betaren_incremental(self):
+        """Тестирует пропуск разбора неизменившихся страниц и стабильные идентификаторы."""
+        import _betaren
+
+        url = 'https://betaren.ru/harmful/bolezni/pshenitsa/septorioz'
+
+        def page(token, text='Септориоз пшеницы'):
+            return (f'<html><body><div class="harmful-detail"><h1>{text}</h1></div>'
+                    f'<input type="hidden" name="g-recaptcha-response" value="{token}">'
+                    f'<script>var t = "{token}";</script></body></html>')
+
+        self.assertEqual(page_fingerprint(page('a')), page_fingerprint(page('b')))
+        self.assertNotEqual(page_fingerprint(page('a')), page_fingerprint(page('a', 'Бурая ржавчина')))
+        self.assertEqual(stable_id(url), stable_id(url))
+
+        def build(page_source, page_url, category_type):
+            return {'id': stable_id(page_url), 'name': 'Септориоз', 'name_en': 'Septoria', 'images': [],
+                    'image_urls': []}
+
+        state = PageState(self.temp_path / 'pages.db')
+        fetcher = MagicMock()
+        responses = [FetchedPage(page('a'), etag='"v1"'), FetchedPage(page('b')),
+                     FetchedPage(None, not_modified=True, etag='"v1"'), FetchedPage(page('c', 'Бурая ржавчина'))]
+        fetcher.fetch_page.side_effect = responses
+        with patch('_betaren.get_page_state', return_value=state), \
+                patch('_betaren.get_page_fetcher', return_value=fetcher), \
+                patch('_betaren.build_detail_record', side_effect=build) as mock_build:
+            results = [_betaren.scrape_detail_page(url, 'diseases', download_images=False) for _ in responses]
+
+        # Разбираются только первая загрузка и изменившаяся страница
+        self.assertEqual(mock_build.call_count, 2)
+        self.assertEqual({r['id'] for r in results}, {stable_id(url)})
+        # Условный запрос отправляется с сохраненными валидаторами
+        self.assertEqual(fetcher.fetch_page.call_args_list[1].args, (url, '"v1"', None))
+
+        # Перевод, не выполненный при первом разборе, запрашивается для неизменившейся страницы
+        record = state.get(url)['record']
+        record.update({'description_ru': 'Пятна на листьях', 'description_ua': '', 'description_en': 'Leaf spots'})
+        state.save(url, page_fingerprint(page('c', 'Бурая ржавчина')), record, '"v2"')
+        backend = StubBackend()
+        fetcher.fetch_page.side_effect = [FetchedPage(None, not_modified=True), FetchedPage(None, not_modified=True)]
+        with patch('_betaren.get_page_state', return_value=state), \
+                patch('_betaren.get_page_fetcher', return_value=fetcher), \
+                patch('_betaren.get_translator', return_value=Translator(backend)):
+            result = _betaren.scrape_detail_page(url, 'diseases', download_images=False)
+            self.assertEqual((result['description_ua'], result['description_en']),
+                             ('[uk] Пятна на листьях', 'Leaf spots'))
+            # Дополненная запись сохранена: следующий запуск не обращается к переводчику
+            _betaren.scrape_detail_page(url, 'diseases', download_images=False)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(state.get(url)['record']['description_ua'], '[uk] Пятна на листьях')
+        self.assertEqual(state.get(url)['etag'], '"v2"')
+        state.close()
+
+    def test_entity_crop_index(self):
+        """Тестирует индекс связей сущностей с культурами, из которого строятся CSV и JSON."""
+        index = EntityCropIndex('disease_id')
+        for i in range(6):
+            index.add({'id': f'd{i}', 'name': f'Болезнь {i}'}, {'id': f'desc{i}', 'disease_id': f'd{i}'})
+            index.link(f'd{i}', ['пшеница' if i % 2 else 'рапс'])
+        index.link('d4', ['пшеница', 'ячмень'])
+        index.link('d4', ['пшеница'])
+        index.add({'id': 'd0', 'name': 'Болезнь 0 (обновлена)'})
+        index.add_image({'id': 'img0', 'disease_id': 'd0'})
+
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.entities()[0]['name'], 'Болезнь 0 (обновлена)')
+        self.assertEqual([d['id'] for d in index.with_crops(['пшеница', 'ячмень', 'овес'])], ['d1', 'd3', 'd4', 'd5'])
+        self.assertEqual([d['id'] for d in index.with_crops(['рапс'])], ['d0', 'd2', 'd4'])
+        self.assertEqual(index.with_crops(['лен']), [])
+        self.assertEqual(index.crops_of('d4'), ['рапс', 'пшеница', 'ячмень'])
+        self.assertEqual(len(index.crop_rows()), 8)
+        self.assertEqual(index.crop_rows()[0], {'disease_id': 'd0', 'crops': 'рапс'})
+        self.assertEqual(len(index.descriptions()), 6)
+        self.assertEqual(index.images(), [{'id': 'img0', 'disease_id': 'd0'}])
+
+    def test_import_has_no_side_effects(self):
+        """Тестирует, что импорт точек входа не создает файлов и не загружает тяжелые зависимости."""
+        crawler_dir = Path(__file__).resolve().parent
+        script = ('import sys; sys.path.insert(0, sys.argv[1]); '
+                  'import ImageCrawler, crawler, scrape_betaren, _betaren, _bateren_photo; '
+                  'print(" ".join(m for m in ("requests", "bs4", "tqdm", "twocaptcha", "PIL.Image", '
+                  '"selenium.webdriver.remote.webdriver") if m in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', script, str(crawler_dir)], cwd=self.temp_path,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+        self.assertEqual(result.stderr, '')
+        # В рабочей папке не появились логи и папки результатов
+        self.assertEqual(sorted(p.name for p in self.temp_path.iterdir()), [self.csv_path.name])
+
+    def test_search_extractors(self):
+        """Тестирует извлечение URL изображений из страниц выдачи без DOM."""
+        google = ('<img src="https://a.com/x.JPG?w=1"><script>AF_init([["https:\\/\\/b.com\\/p\\u003d1\\/y.png",800],'
+                  '["https://a.com/x.JPG",1]])</script><img src="https://gstatic.com/images?q=tbn:1">'
+                  "<a href='http://c.com/v1.2/z.webp'>https://d.com/n.jpgx.jpeg&amp;</a>")
+        self.assertEqual(extract_google_image_urls(google),
+                         ['https://a.com/x.JPG', 'https://b.com/p=1/y.png', 'http://c.com/v1.2/z.webp',
+                          'https://d.com/n.jpgx.jpeg'])
+        self.assertEqual(extract_google_image_urls(google, 2), ['https://a.com/x.JPG', 'https://b.com/p=1/y.png'])
+        self.assertEqual(extract_google_image_urls(google, 0), [])
+
+        yandex = ('<div data-state="{&quot;orig_url&quot;:&quot;https://e.com/1.jpg&quot;}"></div>'
+                  '<script>{"orig_url":"https:\\/\\/f.com\\/2.jpeg","thumb":"https://t.com/3.jpg"},'
+                  '{"orig_url":"https://g.com/4.jpg?x=1"},{"orig_url":"https://e.com/1.jpg"}</script>')
+        self.assertEqual(extract_yandex_image_urls(yandex), ['https://e.com/1.jpg', 'https://f.com/2.jpeg'])
+
+        # Из кеша с урезанным списком URL недостающие извлекаются из сохраненной страницы, без запроса
+        cache = SearchCache(self.temp_path / 'cache')
+        cache.put('google', 'запрос', google, extract_google_image_urls(google, 1))
+        with patch('ImageCrawler.get_search_cache', return_value=cache), patch('http_client.get') as mock_get:
+            self.assertEqual(len(get_google_image_urls('запрос', max_images=3)), 3)
+            mock_get.assert_not_called()
+
+    def test_search_fanout(self):
+        """Тестирует одновременный опрос поисковых систем: загрузка начинается до ответа медленной системы."""
+        first_download = threading.Event()
+        events = []
+
+        def fake_search(engine, query, max_images, state=None):
+            if engine == 'yandex':
+                # Яндекс отвечает только после начала первой загрузки
+                self.assertTrue(first_download.wait(5))
+                events.append('yandex')
+                return ['https://shared.com/1.jpg', 'https://good.com/2.jpg']
+            events.append('google')
+            return ['https://shared.com/1.jpg', 'https://bad.com/3.jpg']
+
+        downloaded = []
+
+        def fake_download(url, save_path):
+            events.append('download')
+            downloaded.append(url)
+            first_download.set()
+            return DownloadResult(save_path)
+
+        item = {'name': 'Ржавчина', 'english_name': 'rust'}
+        with patch('ImageCrawler.DOWNLOAD_DIR', self.temp_path / 'images'), \
+                patch('ImageCrawler.get_phash_index'), \
+                patch('ImageCrawler.search_images', side_effect=fake_search), \
+                patch('ImageCrawler.download_image', side_effect=fake_download):
+            process_risk_item(item, 'пшеница', 'cereals', 'diseases', search_engine='both', max_images=10,
+                              max_concurrent=1)
+        self.assertEqual(events[:2], ['google', 'download'])
+        self.assertEqual(sorted(downloaded), ['https://bad.com/3.jpg', 'https://good.com/2.jpg',
+                                              'https://shared.com/1.jpg'])
+
+        # Полученные, но еще не выданные URL упорядочены по успешности загрузок с домена
+        yandex_done = threading.Event()
+
+        def ordered_search(engine, query, max_images):
+            # Google отвечает вторым, когда ответ Яндекса уже получен
+            if engine == 'google':
+                self.assertTrue(yandex_done.wait(5))
+                return ['https://shared.com/1.jpg', 'https://bad.com/3.jpg', 'https://other.com/4.jpg']
+            yandex_done.set()
+            return ['https://good.com/2.jpg']
+
+        rates = {'bad.com': 0.1}
+        ranked = stream_image_urls('запрос', ['google', 'yandex'], 10, ordered_search,
+                                   lambda domain: rates.get(domain, 0.5))
+        self.assertEqual([candidate.url for candidate in ranked],
+                         ['https://good.com/2.jpg', 'https://shared.com/1.jpg', 'https://other.com/4.jpg',
+                          'https://bad.com/3.jpg'])
+
+    def test_domain_stats(self):
+        """Тестирует статистику доменов: ранжирование по ожидаемому выходу и пропуск негодных доменов."""
+        stats = self.domain_stats
+        for i in range(7):
+            stats.record(f'https://www.bad.com/{i}.jpg', False, 0.1, 500, f'HTTP {400 + i}')
+        stats.record('https://fast.com/1.jpg', True, 0.2, 200000)
+        stats.record('https://slow.com/1.jpg', True, 8.0, 200000)
+        self.assertTrue(stats.is_bad('bad.com'))
+        self.assertFalse(stats.is_bad('fast.com'))
+        self.assertEqual(stats.recent_failures('bad.com'), ['HTTP 406', 'HTTP 405', 'HTTP 404', 'HTTP 403', 'HTTP 402'])
+        self.assertGreater(stats.expected_yield('fast.com'), stats.expected_yield('unknown.com'))
+        self.assertGreater(stats.expected_yield('unknown.com'), stats.expected_yield('slow.com'))
+
+        # Непредвиденная ошибка загрузки тоже учитывается в статистике домена
+        with patch('http_client.get', side_effect=RuntimeError('сбой')):
+            self.assertFalse(download_image('https://broken.com/1.jpg', self.temp_path / 'broken.jpg'))
+        self.assertEqual(stats.recent_failures('broken.com'), ['ошибка: RuntimeError'])
+
+        # Статистика сохраняется между запусками
+        reopened = DomainStats(self.domain_stats_db)
+        self.assertEqual(reopened.get('fast.com').mean_bytes, 200000)
+        self.assertEqual([score.domain for score in reopened.bad_domains()], ['bad.com'])
+        reopened.close()
+
+        # URL негодного домена не запрашиваются, остальные загружаются в порядке ожидаемого выхода
+        downloaded = []
+
+        def fake_download(url, save_path):
+            downloaded.append(url)
+            return DownloadResult(save_path)
+
+        urls = ['https://slow.com/2.jpg', 'https://bad.com/2.jpg', 'https://fast.com/2.jpg']
+        item = {'name': 'Ржавчина', 'english_name': 'rust'}
+        with patch('ImageCrawler.DOWNLOAD_DIR', self.temp_path / 'images'), \
+                patch('ImageCrawler.get_phash_index'), \
+                patch('ImageCrawler.get_google_image_urls', return_value=urls), \
+                patch('ImageCrawler.download_image', side_effect=fake_download):
+            process_risk_item(item, 'пшеница', 'cereals', 'diseases', max_images=10, max_concurrent=1)
+        self.assertEqual(downloaded, ['https://fast.com/2.jpg', 'https://slow.com/2.jpg'])
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Базовый класс тестов, которым нужна только временная директория."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_path = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+class TestTranslator(TempDirTestCase):
+    """Тесты пакетного перевода с кешем (translator.py)."""
+
+    def test_translator_cache(self):
+        """Тестирует пакетный перевод и повторное использование сохраненных переводов."""
+        backend = StubBackend()
+        cache = TranslationCache(self.temp_path / 'translations.db')
+        translator = Translator(backend, cache, batch_size=10)
+        texts = [f'Описание {i}' for i in range(25)] + ['Описание 0', '']
+
+        result = translator.translate_many(texts, 'ukrainian')
+        self.assertEqual(result[3], '[uk] Описание 3')
+        self.assertEqual(result[25], result[0])
+        self.assertEqual(result[26], '')
+        # 25 уникальных текстов - три пакетных запроса вместо 26 отдельных
+        self.assertEqual(backend.calls, 3)
+
+        fields = translator.translate_fields({'description': 'Описание 7', 'symptoms': 'Симптомы'}, ('ua', 'en'))
+        self.assertEqual(fields['ua'], {'description': '[uk] Описание 7', 'symptoms': '[uk] Симптомы'})
+        self.assertEqual(fields['en']['symptoms'], '[en] Симптомы')
+        self.assertEqual(backend.calls, 5)
+
+        # Повторный запуск с тем же кешем не обращается к переводчику
+        cache.close()
+        backend = StubBackend()
+        translator = Translator(backend, TranslationCache(self.temp_path / 'translations.db'))
+        self.assertEqual(translator.translate_many(texts, 'uk'), result)
+        self.assertEqual(backend.calls, 0)
+        translator.cache.close()
+
+        # Заглушка не пишет поддельные переводы в постоянный кеш
+        with patch('translator._translator', None), \
+                patch.dict(os.environ, {'TRANSLATION_BACKEND': 'stub',
+                                        'TRANSLATION_CACHE': str(self.temp_path / 'stub.db')}):
+            stub = get_translator()
+        self.assertIsNone(stub.cache)
+        self.assertEqual(stub.translate('Симптомы', 'uk'), '[uk] Симптомы')
+        self.assertFalse((self.temp_path / 'stub.db').exists())
+
+
+class TestStreamingCsv(TempDirTestCase):
+    """Тесты потоковой записи CSV с контрольными точками (streaming_csv.py)."""
+
+    def test_streaming_csv_resume(self):
+        """Тестирует обрезку CSV до контрольной точки после аварийного завершения."""
+        tables = {'main': (self.temp_path / 'main.csv', ['id', 'name']),
+                  'crops': (self.temp_path / 'crops.csv', ['item_id', 'crop'])}
+        checkpoint = self.temp_path / 'checkpoint.json'
+
+        def rows(i):
+            return {'main': [{'id': str(i), 'name': f'Элемент {i}'}],
+                    'crops': [{'item_id': str(i), 'crop': crop} for crop in ('пшеница', 'рожь')]}
+
+        writer = StreamingCsvWriter(tables, checkpoint, checkpoint_every=2)
+        for i in range(3):
+            writer.write_item(rows(i))
+        # Процесс "падает": файлы закрываются без контрольной точки, третий элемент не подтвержден
+        for f in writer._files.values():
+            f.close()
+
+        with StreamingCsvWriter(tables, checkpoint, checkpoint_every=2) as writer:
+            self.assertTrue(writer.resumed)
+            self.assertEqual(writer.read_column('main', 'id'), {'0', '1'})
+            writer.write_item(rows(5))
+        with open(tables['crops'][0], encoding='utf-8', newline='') as f:
+            self.assertEqual([row['item_id'] for row in csv.DictReader(f)], ['0', '0', '1', '1', '5', '5'])
+
+        # После завершенного запуска запись начинается заново
+        with StreamingCsvWriter(tables, checkpoint) as writer:
+            self.assertFalse(writer.resumed)
+            self.assertEqual(writer.read_column('main', 'id'), set())
+
+
+class TestBetarenParser(unittest.TestCase):
+    """Тесты разбора страниц Betaren (betaren_parser.py)."""
+
+    def test_betaren_parser_regression(self):
+        """Сверяет разбор сохраненных страниц Betaren с результатами прежнего парсера на BeautifulSoup."""
+        test_dir = Path(__file__).resolve().parent
+        with open(test_dir / 'betaren_parser_expected.json', encoding='utf-8') as f:
+            expected_pages = json.load(f)
+        self.assertTrue(expected_pages)
+        for filename, expected in expected_pages.items():
+            with self.subTest(page=filename):
+                with open(test_dir / filename, encoding='utf-8') as f:
+                    page = parse_detail_page(f.read(), expected['url'])
+                self.assertEqual(page.content(), {key: value for key, value in expected.items()
+                                                  if key not in ('url', 'image_urls')})
+                self.assertEqual(page.image_urls, expected['image_urls'])
+
+        listing = (
+            '<html><body><div class="agro-item"><a href="/img/">Фото</a><a class="title" href="/harmful/bolezni/a/">'
+            '  Болезни <b>зерновых</b> </a></div><div class="agro-item other"><a href="/harmful/sornyaki/b">Сорняк</a>'
+            '</div><div class="agro-item"><a>Без ссылки</a></div><div class="agro"><a href="/x">X</a></div></body></html>'
+        )
+        self.assertEqual(extract_agro_links(listing),
+                         [('Болезнизерновых', '/harmful/bolezni/a/'), ('Сорняк', '/harmful/sornyaki/b')])
+        self.assertEqual(extract_agro_links(''), [])
+        self.assertIsNone(parse_detail_page('', 'https://betaren.ru/'))
+
+
+class TestBetarenPhotoQueue(TempDirTestCase):
+    """Тесты очереди скачивания фотографий Betaren (_bateren_photo.py, image_queue.py)."""
+
+    def test_betaren_photo_queue(self):
+        """Тестирует очередь скачивания изображений Betaren: без повторов, с продолжением и браузером только при блокировке."""
+        import _bateren_photo
+
+        page = 'https://betaren.ru/harmful/{}/'.format
+        sources = [(page('a'), '1', 'diseases'), (page('b'), '2', 'diseases'),
+                   (page('a'), '3', 'pests'), (page('c'), '4', 'weeds')]
+        images = {page('a'): [f"{page('a')}1.jpg", f"{page('a')}2.png"],
+                  page('b'): [f"{page('a')}1.jpg", f"{page('b')}1.jpg"],
+                  page('c'): [f"{page('c')}1.jpg"]}
+        extracted, requested, browser = [], [], []
+        unavailable, failing = {page('c')}, {f"{page('b')}1.jpg"}
+
+        def fake_extract(page_url):
+            extracted.append(page_url)
+            return [] if page_url in unavailable else images[page_url]
+
+        def fake_requests(url, filepath, referer=None):
+            requested.append(url)
+            if url.endswith('2.png'):
+                return _bateren_photo.DOWNLOAD_BLOCKED
+            if url in failing:
+                return _bateren_photo.DOWNLOAD_FAILED
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'wb') as f:
+                f.write(b'0' * 2048)
+            return _bateren_photo.DOWNLOAD_OK
+
+        def fake_browser(url, filepath, referer=None):
+            browser.append(url)
+            return fake_requests(url.replace('.png', '.jpg'), filepath) == _bateren_photo.DOWNLOAD_OK
+
+        queue = ImageQueue(self.temp_path / 'images.db')
+        with patch('_bateren_photo.extract_all_images_from_page', side_effect=fake_extract), \
+                patch('_bateren_photo.download_image_requests', side_effect=fake_requests), \
+                patch('_bateren_photo.download_image_selenium', side_effect=fake_browser), \
+                patch('_bateren_photo.IMAGES_DIR', str(self.temp_path / 'images')), \
+                patch('_bateren_photo.PAGE_WORKERS', 1):
+            stats = _bateren_photo.run_image_pipeline(sources, queue)
+            # Общая страница разбирается один раз, общее изображение скачивается один раз
+            self.assertEqual(sorted(extracted), [page('a'), page('b'), page('c')])
+            self.assertEqual(len(requested), len(set(requested)))
+            self.assertEqual(browser, [f"{page('a')}2.png"])
+            self.assertEqual((stats['pages'], stats['done'], stats['failed']), (2, 2, 1))
+
+            # Повторный запуск разбирает только страницу без изображений и повторяет неудачную загрузку
+            extracted.clear()
+            unavailable.clear()
+            failing.clear()
+            stats = _bateren_photo.run_image_pipeline(sources, queue)
+            self.assertEqual(extracted, [page('c')])
+            self.assertEqual((stats['pages'], stats['done'], stats.get('failed', 0)), (3, 4, 0))
+            self.assertEqual(stats['via_browser'], 1)
+        queue.close()
+        self.assertTrue((self.temp_path / 'images' / 'diseases' / 'diseases_1_01.jpg').exists())
+        self.assertTrue((self.temp_path / 'images' / 'weeds' / 'weeds_4.jpg').exists())
+
+
+class TestDebugArchive(TempDirTestCase):
+    """Тесты сжатого архива отладочных страниц (debug_archive.py)."""
+
+    def test_debug_archive(self):
+        """Тестирует сжатый архив отладочных страниц, индекс по URL и выборку."""
+        path = self.temp_path / 'debug_pages.gz'
+        archive = DebugArchive(path)
+        pages = {f'https://betaren.ru/harmful/p{i}': f'<html><body>{"страница " * 200}{i}</body></html>' for i in range(5)}
+        for url, html in pages.items():
+            self.assertTrue(archive.add(url, html, 'disease'))
+        self.assertFalse(archive.add('https://betaren.ru/empty', '', 'disease'))
+        archive.add('https://betaren.ru/harmful/p0', '<html>новая версия</html>', 'disease')
+        archive.close()
+
+        self.assertLess(path.stat().st_size, sum(len(html.encode('utf-8')) for html in pages.values()) / 5)
+        latest = latest_by_url(path)
+        self.assertEqual(len(latest), 5)
+        self.assertEqual(read_page(path, latest['https://betaren.ru/harmful/p3']), pages['https://betaren.ru/harmful/p3'])
+        self.assertEqual(read_page(path, latest['https://betaren.ru/harmful/p0']), '<html>новая версия</html>')
+
+        # Оборванная запись данных не попадает в индекс
+        with open(path, 'r+b') as f:
+            f.truncate(path.stat().st_size - 1)
+        self.assertEqual(len(read_index(path)), 5)
+
+        # Выборка детерминирована по URL
+        urls = [f'https://betaren.ru/harmful/x{i}' for i in range(1000)]
+        sampled = [url for url in urls if is_sampled(url, 0.1)]
+        self.assertTrue(50 < len(sampled) < 150)
+        self.assertEqual(sampled, [url for url in urls if is_sampled(url, 0.1)])
+        sampled_archive = DebugArchive(self.temp_path / 'sampled.gz', sample_rate=0.1)
+        self.assertEqual(sum(sampled_archive.add(url, '<html></html>') for url in urls), len(sampled))
+        sampled_archive.close()
+
+
+class TestTermTagger(TempDirTestCase):
+    """Тесты словаря терминов и автомата Ахо-Корасик (term_tagger.py)."""
+
+    def test_term_tagger(self):
+        """Тестирует поиск культур, заголовков разделов и рисков автоматом Ахо-Корасик."""
+        # Названия собранных рисков с переводами дополняют встроенный словарь рисков
+        risks_csv = self.temp_path / 'diseases_пшеница_cereals.csv'
+        with open(risks_csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'name', 'name_en', 'description_ru'])
+            writer.writerow(['1', 'Снежная плесень', 'Snow mould', 'Описание'])
+            writer.writerow(['2', 'Бурая ржавчина', 'Brown rust', ''])
+        tagger = build_default_tagger(load_risk_terms([risks_csv]))
+        text = ('Бурой ржавчиной поражаются посевы озимой пшеницы, ячменя и овса, реже - ржи. '
+                'На сахарной свёкле и соевых бобах не встречается. Leaf rust of WHEAT; corner.')
+        self.assertEqual(tagger.tags(text, KIND_CROP), ['пшеница', 'рожь', 'ячмень', 'овес', 'соя', 'сахарная свекла'])
+        self.assertEqual(tagger.tags(text, KIND_RISK), ['бурая ржавчина'])
+        self.assertEqual(tagger.tags('Снежная плесень (snow mould) и септориоз', KIND_RISK),
+                         ['септориоз', 'снежная плесень'])
+        self.assertEqual(tagger.tags('Бура іржа та борошниста роса', KIND_RISK), ['бурая ржавчина', 'мучнистая роса'])
+        self.assertEqual(tagger.tags('Ржавчина листьев, картопля та соняшник', KIND_CROP), ['подсолнечник', 'картофель'])
+        self.assertEqual(tagger.first_tag('Меры защиты и симптомы болезни', KIND_SECTION), 'symptoms')
+        self.assertEqual(tagger.first_tag('Заходи захисту посівів', KIND_SECTION), 'control')
+        self.assertIsNone(tagger.first_tag('Описание возбудителя', KIND_SECTION))
+
+        # Пересекающиеся подстроки находятся все, как при наивном поиске
+        words = ['he', 'she', 'his', 'hers', 'ab', 'bab', 'bca', 'caa']
+        naive = TermTagger()
+        for word in words:
+            naive.add('word', word, [word], substring=True)
+        rng = random.Random(1)
+        for _ in range(200):
+            sample = ''.join(rng.choice('abcehrs') for _ in range(40))
+            self.assertEqual(sorted((m.key, m.start) for m in naive.find(sample)),
+                             sorted((w, i) for w in words for i in range(len(sample)) if sample.startswith(w, i)))
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
 import csv
 import os
 import json
@@ -9,34 +8,46 @@ import uuid
 import logging
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from urllib.parse import urljoin, urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+import http_client
+from rate_limiter import get_rate_limiter
+from webdriver_pool import get_webdriver_pool
+from page_fetcher import get_page_fetcher
+from image_queue import ImageJob, ImageQueue
+from cli_setup import setup_logging
 
 # Загрузка настроек
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("image_downloader.log", encoding='utf-8', mode='w'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("ImageDownloader")
 
 # Настройки
 OUTPUT_DIR = os.getenv('DOWNLOAD_DIR', 'downloads')
 CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', 'D:/crawler_risks/chromedriver.exe')
 IMAGES_DIR = os.path.join(OUTPUT_DIR, 'images')
+# Число одновременно разбираемых страниц и одновременных загрузок изображений
+PAGE_WORKERS = int(os.getenv('BETAREN_PHOTO_PAGE_WORKERS', '4'))
+DOWNLOAD_WORKERS = int(os.getenv('BETAREN_PHOTO_DOWNLOAD_WORKERS', '8'))
+# Очередь загрузок, по которой прерванное скачивание продолжается
+IMAGE_QUEUE_PATH = os.getenv('BETAREN_PHOTO_QUEUE',
+                             str(Path(__file__).resolve().parent / 'cache' / 'betaren_images.db'))
+
+# Файлы описаний рисков: (файл, колонка с URL страницы, колонка с ID, папка изображений)
+DESCRIPTION_FILES = [
+    ('disease_descriptions.csv', 'source_urls', 'disease_id', 'diseases'),
+    ('vermin_descriptions.csv', 'source_urls', 'vermin_id', 'pests'),
+    ('weed_descriptions.csv', 'source_urls', 'weed_id', 'weeds')
+]
+
+# Результаты загрузки изображения обычным запросом
+DOWNLOAD_OK = 'ok'
+# Сервер вернул страницу вместо изображения или отказал в доступе: может помочь браузер
+DOWNLOAD_BLOCKED = 'blocked'
+DOWNLOAD_FAILED = 'failed'
+BLOCKED_STATUSES = (401, 403, 429, 503)
 
 # Список User-Agent
 USER_AGENTS = [
@@ -54,7 +65,12 @@ def create_directories():
     logger.info("Директории созданы")
 
 def download_image_requests(url, filepath, referer=None):
-    """Скачивание изображения через requests"""
+    """
+    Скачивание изображения через requests
+
+    Returns:
+        DOWNLOAD_OK, DOWNLOAD_BLOCKED (браузер может помочь) или DOWNLOAD_FAILED
+    """
     try:
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
@@ -68,35 +84,44 @@ def download_image_requests(url, filepath, referer=None):
         if referer:
             headers['Referer'] = referer
         
-        response = requests.get(url, headers=headers, timeout=15, stream=True)
-        response.raise_for_status()
-        
-        # Проверяем, что это действительно изображение
-        content_type = response.headers.get('content-type', '').lower()
-        if not any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']):
-            logger.warning(f"Неподдерживаемый тип контента: {content_type} для {url}")
-            return False
-        
-        # Записываем файл
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with http_client.get(url, headers=headers, timeout=15, stream=True) as response:
+            if response.status_code in BLOCKED_STATUSES:
+                logger.warning(f"HTTP {response.status_code} для {url}")
+                return DOWNLOAD_BLOCKED
+            response.raise_for_status()
+            
+            # Проверяем, что это действительно изображение
+            content_type = response.headers.get('content-type', '').lower()
+            if not any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']):
+                logger.warning(f"Неподдерживаемый тип контента: {content_type} для {url}")
+                # HTML вместо изображения - обычно страница проверки браузера
+                return DOWNLOAD_BLOCKED if 'text/html' in content_type else DOWNLOAD_FAILED
+            
+            # Записываем файл
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
         
         # Проверяем размер файла
         if os.path.getsize(filepath) < 1024:  # Менее 1KB
             logger.warning(f"Слишком маленький файл {filepath}, возможно это не изображение")
             os.remove(filepath)
-            return False
+            return DOWNLOAD_FAILED
         
         logger.info(f"Изображение успешно скачано: {filepath}")
-        return True
+        return DOWNLOAD_OK
     except Exception as e:
         logger.error(f"Ошибка при скачивании {url} через requests: {e}")
-        return False
+        return DOWNLOAD_FAILED
+
+def get_webdriver():
+    """Создание веб-драйвера для пула браузеров"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
 
-def download_image_selenium(url, filepath, referer=None):
-    """Скачивание изображения через Selenium"""
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
@@ -104,85 +129,90 @@ def download_image_selenium(url, filepath, referer=None):
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument(f'--user-agent={random.choice(USER_AGENTS)}')
     options.add_argument('--disable-blink-features=AutomationControlled')
-    
+
     service = Service(CHROMEDRIVER_PATH)
-    driver = None
-    
+    driver = webdriver.Chrome(service=service, options=options)
+    driver.set_page_load_timeout(20)
+    return driver
+
+def download_image_selenium(url, filepath, referer=None):
+    """Скачивание изображения через Selenium"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     try:
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.set_page_load_timeout(20)
-        
-        # Переходим на страницу с рефером, если нужно
-        if referer:
-            driver.get(referer)
-            time.sleep(1)
-        
-        # Переходим к изображению
-        driver.get(url)
-        time.sleep(2)
-        
-        # Проверяем, что изображение загрузилось
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "img"))
-            )
-        except:
-            logger.warning(f"Изображение не найдено на странице {url}")
-        
-        # Убедимся, что директория существует
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        # Исправляем расширение для скриншота
-        screenshot_path = filepath
-        if not filepath.lower().endswith('.png'):
-            screenshot_path = os.path.splitext(filepath)[0] + '.png'
-        
-        # Делаем скриншот страницы
-        driver.save_screenshot(screenshot_path)
-        
-        # Если файл создан с .png расширением, но нужен другой формат - переименовываем
-        if screenshot_path != filepath and os.path.exists(screenshot_path):
-            os.rename(screenshot_path, filepath)
-        
-        final_path = filepath if os.path.exists(filepath) else screenshot_path
-        
-        # Проверяем размер файла
-        if os.path.getsize(final_path) < 1024:
-            logger.warning(f"Слишком маленький файл {final_path}")
-            os.remove(final_path)
-            return False
-        
-        logger.info(f"Изображение скачано через Selenium: {final_path}")
-        return True
+        with get_webdriver_pool('betaren_photo', get_webdriver).driver() as driver:
+            # Переходим на страницу с рефером, если нужно
+            if referer:
+                driver.get(referer)
+                time.sleep(1)
+        
+            # Переходим к изображению
+            get_rate_limiter().wait(url)
+            driver.get(url)
+            time.sleep(2)
+        
+            # Проверяем, что изображение загрузилось
+            try:
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "img"))
+                )
+            except:
+                logger.warning(f"Изображение не найдено на странице {url}")
+        
+            # Убедимся, что директория существует
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        
+            # Исправляем расширение для скриншота
+            screenshot_path = filepath
+            if not filepath.lower().endswith('.png'):
+                screenshot_path = os.path.splitext(filepath)[0] + '.png'
+        
+            # Делаем скриншот страницы
+            driver.save_screenshot(screenshot_path)
+        
+            # Если файл создан с .png расширением, но нужен другой формат - переименовываем
+            if screenshot_path != filepath and os.path.exists(screenshot_path):
+                os.rename(screenshot_path, filepath)
+        
+            final_path = filepath if os.path.exists(filepath) else screenshot_path
+        
+            # Проверяем размер файла
+            if os.path.getsize(final_path) < 1024:
+                logger.warning(f"Слишком маленький файл {final_path}")
+                os.remove(final_path)
+                return False
+        
+            logger.info(f"Изображение скачано через Selenium: {final_path}")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при скачивании {url} через Selenium: {e}")
         return False
-    finally:
-        if driver:
-            driver.quit()
 
-def extract_all_images_from_page(page_url):
-    """Извлечение всех URL изображений со страницы рисков"""
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    options.add_argument(f'--user-agent={random.choice(USER_AGENTS)}')
-    
-    service = Service(CHROMEDRIVER_PATH)
-    driver = None
-    
-    try:
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.set_page_load_timeout(20)
-        driver.get(page_url)
-        
+def render_page_source(url):
+    """Загрузка страницы через браузер из общего пула"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    with get_webdriver_pool('betaren_photo', get_webdriver).driver() as driver:
+        get_rate_limiter().wait(url)
+        driver.get(url)
+
         # Ждем загрузки страницы
         WebDriverWait(driver, 15).until(
             EC.presence_of_element_located((By.TAG_NAME, "body"))
         )
-        
-        html_content = driver.page_source
+
+        return driver.page_source
+
+def extract_all_images_from_page(page_url):
+    """Извлечение всех URL изображений со страницы рисков"""
+    from bs4 import BeautifulSoup
+
+    try:
+        html_content = get_page_fetcher('betaren_photo', render_page_source, USER_AGENTS).fetch(page_url)
         soup = BeautifulSoup(html_content, 'html.parser')
         
         image_urls = []
@@ -263,9 +293,6 @@ def extract_all_images_from_page(page_url):
     except Exception as e:
         logger.error(f"Ошибка при извлечении изображений со страницы {page_url}: {e}")
         return []
-    finally:
-        if driver:
-            driver.quit()
 
 def download_direct_image(image_url, folder, filename, referer=None):
     """Прямое скачивание изображения по URL"""
@@ -300,14 +327,14 @@ def download_direct_image(image_url, folder, filename, referer=None):
         if referer:
             headers['Referer'] = referer
         
-        response = requests.get(image_url, headers=headers, timeout=15, stream=True)
-        response.raise_for_status()
-        
-        # Записываем файл
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with http_client.get(image_url, headers=headers, timeout=15, stream=True) as response:
+            response.raise_for_status()
+            
+            # Записываем файл
+            with open(filepath, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
         
         # Проверяем размер файла
         if os.path.getsize(filepath) < 1024:
@@ -320,6 +347,8 @@ def download_direct_image(image_url, folder, filename, referer=None):
     except Exception as e:
         logger.error(f"Ошибка при прямом скачивании {image_url}: {e}")
         return ''
+
+def download_image(url, folder, filename, referer=None):
     """Основная функция скачивания изображения"""
     if not url:
         logger.warning("Пустой URL изображения")
@@ -340,74 +369,147 @@ def download_direct_image(image_url, folder, filename, referer=None):
     logger.info(f"Скачиваем изображение: {url}")
     
     # Пробуем через requests
-    if download_image_requests(url, filepath, referer):
+    result = download_image_requests(url, filepath, referer)
+    if result == DOWNLOAD_OK:
         return filepath
     
-    # Если не получилось, пробуем через Selenium
-    logger.info(f"Пробуем скачать через Selenium: {url}")
-    if download_image_selenium(url, filepath, referer):
-        return filepath
+    # Браузер запускается, только если сервер не отдал изображение обычному запросу
+    if result == DOWNLOAD_BLOCKED:
+        logger.info(f"Пробуем скачать через Selenium: {url}")
+        if download_image_selenium(url, filepath, referer):
+            return filepath
     
     logger.error(f"Не удалось скачать изображение: {url}")
     return ''
 
-def process_csv_file(csv_file, url_column, id_column, type_name):
-    """Обработка CSV файла и скачивание всех изображений с каждой страницы"""
+def read_source_pages(csv_file, url_column, id_column, type_name):
+    """Чтение страниц рисков из CSV файла: список (URL страницы, ID, папка)"""
     if not os.path.exists(csv_file):
         logger.error(f"Файл {csv_file} не найден")
-        return
-    
-    logger.info(f"Обрабатываем файл: {csv_file}")
-    
-    downloaded_count = 0
-    failed_count = 0
-    
-    try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                if url_column not in row or id_column not in row:
-                    logger.warning(f"Отсутствуют необходимые колонки в строке: {row}")
-                    continue
-                
-                page_url = row[url_column].strip()
-                item_id = row[id_column].strip()
-                
-                if not page_url or not item_id:
-                    logger.warning(f"Пустые значения URL или ID: {page_url}, {item_id}")
-                    continue
-                
-                # Скачиваем все изображения со страницы
-                logger.info(f"Обрабатываем страницу: {page_url}")
-                downloaded_files = download_multiple_images(page_url, type_name, f"{type_name}_{item_id}")
-                
-                if downloaded_files:
-                    downloaded_count += len(downloaded_files)
-                    logger.info(f"Успешно скачано {len(downloaded_files)} изображений для {item_id}")
-                else:
-                    failed_count += 1
-                    logger.error(f"Не удалось скачать изображения для {item_id}")
-                
-                # Пауза между обработкой страниц
-                time.sleep(random.uniform(2, 4))
+        return []
     
-    except Exception as e:
-        logger.error(f"Ошибка при обработке файла {csv_file}: {e}")
+    pages = []
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            page_url = (row.get(url_column) or '').strip()
+            item_id = (row.get(id_column) or '').strip()
+            if not page_url or not item_id:
+                logger.warning(f"Пустые значения URL или ID: {page_url}, {item_id}")
+                continue
+            pages.append((page_url, item_id, type_name))
+    logger.info(f"{csv_file}: {len(pages)} страниц")
+    return pages
+
+def build_page_jobs(page_url, image_urls, folder, base_filename):
+    """Задания на скачивание изображений страницы с именами файлов base_filename[_NN].ext"""
+    jobs = []
+    for i, image_url in enumerate(image_urls):
+        file_extension = os.path.splitext(urlparse(image_url).path)[1] or '.jpg'
+        if len(image_urls) == 1:
+            filename = f"{base_filename}{file_extension}"
+        else:
+            filename = f"{base_filename}_{i+1:02d}{file_extension}"
+        jobs.append(ImageJob(image_url, page_url, folder, filename))
+    return jobs
+
+def download_job(job):
+    """
+    Скачивание изображения из очереди: обычный запрос, браузер - только если сервер не отдал изображение
+
+    Returns:
+        (путь к файлу или None, способ: 'existing', 'http' или 'browser')
+    """
+    filepath = os.path.join(IMAGES_DIR, job.folder, job.filename)
+    if os.path.exists(filepath) and os.path.getsize(filepath) > 1024:
+        return filepath, 'existing'
+    
+    result = download_image_requests(job.image_url, filepath, job.page_url)
+    if result == DOWNLOAD_OK:
+        return filepath, 'http'
+    if result == DOWNLOAD_BLOCKED:
+        logger.info(f"Пробуем скачать через Selenium: {job.image_url}")
+        if download_image_selenium(job.image_url, filepath, job.page_url):
+            return filepath, 'browser'
+    return None, None
+
+def run_image_pipeline(sources, queue):
+    """
+    Двухэтапное скачивание изображений со страниц рисков.
+    
+    Первый этап разбирает страницы (PAGE_WORKERS потоков) и ставит найденные изображения
+    в очередь без повторов; второй скачивает их (DOWNLOAD_WORKERS потоков), начиная
+    с заданий, оставшихся от прерванного запуска. Изображения страницы начинают скачиваться,
+    как только страница разобрана.
+    
+    Args:
+        sources: Список (URL страницы, ID, папка)
+        queue: Очередь ImageQueue
+    
+    Returns:
+        Статистика очереди
+    """
+    extracted = queue.extracted_pages()
+    pages = {}
+    for page_url, item_id, folder in sources:
+        # Страница, общая для нескольких записей, разбирается один раз
+        if page_url not in extracted and page_url not in pages:
+            pages[page_url] = (item_id, folder)
+    
+    leftover = queue.pending()
+    logger.info(f"Страниц для разбора: {len(pages)} (уже разобрано: {len(extracted)}), "
+                f"незавершенных загрузок: {len(leftover)}")
+    
+    downloaded = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_executor, \
+            ThreadPoolExecutor(max_workers=PAGE_WORKERS) as page_executor:
+        downloads = {}
+        
+        def enqueue(jobs):
+            for job in jobs:
+                downloads[download_executor.submit(download_job, job)] = job
+        
+        enqueue(leftover)
+        page_futures = {page_executor.submit(extract_all_images_from_page, page_url): page_url for page_url in pages}
+        for future in as_completed(page_futures):
+            page_url = page_futures[future]
+            item_id, folder = pages[page_url]
+            image_urls = future.result()
+            if not image_urls:
+                # Страница будет разобрана снова при следующем запуске
+                logger.error(f"Не найдены изображения на странице {page_url}")
+                continue
+            enqueue(queue.add_page(page_url, build_page_jobs(page_url, image_urls, folder, f"{folder}_{item_id}")))
+        
+        for future in as_completed(list(downloads)):
+            job = downloads[future]
+            try:
+                path, method = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка при скачивании {job.image_url}: {e}")
+                path, method = None, None
+            queue.record(job.image_url, path, method)
+            if path:
+                downloaded += 1
+            else:
+                failed += 1
+                logger.error(f"Не удалось скачать: {job.filename}")
     
-    logger.info(f"Обработка {csv_file} завершена. Скачано изображений: {downloaded_count}, Неудачных страниц: {failed_count}")
+    stats = queue.stats()
+    logger.info(f"Скачано изображений: {downloaded}, неудачных загрузок: {failed}, состояние очереди: {stats}")
+    return stats
 
 def download_from_json_descriptions():
-    """Скачивание изображений из JSON файлов с описаниями"""
-    json_files = [
-        ('disease_descriptions.csv', 'source_urls', 'disease_id', 'diseases'),
-        ('vermin_descriptions.csv', 'source_urls', 'vermin_id', 'pests'),
-        ('weed_descriptions.csv', 'source_urls', 'weed_id', 'weeds')
-    ]
+    """Скачивание изображений со всех страниц из CSV файлов с описаниями"""
+    sources = []
+    for csv_file, url_col, id_col, folder in DESCRIPTION_FILES:
+        sources.extend(read_source_pages(os.path.join(OUTPUT_DIR, csv_file), url_col, id_col, folder))
     
-    for csv_file, url_col, id_col, folder in json_files:
-        csv_path = os.path.join(OUTPUT_DIR, csv_file)
-        process_csv_file(csv_path, url_col, id_col, folder)
+    queue = ImageQueue(Path(IMAGE_QUEUE_PATH))
+    try:
+        return run_image_pipeline(sources, queue)
+    finally:
+        queue.close()
 
 def download_multiple_images(page_url, output_folder="manual", base_filename=None):
     """Скачивание всех изображений с одной страницы рисков"""
@@ -425,28 +527,14 @@ def download_multiple_images(page_url, output_folder="manual", base_filename=Non
     
     downloaded_files = []
     
-    for i, image_url in enumerate(image_urls):
-        # Определяем расширение файла
-        parsed_url = urlparse(image_url)
-        file_extension = os.path.splitext(parsed_url.path)[1] or '.jpg'
-        
-        # Создаем уникальное имя файла
-        if len(image_urls) == 1:
-            filename = f"{base_filename}{file_extension}"
-        else:
-            filename = f"{base_filename}_{i+1:02d}{file_extension}"
-        
-        # Скачиваем изображение
-        result_path = download_direct_image(image_url, output_folder, filename, page_url)
+    for job in build_page_jobs(page_url, image_urls, output_folder, base_filename):
+        result_path = download_direct_image(job.image_url, output_folder, job.filename, page_url)
         
         if result_path:
             downloaded_files.append(result_path)
-            logger.info(f"Успешно скачано: {filename}")
+            logger.info(f"Успешно скачано: {job.filename}")
         else:
-            logger.error(f"Не удалось скачать: {filename}")
-        
-        # Пауза между скачиваниями
-        time.sleep(random.uniform(0.5, 1.5))
+            logger.error(f"Не удалось скачать: {job.filename}")
     
     logger.info(f"Скачано {len(downloaded_files)} из {len(image_urls)} изображений")
     return downloaded_files
@@ -476,6 +564,7 @@ def download_single_image(page_url, output_folder="manual", filename=None):
 
 def main():
     """Основная функция"""
+    setup_logging("image_downloader.log", fmt='%(asctime)s - %(levelname)s - %(message)s', mode='w')
     print("Модуль для скачивания изображений с сайта Betaren")
     print("1. Скачать все изображения из CSV файлов")
     print("2. Скачать одно изображение по URL страницы")
@@ -1,36 +1,29 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
-import csv
 import os
 import json
-import uuid
 import logging
-import time
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+import http_client
+from rate_limiter import get_rate_limiter
+from webdriver_pool import get_webdriver_pool
+from page_fetcher import get_page_fetcher
+from translator import get_translator
+from page_state import get_page_state, page_fingerprint, stable_id
+from streaming_csv import StreamingCsvWriter
+from betaren_parser import extract_agro_links, parse_detail_page
+from debug_archive import archive_page
+from term_tagger import KIND_CROP, get_term_tagger
+from cli_setup import setup_logging
 
 # Загрузка настроек
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("betaren_universal.log", encoding='utf-8', mode='w'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("BetarenUniversal")
 
 # Настройки
@@ -38,6 +31,16 @@ OUTPUT_DIR = os.getenv('DOWNLOAD_DIR', 'downloads')
 CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', 'chromedriver.exe')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 SLEEP_BETWEEN_REQUESTS = float(os.getenv('SLEEP_BETWEEN_REQUESTS', '2.0'))
+# Число одновременно обрабатываемых детальных страниц и одновременных загрузок изображений
+DETAIL_WORKERS = int(os.getenv('BETAREN_DETAIL_WORKERS', '4'))
+IMAGE_WORKERS = int(os.getenv('BETAREN_IMAGE_WORKERS', '8'))
+# Инкрементальный режим: неизменившиеся страницы берутся из сохраненного состояния
+INCREMENTAL = os.getenv('BETAREN_INCREMENTAL', '1') == '1'
+# Увеличивается при изменении разбора страниц, чтобы сохраненные записи были построены заново
+PARSER_VERSION = 2
+# Через сколько элементов CSV файлы сбрасываются на диск; BETAREN_RESUME=1 продолжает прерванный запуск
+CHECKPOINT_EVERY = int(os.getenv('BETAREN_CHECKPOINT_EVERY', '5'))
+RESUME = os.getenv('BETAREN_RESUME', '1') == '1'
 
 BASE_URL = "https://betaren.ru"
 IMAGES_DIR = os.path.join(OUTPUT_DIR, 'images')
@@ -58,6 +61,10 @@ def create_directories():
 
 def get_webdriver():
     """Создание веб-драйвера"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
@@ -71,42 +78,32 @@ def get_webdriver():
     return driver
 
 
-def translate_text_gpt(text, target_language="ukrainian"):
-    """Перевод текста через OpenAI GPT API"""
-    if not text or not text.strip() or not OPENAI_API_KEY:
-        return ""
-
-    try:
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
+def render_page_source(url):
+    """Загрузка страницы через браузер из общего пула"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
 
-        if target_language == "ukrainian":
-            prompt = f"Переведи этот текст на украинский язык, сохраняя научную терминологию:\n\n{text}"
-        else:
-            prompt = f"Translate this text to English, preserving scientific terminology:\n\n{text}"
+    with get_webdriver_pool('betaren', get_webdriver).driver() as driver:
+        get_rate_limiter().wait(url)
+        driver.get(url)
 
-        data = {
-            "model": "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 2000,
-            "temperature": 0.2
-        }
+        WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        )
+        return driver.page_source
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
 
-        result = response.json()
-        translated_text = result['choices'][0]['message']['content'].strip()
+def load_page_source(url):
+    """Загрузка страницы: сначала обычным HTTP-запросом, браузером - только если это не удалось"""
+    return get_page_fetcher('betaren', render_page_source, USER_AGENTS).fetch(url)
 
-        logger.info(f"✅ Переведено на {target_language}")
-        return translated_text
 
-    except Exception as e:
-        logger.error(f"❌ Ошибка перевода: {e}")
+def translate_text_gpt(text, target_language="ukrainian"):
+    """Перевод текста через OpenAI GPT API (с постоянным кешем переводов)"""
+    if not text or not text.strip():
         return ""
+    return get_translator().translate(text, target_language)
 
 
 def download_image(image_url, filepath, referer=None):
@@ -119,20 +116,20 @@ def download_image(image_url, filepath, referer=None):
             'Referer': referer or BASE_URL
         }
 
-        response = requests.get(image_url, headers=headers, timeout=15, stream=True)
-        response.raise_for_status()
+        with http_client.get(image_url, headers=headers, timeout=15, stream=True) as response:
+            response.raise_for_status()
 
-        content_type = response.headers.get('content-type', '').lower()
-        if not any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']):
-            logger.warning(f"❌ Неподдерживаемый тип: {content_type}")
-            return False
+            content_type = response.headers.get('content-type', '').lower()
+            if not any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']):
+                logger.warning(f"❌ Неподдерживаемый тип: {content_type}")
+                return False
 
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+            with open(filepath, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
 
         if os.path.getsize(filepath) < 1024:
             logger.warning(f"❌ Слишком маленький файл")
@@ -148,210 +145,57 @@ def download_image(image_url, filepath, referer=None):
         return False
 
 
-def extract_images_from_page(soup, page_url):
-    """Извлечение изображений со страницы на основе РЕАЛЬНОЙ структуры HTML"""
-    try:
-        image_urls = []
-
-        # 1. ОСНОВНОЕ ИЗОБРАЖЕНИЕ из div.harmful-detail__picture img
-        main_img = soup.select_one('div.harmful-detail__picture img')
-        if main_img and main_img.get('src'):
-            img_url = urljoin(page_url, main_img['src'])
-            image_urls.append(img_url)
-            logger.info(f"📸 Найдено основное изображение")
-
-        # 2. ГАЛЕРЕЯ ИЗОБРАЖЕНИЙ из swiper-slide
-        gallery_imgs = soup.select('div.swiper-slide img.gallery__img')
-        for img in gallery_imgs:
-            if img.get('src'):
-                img_url = urljoin(page_url, img['src'])
-                if img_url not in image_urls:
-                    image_urls.append(img_url)
-
-        # 3. ССЫЛКИ НА ПОЛНОРАЗМЕРНЫЕ ИЗОБРАЖЕНИЯ
-        gallery_links = soup.select('a.gallery__link[href]')
-        for link in gallery_links:
-            href = link.get('href', '')
-            if any(ext in href.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']):
-                img_url = urljoin(page_url, href)
-                if img_url not in image_urls:
-                    image_urls.append(img_url)
-
-        # 4. ДОПОЛНИТЕЛЬНЫЙ ПОИСК - любые img в контенте
-        content_imgs = soup.select('div.content img, div.harmful-detail img, img')
-        for img in content_imgs:
-            if img.get('src'):
-                img_url = urljoin(page_url, img['src'])
-                if img_url not in image_urls and any(
-                        ext in img_url.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']):
-                    image_urls.append(img_url)
-
-        logger.info(f"✅ Найдено {len(image_urls)} изображений")
-        return image_urls
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка извлечения изображений: {e}")
-        return []
-
-
-def parse_content_from_html(soup):
-    """Парсинг контента на основе РЕАЛЬНОЙ структуры HTML"""
-    try:
-        # НАЗВАНИЕ из H1
-        title_elem = soup.find('h1')
-        title = title_elem.get_text(strip=True) if title_elem else ""
-
-        # НАУЧНОЕ НАЗВАНИЕ
-        scientific_name = ""
-        detail_text = soup.find('div', class_='harmful-detail__text')
-        if detail_text:
-            italic_text = detail_text.find('i')
-            if italic_text:
-                scientific_name = italic_text.get_text(strip=True)
-
-        # ВЕСЬ ТЕКСТОВЫЙ КОНТЕНТ
-        all_content = ""
-        if detail_text:
-            paragraphs = detail_text.find_all(['p', 'div', 'h3'])
-            for p in paragraphs:
-                text = p.get_text(strip=True)
-                if text and len(text) > 10:
-                    all_content += text + "\n\n"
-
-        if not all_content:
-            content_area = soup.find('div', class_='content__inner') or soup.find('main')
-            if content_area:
-                all_content = content_area.get_text(separator='\n\n', strip=True)
-
-        # РАЗБИВАЕМ КОНТЕНТ НА СЕКЦИИ
-        content_lines = all_content.split('\n\n')
-
-        description_ru = ""
-        symptoms_ru = ""
-        development_conditions_ru = ""
-        control_measures_ru = ""
-
-        current_section = "description"
-
-        for line in content_lines:
-            line = line.strip()
-            if len(line) < 20:
-                continue
-
-            line_lower = line.lower()
-
-            # Определяем секцию по заголовкам
-            if any(keyword in line_lower for keyword in ['симптомы болезни', 'симптомы', 'признаки болезни']):
-                current_section = "symptoms"
-                continue
-            elif any(keyword in line_lower for keyword in ['факторы', 'условия развития', 'развитие болезни']):
-                current_section = "development"
-                continue
-            elif any(keyword in line_lower for keyword in ['меры защиты', 'меры борьбы', 'защита']):
-                current_section = "control"
-                continue
-
-            # Добавляем контент к соответствующей секции
-            if current_section == "description":
-                description_ru += line + " "
-            elif current_section == "symptoms":
-                symptoms_ru += line + " "
-            elif current_section == "development":
-                development_conditions_ru += line + " "
-            elif current_section == "control":
-                control_measures_ru += line + " "
-
-        # Если не удалось разделить, кладем весь текст в описание
-        if not any([symptoms_ru, development_conditions_ru, control_measures_ru]):
-            description_ru = all_content[:1500] if all_content else ""
-
-        return {
-            'title': title,
-            'scientific_name': scientific_name,
-            'description_ru': description_ru.strip(),
-            'symptoms_ru': symptoms_ru.strip(),
-            'development_conditions_ru': development_conditions_ru.strip(),
-            'control_measures_ru': control_measures_ru.strip()
-        }
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка парсинга контента: {e}")
-        return None
-
-
 def get_subcategory_links(main_category_url):
     """Получение ссылок на подкатегории (культуры) или прямые ссылки на сорняки"""
-    driver = get_webdriver()
-
     try:
         logger.info(f"🔗 Ищем подкатегории в: {main_category_url}")
-        driver.get(main_category_url)
-
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        page_source = load_page_source(main_category_url)
 
-        # Сохраняем HTML для отладки
-        debug_file = f"debug_{main_category_url.split('/')[-2]}_{uuid.uuid4().hex[:8]}.html"
-        with open(debug_file, 'w', encoding='utf-8') as f:
-            f.write(driver.page_source)
-        logger.info(f"🔍 HTML сохранен в {debug_file}")
+        # Сохраняем HTML для отладки (только при включенном архиве DEBUG_ARCHIVE)
+        archive_page(main_category_url, page_source, 'category')
 
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # Ссылки карточек .agro-item (ссылка .title или первая ссылка карточки)
+        agro_links = extract_agro_links(page_source)
         subcategories = []
 
         # ДЛЯ СОРНЯКОВ - ищем прямые ссылки на детальные страницы
         if 'sornyaki' in main_category_url:
             logger.info("🌱 Обрабатываем сорняки - ищем прямые ссылки")
 
-            # Из HTML видно, что используется класс .agro-item с ссылкой .title
-            agro_items = soup.select('div.agro-item')
-            for item in agro_items:
-                # Ищем ссылку внутри элемента
-                link = item.find('a', class_='title') or item.find('a')
-                if link and link.get('href'):
-                    href = link.get('href', '')
-                    text = link.get_text(strip=True)
-
-                    # Фильтр для ссылок на сорняки
-                    if (href.startswith('/harmful/sornyaki/') and
-                            not href.endswith('/') and  # НЕ категории
-                            len(text) > 3 and
-                            not any(exclude in text.lower() for exclude in
-                                    ['главная', 'назад', 'меню', 'поиск', 'контакты', 'каталог'])):
-                        detail_url = urljoin(BASE_URL, href)
-                        subcategories.append({
-                            'name': text,
-                            'url': detail_url
-                        })
-                        logger.info(f"🌱 Найден сорняк: {text}")
+            for text, href in agro_links:
+                # Фильтр для ссылок на сорняки
+                if (href.startswith('/harmful/sornyaki/') and
+                        not href.endswith('/') and  # НЕ категории
+                        len(text) > 3 and
+                        not any(exclude in text.lower() for exclude in
+                                ['главная', 'назад', 'меню', 'поиск', 'контакты', 'каталог'])):
+                    detail_url = urljoin(BASE_URL, href)
+                    subcategories.append({
+                        'name': text,
+                        'url': detail_url
+                    })
+                    logger.info(f"🌱 Найден сорняк: {text}")
 
         # ДЛЯ БОЛЕЗНЕЙ И ВРЕДИТЕЛЕЙ - ищем подкатегории (культуры)
         else:
             logger.info("🦠🐛 Обрабатываем болезни/вредители - ищем культуры")
 
-            # Из HTML видно, что используется класс .agro-item с ссылкой .title
-            agro_items = soup.select('div.agro-item')
-            for item in agro_items:
-                # Ищем ссылку внутри элемента
-                link = item.find('a', class_='title') or item.find('a')
-                if link and link.get('href'):
-                    href = link.get('href', '')
-                    text = link.get_text(strip=True)
-
-                    if (href.startswith('/harmful/') and
-                            href.endswith('/') and
-                            len(text) > 5 and
-                            not any(exclude in text.lower() for exclude in
-                                    ['главная', 'назад', 'меню', 'поиск', 'контакты'])):
-
-                        subcategory_url = urljoin(BASE_URL, href)
-                        if not any(sub['url'] == subcategory_url for sub in subcategories):
-                            subcategories.append({
-                                'name': text,
-                                'url': subcategory_url
-                            })
-                            logger.info(f"📂 Найдена культура: {text}")
+            seen_urls = set()
+            for text, href in agro_links:
+                if (href.startswith('/harmful/') and
+                        href.endswith('/') and
+                        len(text) > 5 and
+                        not any(exclude in text.lower() for exclude in
+                                ['главная', 'назад', 'меню', 'поиск', 'контакты'])):
+
+                    subcategory_url = urljoin(BASE_URL, href)
+                    if subcategory_url not in seen_urls:
+                        seen_urls.add(subcategory_url)
+                        subcategories.append({
+                            'name': text,
+                            'url': subcategory_url
+                        })
+                        logger.info(f"📂 Найдена культура: {text}")
 
         logger.info(f"✅ Найдено {len(subcategories)} подкатегорий/элементов")
         return subcategories
@@ -359,62 +203,42 @@ def get_subcategory_links(main_category_url):
     except Exception as e:
         logger.error(f"❌ Ошибка получения подкатегорий: {e}")
         return []
-    finally:
-        driver.quit()
 
 
 def get_detail_links_from_culture(culture_url):
     """Получение детальных ссылок из подкатегории культуры"""
-    driver = get_webdriver()
-
     try:
         logger.info(f"🔍 Ищем детальные ссылки в: {culture_url}")
-        driver.get(culture_url)
+        page_source = load_page_source(culture_url)
 
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        # Сохраняем HTML для отладки (только при включенном архиве DEBUG_ARCHIVE)
+        archive_page(culture_url, page_source, 'culture')
 
-        # Сохраняем HTML для отладки
-        debug_file = f"debug_culture_{uuid.uuid4().hex[:8]}.html"
-        with open(debug_file, 'w', encoding='utf-8') as f:
-            f.write(driver.page_source)
-        logger.info(f"🔍 HTML культуры сохранен в {debug_file}")
-
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
         detail_links = []
 
         # Определяем тип (болезни или вредители) из URL
         is_diseases = 'bolezni' in culture_url
         is_pests = 'vrediteli' in culture_url
 
-        # Ищем все agro-item элементы
-        agro_items = soup.select('div.agro-item')
-
-        for item in agro_items:
-            # Ищем ссылку внутри элемента
-            link = item.find('a', class_='title') or item.find('a')
-            if link and link.get('href'):
-                href = link.get('href', '')
-                text = link.get_text(strip=True)
-
-                # Фильтр для детальных страниц
-                if (href.startswith('/harmful/') and
-                        not href.endswith('/') and  # НЕ категории
-                        len(text) > 5 and
-                        href != culture_url.replace(BASE_URL, '') and
-                        not any(exclude in text.lower() for exclude in
-                                ['главная', 'назад', 'меню', 'поиск', 'заказать', 'подробнее', 'контакты'])):
-
-                    # Проверяем, что ссылка соответствует типу
-                    if ((is_diseases and 'bolezni' in href) or
-                            (is_pests and 'vrediteli' in href)):
-                        detail_url = urljoin(BASE_URL, href)
-                        detail_links.append({
-                            'name': text,
-                            'url': detail_url
-                        })
-                        logger.info(f"📄 Найдена детальная страница: {text}")
+        # Ссылки всех карточек agro-item
+        for text, href in extract_agro_links(page_source):
+            # Фильтр для детальных страниц
+            if (href.startswith('/harmful/') and
+                    not href.endswith('/') and  # НЕ категории
+                    len(text) > 5 and
+                    href != culture_url.replace(BASE_URL, '') and
+                    not any(exclude in text.lower() for exclude in
+                            ['главная', 'назад', 'меню', 'поиск', 'заказать', 'подробнее', 'контакты'])):
+
+                # Проверяем, что ссылка соответствует типу
+                if ((is_diseases and 'bolezni' in href) or
+                        (is_pests and 'vrediteli' in href)):
+                    detail_url = urljoin(BASE_URL, href)
+                    detail_links.append({
+                        'name': text,
+                        'url': detail_url
+                    })
+                    logger.info(f"📄 Найдена детальная страница: {text}")
 
         # Удаляем дубликаты
         seen_urls = set()
@@ -430,285 +254,345 @@ def get_detail_links_from_culture(culture_url):
     except Exception as e:
         logger.error(f"❌ Ошибка получения детальных ссылок: {e}")
         return []
-    finally:
-        driver.quit()
 
 
-def scrape_detail_page(page_url, category_type):
-    """Обработка детальной страницы"""
-    driver = get_webdriver()
+def build_image_jobs(item_id, title, image_urls, category_type):
+    """Имена файлов для изображений элемента: список (image_url, filepath, filename)"""
+    jobs = []
+    safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+    safe_title = safe_title.replace(' ', '_')[:30]
 
-    try:
-        logger.info(f"📄 Обрабатываем: {page_url}")
-        driver.get(page_url)
+    for i, image_url in enumerate(image_urls):
+        file_extension = '.jpg'
+        try:
+            parsed_url = urlparse(image_url)
+            file_extension = os.path.splitext(parsed_url.path)[1] or '.jpg'
+        except:
+            pass
 
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        if len(image_urls) == 1:
+            filename = f"{category_type}_{safe_title}_{item_id[:8]}{file_extension}"
+        else:
+            filename = f"{category_type}_{safe_title}_{item_id[:8]}_{i + 1:02d}{file_extension}"
 
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        filepath = os.path.join(IMAGES_DIR, category_type, filename)
+        jobs.append((image_url, filepath, filename))
+    return jobs
 
-        # Парсим контент
-        content = parse_content_from_html(soup)
-        if not content or not content['title']:
-            logger.warning(f"❌ Не удалось получить контент с {page_url}")
-            return None
 
-        logger.info(f"📝 Найден: {content['title']}")
-
-        # Переводы (если есть API ключ)
-        translations = {}
-        if OPENAI_API_KEY:
-            logger.info("🌍 Выполняем переводы...")
-            for field in ['description_ru', 'symptoms_ru', 'development_conditions_ru', 'control_measures_ru']:
-                if content[field]:
-                    translations[field.replace('_ru', '_ua')] = translate_text_gpt(content[field], "ukrainian")
-                    translations[field.replace('_ru', '_en')] = translate_text_gpt(content[field], "english")
-                    time.sleep(0.5)
-                else:
-                    translations[field.replace('_ru', '_ua')] = ""
-                    translations[field.replace('_ru', '_en')] = ""
+def download_item_image(image_url, filepath, filename, referer):
+    """Скачивание одного изображения элемента; возвращает запись для CSV или None"""
+    # Имена файлов стабильны, поэтому изображения неизменившихся страниц уже лежат на диске
+    if (os.path.exists(filepath) and os.path.getsize(filepath) >= 1024) or download_image(image_url, filepath, referer):
+        return {
+            'image_url': image_url,
+            'image_path': filepath,
+            'filename': filename
+        }
+    return None
 
-            name_en = translate_text_gpt(content['title'], "english")
-        else:
-            logger.warning("⚠️ API ключ не найден - пропускаем переводы")
-            for field in ['description_ua', 'description_en', 'symptoms_ua', 'symptoms_en',
-                          'development_conditions_ua', 'development_conditions_en',
-                          'control_measures_ua', 'control_measures_en']:
-                translations[field] = ""
-            name_en = ""
-
-        # Скачиваем изображения
-        logger.info("📸 Скачиваем изображения...")
-        image_urls = extract_images_from_page(soup, page_url)
-
-        item_id = str(uuid.uuid4())
-        downloaded_images = []
-
-        if image_urls:
-            for i, image_url in enumerate(image_urls):
-                file_extension = '.jpg'
-                try:
-                    parsed_url = urlparse(image_url)
-                    file_extension = os.path.splitext(parsed_url.path)[1] or '.jpg'
-                except:
-                    pass
-
-                safe_title = "".join(c for c in content['title'] if c.isalnum() or c in (' ', '-', '_')).strip()
-                safe_title = safe_title.replace(' ', '_')[:30]
-
-                if len(image_urls) == 1:
-                    filename = f"{category_type}_{safe_title}_{item_id[:8]}{file_extension}"
-                else:
-                    filename = f"{category_type}_{safe_title}_{item_id[:8]}_{i + 1:02d}{file_extension}"
 
-                filepath = os.path.join(IMAGES_DIR, category_type, filename)
+# Поля записи, переводимые на украинский и английский, и суффиксы полей перевода
+TRANSLATED_FIELDS = ('description_ru', 'symptoms_ru', 'development_conditions_ru', 'control_measures_ru')
+TRANSLATION_SUFFIXES = {'ukrainian': '_ua', 'english': '_en'}
 
-                if download_image(image_url, filepath, page_url):
-                    downloaded_images.append({
-                        'image_url': image_url,
-                        'image_path': filepath,
-                        'filename': filename
-                    })
 
-                time.sleep(random.uniform(0.5, 1.5))
-
-        # Определяем культуры
-        text_for_crops = (content['description_ru'] + ' ' + content['symptoms_ru']).lower()
-        crops = []
-        crop_keywords = ['пшеница', 'рожь', 'ячмень', 'овес', 'кукуруза', 'подсолнечник', 'соя', 'рапс', 'свекла',
-                         'картофель']
-
-        for crop in crop_keywords:
-            if crop in text_for_crops:
-                crops.append(crop)
-
-        if not crops:
-            crops = ['пшеница']
-
-        # Формируем результат
-        result = {
-            'id': item_id,
-            'name': content['title'],
-            'name_en': name_en,
-            'scientific_name': content['scientific_name'],
-            'description_ru': content['description_ru'],
-            'description_ua': translations.get('description_ua', ''),
-            'description_en': translations.get('description_en', ''),
-            'symptoms_ru': content['symptoms_ru'],
-            'symptoms_ua': translations.get('symptoms_ua', ''),
-            'symptoms_en': translations.get('symptoms_en', ''),
-            'development_conditions_ru': content['development_conditions_ru'],
-            'development_conditions_ua': translations.get('development_conditions_ua', ''),
-            'development_conditions_en': translations.get('development_conditions_en', ''),
-            'control_measures_ru': content['control_measures_ru'],
-            'control_measures_ua': translations.get('control_measures_ua', ''),
-            'control_measures_en': translations.get('control_measures_en', ''),
-            'source_urls': page_url,
-            'crops': crops,
-            'images': downloaded_images,
-            'is_active': True,
-            'version': 1
-        }
+def missing_translations(record):
+    """Исходные тексты записи, у которых нет хотя бы одного перевода (название - под ключом 'name')"""
+    sources = {}
+    for field in TRANSLATED_FIELDS:
+        if record.get(field) and not all(record.get(field.replace('_ru', suffix))
+                                         for suffix in TRANSLATION_SUFFIXES.values()):
+            sources[field] = record[field]
+    if record.get('name') and not record.get('name_en'):
+        sources['name'] = record['name']
+    return sources
+
+
+def translate_record(record):
+    """Заполняет недостающие переводы записи и возвращает True, если переводы полные
+
+    Все поля переводятся одним пакетным запросом на язык, уже выполненные переводы берутся
+    из кеша; без API ключа или при ошибке запроса поле остается пустым до следующего запуска.
+    """
+    sources = missing_translations(record)
+    if not sources:
+        return True
+    translated = get_translator().translate_fields(sources, tuple(TRANSLATION_SUFFIXES))
+    for language, suffix in TRANSLATION_SUFFIXES.items():
+        for field, value in translated[language].items():
+            if field == 'name':
+                target = 'name_en' if language == 'english' else None
+            else:
+                target = field.replace('_ru', suffix)
+            if target and value and not record.get(target):
+                record[target] = value
+    return not missing_translations(record)
+
+
+def build_detail_record(page_source, page_url, category_type):
+    """Разбор и перевод детальной страницы; изображения не скачиваются"""
+    # Текст, научное название и изображения извлекаются за один разбор страницы
+    page = parse_detail_page(page_source, page_url)
+    content = page.content() if page else None
+    if not content or not content['title']:
+        logger.warning(f"❌ Не удалось получить контент с {page_url}")
+        return None
+
+    logger.info(f"📝 Найден: {content['title']}")
+
+    image_urls = page.image_urls
+    logger.info(f"✅ Найдено {len(image_urls)} изображений")
+
+    # Идентификатор выводится из URL, поэтому не меняется между запусками
+    item_id = stable_id(page_url)
+
+    # Определяем культуры: все формы названий из словаря ищутся за один проход по тексту
+    crops = get_term_tagger().tags(content['description_ru'] + ' ' + content['symptoms_ru'], KIND_CROP)
+    if not crops:
+        crops = ['пшеница']
+
+    # Формируем результат
+    result = {
+        'id': item_id,
+        'name': content['title'],
+        'name_en': '',
+        'scientific_name': content['scientific_name'],
+        'description_ru': content['description_ru'],
+        'description_ua': '',
+        'description_en': '',
+        'symptoms_ru': content['symptoms_ru'],
+        'symptoms_ua': '',
+        'symptoms_en': '',
+        'development_conditions_ru': content['development_conditions_ru'],
+        'development_conditions_ua': '',
+        'development_conditions_en': '',
+        'control_measures_ru': content['control_measures_ru'],
+        'control_measures_ua': '',
+        'control_measures_en': '',
+        'source_urls': page_url,
+        'crops': crops,
+        'images': [],
+        'image_urls': image_urls,
+        'is_active': True,
+        'version': 1
+    }
 
-        logger.info(f"✅ Обработано: {content['title']} ({len(downloaded_images)} изображений)")
+    # Переводы выполняются после сборки записи; недостающие дополняются при следующих запусках
+    logger.info("🌍 Выполняем переводы...")
+    translate_record(result)
+    return result
+
+
+def scrape_detail_page(page_url, category_type, download_images=True):
+    """Обработка детальной страницы
+
+    При download_images=False изображения не скачиваются: их URL возвращаются в поле
+    image_urls, а загрузку выполняет отдельная стадия process_category_universal.
+
+    В инкрементальном режиме страница запрашивается условным запросом (ETag/Last-Modified),
+    и для неизменившейся страницы возвращается сохраненная запись без разбора и перевода.
+    """
+    try:
+        logger.info(f"📄 Обрабатываем: {page_url}")
+        state = get_page_state(PARSER_VERSION) if INCREMENTAL else None
+        previous = state.get(page_url) if state else None
+        validators = (previous['etag'], previous['last_modified']) if previous else ()
+        page = get_page_fetcher('betaren', render_page_source, USER_AGENTS).fetch_page(page_url, *validators)
+
+        result = None
+        if previous and page.not_modified:
+            logger.info(f"♻️ Страница не изменилась (HTTP 304): {page_url}")
+        elif not page.html:
+            logger.warning(f"❌ Не удалось загрузить {page_url}")
+            return None
+        else:
+            fingerprint = page_fingerprint(page.html)
+            if previous and previous['content_hash'] == fingerprint:
+                logger.info(f"♻️ Содержимое страницы не изменилось: {page_url}")
+            else:
+                result = build_detail_record(page.html, page_url, category_type)
+                if result is None:
+                    return None
+                if state:
+                    state.save(page_url, fingerprint, result, page.etag, page.last_modified)
+
+        if result is None:
+            state.touch(page_url, page.etag, page.last_modified)
+            result = previous['record']
+            # Переводы, не выполненные в прошлый раз (нет API ключа, ошибка запроса), запрашиваются снова
+            if missing_translations(result):
+                logger.info("🌍 Дополняем недостающие переводы...")
+                before = dict(result)
+                translate_record(result)
+                if result != before:
+                    state.save(page_url, previous['content_hash'], result,
+                               page.etag or previous['etag'], page.last_modified or previous['last_modified'])
+
+        if download_images and result['image_urls']:
+            logger.info("📸 Скачиваем изображения...")
+            for job in build_image_jobs(result['id'], result['name'], result['image_urls'], category_type):
+                image = download_item_image(*job, page_url)
+                if image:
+                    result['images'].append(image)
+
+        logger.info(f"✅ Обработано: {result['name']} ({len(result['images'])} изображений)")
         return result
 
     except Exception as e:
         logger.error(f"❌ Ошибка обработки {page_url}: {e}")
         return None
-    finally:
-        driver.quit()
 
 
-def save_data_to_csv(data, category_type):
-    """Сохранение данных в CSV файлы"""
-    if not data:
-        logger.warning(f"❌ Нет данных для сохранения в {category_type}")
-        return
-
-    logger.info(f"💾 Сохраняем {len(data)} записей для {category_type}")
-
-    table_mapping = {
-        'diseases': 'disease',
-        'pests': 'vermin',
-        'weeds': 'weed'
+TABLE_NAMES = {
+    'diseases': 'disease',
+    'pests': 'vermin',
+    'weeds': 'weed'
+}
+
+
+def csv_tables(category_type):
+    """Файлы CSV категории: имя таблицы -> (путь, поля)"""
+    table_name = TABLE_NAMES.get(category_type, category_type[:-1])
+
+    if category_type == 'diseases':
+        description_fields = [
+            'id', 'disease_id', 'description_ru', 'description_ua', 'description_en',
+            'symptoms_ru', 'symptoms_ua', 'symptoms_en',
+            'development_conditions_ru', 'development_conditions_ua', 'development_conditions_en',
+            'control_measures_ru', 'control_measures_ua', 'control_measures_en',
+            'photo_path', 'source_urls', 'version'
+        ]
+    elif category_type == 'pests':
+        description_fields = [
+            'id', 'vermin_id', 'description_ru', 'description_ua', 'description_en',
+            'damage_symptoms_ru', 'damage_symptoms_ua', 'damage_symptoms_en',
+            'biology_ru', 'biology_ua', 'biology_en',
+            'control_measures_ru', 'control_measures_ua', 'control_measures_en',
+            'photo_path', 'source_urls', 'version'
+        ]
+    else:  # weeds
+        description_fields = [
+            'id', 'weed_id', 'description_ru', 'description_ua', 'description_en',
+            'biological_features_ru', 'biological_features_ua', 'biological_features_en',
+            'harmfulness_ru', 'harmfulness_ua', 'harmfulness_en',
+            'control_measures_ru', 'control_measures_ua', 'control_measures_en',
+            'photo_path', 'source_urls', 'version'
+        ]
+
+    return {
+        'main': (os.path.join(OUTPUT_DIR, f'{category_type}.csv'),
+                 ['id', 'name', 'name_en', 'scientific_name', 'is_active']),
+        'descriptions': (os.path.join(OUTPUT_DIR, f'{table_name}_descriptions.csv'), description_fields),
+        'images': (os.path.join(OUTPUT_DIR, f'{table_name}_images.csv'),
+                   ['id', f'{table_name}_id', 'image_path', 'image_url', 'version']),
+        'crops': (os.path.join(OUTPUT_DIR, f'{table_name}_crops.csv'), [f'{table_name}_id', 'crops'])
     }
 
-    table_name = table_mapping.get(category_type, category_type[:-1])
 
-    # Файлы CSV
-    main_csv = os.path.join(OUTPUT_DIR, f'{category_type}.csv')
-    descriptions_csv = os.path.join(OUTPUT_DIR, f'{table_name}_descriptions.csv')
-    images_csv = os.path.join(OUTPUT_DIR, f'{table_name}_images.csv')
-    crops_csv = os.path.join(OUTPUT_DIR, f'{table_name}_crops.csv')
+def item_rows(item, category_type):
+    """Строки всех четырех CSV файлов для одного элемента"""
+    table_name = TABLE_NAMES.get(category_type, category_type[:-1])
 
     # 1. Основная таблица
-    with open(main_csv, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = ['id', 'name', 'name_en', 'scientific_name', 'is_active']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for item in data:
-            writer.writerow({
-                'id': item['id'],
-                'name': item['name'],
-                'name_en': item['name_en'],
-                'scientific_name': item['scientific_name'],
-                'is_active': item['is_active']
-            })
+    main_row = {
+        'id': item['id'],
+        'name': item['name'],
+        'name_en': item['name_en'],
+        'scientific_name': item['scientific_name'],
+        'is_active': item['is_active']
+    }
 
     # 2. Описания
-    with open(descriptions_csv, 'w', encoding='utf-8', newline='') as f:
-        if category_type == 'diseases':
-            fieldnames = [
-                'id', 'disease_id', 'description_ru', 'description_ua', 'description_en',
-                'symptoms_ru', 'symptoms_ua', 'symptoms_en',
-                'development_conditions_ru', 'development_conditions_ua', 'development_conditions_en',
-                'control_measures_ru', 'control_measures_ua', 'control_measures_en',
-                'photo_path', 'source_urls', 'version'
-            ]
-        elif category_type == 'pests':
-            fieldnames = [
-                'id', 'vermin_id', 'description_ru', 'description_ua', 'description_en',
-                'damage_symptoms_ru', 'damage_symptoms_ua', 'damage_symptoms_en',
-                'biology_ru', 'biology_ua', 'biology_en',
-                'control_measures_ru', 'control_measures_ua', 'control_measures_en',
-                'photo_path', 'source_urls', 'version'
-            ]
-        else:  # weeds
-            fieldnames = [
-                'id', 'weed_id', 'description_ru', 'description_ua', 'description_en',
-                'biological_features_ru', 'biological_features_ua', 'biological_features_en',
-                'harmfulness_ru', 'harmfulness_ua', 'harmfulness_en',
-                'control_measures_ru', 'control_measures_ua', 'control_measures_en',
-                'photo_path', 'source_urls', 'version'
-            ]
-
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+    main_photo_path = item['images'][0]['image_path'] if item['images'] else ""
+
+    base_row = {
+        'id': stable_id(item['id'], 'description'),
+        f'{table_name}_id': item['id'],
+        'description_ru': item['description_ru'],
+        'description_ua': item['description_ua'],
+        'description_en': item['description_en'],
+        'control_measures_ru': item['control_measures_ru'],
+        'control_measures_ua': item['control_measures_ua'],
+        'control_measures_en': item['control_measures_en'],
+        'photo_path': main_photo_path,
+        'source_urls': item['source_urls'],
+        'version': item['version']
+    }
 
-        for item in data:
-            main_photo_path = item['images'][0]['image_path'] if item['images'] else ""
-
-            base_row = {
-                'id': str(uuid.uuid4()),
-                f'{table_name}_id': item['id'],
-                'description_ru': item['description_ru'],
-                'description_ua': item['description_ua'],
-                'description_en': item['description_en'],
-                'control_measures_ru': item['control_measures_ru'],
-                'control_measures_ua': item['control_measures_ua'],
-                'control_measures_en': item['control_measures_en'],
-                'photo_path': main_photo_path,
-                'source_urls': item['source_urls'],
-                'version': item['version']
-            }
-
-            if category_type == 'diseases':
-                base_row.update({
-                    'symptoms_ru': item['symptoms_ru'],
-                    'symptoms_ua': item['symptoms_ua'],
-                    'symptoms_en': item['symptoms_en'],
-                    'development_conditions_ru': item['development_conditions_ru'],
-                    'development_conditions_ua': item['development_conditions_ua'],
-                    'development_conditions_en': item['development_conditions_en']
-                })
-            elif category_type == 'pests':
-                base_row.update({
-                    'damage_symptoms_ru': item['symptoms_ru'],
-                    'damage_symptoms_ua': item['symptoms_ua'],
-                    'damage_symptoms_en': item['symptoms_en'],
-                    'biology_ru': item['development_conditions_ru'],
-                    'biology_ua': item['development_conditions_ua'],
-                    'biology_en': item['development_conditions_en']
-                })
-            else:  # weeds
-                base_row.update({
-                    'biological_features_ru': item['symptoms_ru'],
-                    'biological_features_ua': item['symptoms_ua'],
-                    'biological_features_en': item['symptoms_en'],
-                    'harmfulness_ru': item['development_conditions_ru'],
-                    'harmfulness_ua': item['development_conditions_ua'],
-                    'harmfulness_en': item['development_conditions_en']
-                })
-
-            writer.writerow(base_row)
+    if category_type == 'diseases':
+        base_row.update({
+            'symptoms_ru': item['symptoms_ru'],
+            'symptoms_ua': item['symptoms_ua'],
+            'symptoms_en': item['symptoms_en'],
+            'development_conditions_ru': item['development_conditions_ru'],
+            'development_conditions_ua': item['development_conditions_ua'],
+            'development_conditions_en': item['development_conditions_en']
+        })
+    elif category_type == 'pests':
+        base_row.update({
+            'damage_symptoms_ru': item['symptoms_ru'],
+            'damage_symptoms_ua': item['symptoms_ua'],
+            'damage_symptoms_en': item['symptoms_en'],
+            'biology_ru': item['development_conditions_ru'],
+            'biology_ua': item['development_conditions_ua'],
+            'biology_en': item['development_conditions_en']
+        })
+    else:  # weeds
+        base_row.update({
+            'biological_features_ru': item['symptoms_ru'],
+            'biological_features_ua': item['symptoms_ua'],
+            'biological_features_en': item['symptoms_en'],
+            'harmfulness_ru': item['development_conditions_ru'],
+            'harmfulness_ua': item['development_conditions_ua'],
+            'harmfulness_en': item['development_conditions_en']
+        })
 
     # 3. Изображения
-    with open(images_csv, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = ['id', f'{table_name}_id', 'image_path', 'image_url', 'version']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for item in data:
-            for image in item['images']:
-                writer.writerow({
-                    'id': str(uuid.uuid4()),
-                    f'{table_name}_id': item['id'],
-                    'image_path': image['image_path'],
-                    'image_url': image['image_url'],
-                    'version': 1
-                })
+    image_rows = [{
+        'id': stable_id(item['id'], 'image', image['image_url']),
+        f'{table_name}_id': item['id'],
+        'image_path': image['image_path'],
+        'image_url': image['image_url'],
+        'version': 1
+    } for image in item['images']]
 
     # 4. Культуры
-    with open(crops_csv, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = [f'{table_name}_id', 'crops']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+    crop_rows = [{f'{table_name}_id': item['id'], 'crops': crop} for crop in item['crops']]
+
+    return {'main': [main_row], 'descriptions': [base_row], 'images': image_rows, 'crops': crop_rows}
+
+
+def open_csv_writer(category_type, resume=True):
+    """Потоковая запись CSV категории с контрольными точками для продолжения после сбоя"""
+    return StreamingCsvWriter(
+        csv_tables(category_type),
+        os.path.join(OUTPUT_DIR, f'{category_type}.checkpoint.json'),
+        checkpoint_every=CHECKPOINT_EVERY,
+        resume=resume
+    )
+
 
+def save_data_to_csv(data, category_type):
+    """Сохранение данных в CSV файлы"""
+    if not data:
+        logger.warning(f"❌ Нет данных для сохранения в {category_type}")
+        return
+
+    logger.info(f"💾 Сохраняем {len(data)} записей для {category_type}")
+
+    with open_csv_writer(category_type, resume=False) as writer:
         for item in data:
-            for crop in item['crops']:
-                writer.writerow({
-                    f'{table_name}_id': item['id'],
-                    'crops': crop
-                })
+            writer.write_item(item_rows(item, category_type))
 
     logger.info(f"✅ Данные сохранены в 4 CSV файла для {category_type}")
 
 
 def process_category_universal(category_type, max_items=None):
-    """УНИВЕРСАЛЬНАЯ обработка категории"""
+    """УНИВЕРСАЛЬНАЯ обработка категории
+
+    Элементы записываются в CSV по мере готовности; возвращается число элементов в CSV.
+    """
     logger.info(f"🚀 УНИВЕРСАЛЬНАЯ обработка: {category_type}")
 
     # URL главных категорий
@@ -721,72 +605,112 @@ def process_category_universal(category_type, max_items=None):
     main_url = main_urls.get(category_type)
     if not main_url:
         logger.error(f"❌ Неизвестная категория: {category_type}")
-        return []
+        return 0
+
+    # Паузы между запросами к betaren.ru задает общий ограничитель по хостам
+    if SLEEP_BETWEEN_REQUESTS > 0:
+        get_rate_limiter().configure_host(BASE_URL, rate=1.0 / SLEEP_BETWEEN_REQUESTS, burst=1)
 
     # Получаем подкатегории или прямые ссылки
     subcategories = get_subcategory_links(main_url)
 
     if not subcategories:
         logger.error(f"❌ Не найдено подкатегорий для {category_type}")
-        return []
-
-    # Собираем все детальные ссылки
-    all_detail_links = []
-
-    for subcat in subcategories:
-        if category_type == 'weeds':
-            # Для сорняков - это уже детальные ссылки
-            all_detail_links.append(subcat)
-        else:
-            # Для болезней и вредителей - получаем детальные ссылки из культур
-            detail_links = get_detail_links_from_culture(subcat['url'])
-            all_detail_links.extend(detail_links)
-            time.sleep(1)
-
-    # Ограничиваем если нужно
-    if max_items and len(all_detail_links) > max_items:
-        all_detail_links = all_detail_links[:max_items]
-        logger.info(f"⚠️ Ограничиваем до {max_items} элементов")
-
-    logger.info(f"📊 Будем обрабатывать {len(all_detail_links)} ссылок для {category_type}")
-
-    # Обрабатываем каждую детальную ссылку
-    processed_data = []
-
-    for i, link in enumerate(all_detail_links, 1):
-        logger.info(f"📄 [{i}/{len(all_detail_links)}] Обрабатываем: {link['name']}")
-
-        try:
-            result = scrape_detail_page(link['url'], category_type)
+        return 0
+
+    # Конвейер: поиск ссылок -> детальные страницы (DETAIL_WORKERS) -> изображения (IMAGE_WORKERS).
+    # Результаты собираются в порядке обнаружения ссылок, поэтому CSV не зависит от порядка завершения.
+    # Строки каждого элемента дописываются в CSV сразу, в памяти держится только очередь конвейера
+    writer = open_csv_writer(category_type, resume=RESUME)
+    done_ids = writer.read_column('main', 'id') if writer.resumed else set()
+    written = 0
+    pending = deque()
+    max_pending = DETAIL_WORKERS * 2
+
+    with writer, \
+            ThreadPoolExecutor(max_workers=DETAIL_WORKERS, thread_name_prefix='detail') as detail_executor, \
+            ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image') as image_executor:
+
+        def scrape_stage(link):
+            result = scrape_detail_page(link['url'], category_type, download_images=False)
+            if not result:
+                return None, []
+            jobs = build_image_jobs(result['id'], result['name'], result['image_urls'], category_type)
+            if jobs:
+                logger.info(f"📸 В очередь загрузки: {len(jobs)} изображений для {result['name']}")
+            image_futures = [image_executor.submit(download_item_image, *job, link['url']) for job in jobs]
+            return result, image_futures
+
+        def collect(index, link, future):
+            nonlocal written
+            try:
+                result, image_futures = future.result()
+                if result:
+                    result['images'] = [image for image in (f.result() for f in image_futures) if image]
+            except Exception as e:
+                logger.error(f"❌ Ошибка: {e}")
+                result = None
 
             if result:
-                processed_data.append(result)
-                logger.info(f"✅ Успешно: {result['name']}")
-
-                # Промежуточное сохранение каждые 5 элементов
-                if len(processed_data) % 5 == 0:
-                    save_data_to_csv(processed_data, category_type)
+                writer.write_item(item_rows(result, category_type))
+                written += 1
+                logger.info(f"✅ [{index}] Успешно: {result['name']} ({len(result['images'])} изображений)")
             else:
-                logger.warning(f"❌ Не обработано: {link['name']}")
+                logger.warning(f"❌ [{index}] Не обработано: {link['name']}")
+
+        def is_ready(future):
+            if not future.done():
+                return False
+            if future.exception():
+                return True
+            return all(f.done() for f in future.result()[1])
+
+        def iter_detail_links():
+            for subcat in subcategories:
+                if category_type == 'weeds':
+                    # Для сорняков - это уже детальные ссылки
+                    yield subcat
+                else:
+                    # Для болезней и вредителей - получаем детальные ссылки из культур
+                    yield from get_detail_links_from_culture(subcat['url'])
+
+        submitted = 0
+        seen_urls = set()
+        for link in iter_detail_links():
+            # Одна и та же страница встречается у нескольких культур, а ее идентификатор выводится из URL
+            if link['url'] in seen_urls:
+                continue
+            seen_urls.add(link['url'])
+            # Ограничиваем если нужно
+            if max_items and submitted >= max_items:
+                logger.info(f"⚠️ Ограничиваем до {max_items} элементов")
+                break
+            submitted += 1
+            if stable_id(link['url']) in done_ids:
+                # Уже записан до прерывания предыдущего запуска
+                continue
+            logger.info(f"📄 [{submitted}] В очередь: {link['name']}")
+            pending.append((submitted, link, detail_executor.submit(scrape_stage, link)))
 
-            time.sleep(SLEEP_BETWEEN_REQUESTS)
+            # Ограниченная очередь: поиск ссылок не уходит далеко вперед обработки
+            while pending and (len(pending) >= max_pending or is_ready(pending[0][2])):
+                collect(*pending.popleft())
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка: {e}")
-            continue
+        logger.info(f"📊 Найдено {submitted} ссылок для {category_type}, завершаем обработку")
+        while pending:
+            collect(*pending.popleft())
 
-    # Финальное сохранение
-    if processed_data:
-        save_data_to_csv(processed_data, category_type)
-        logger.info(f"🎉 {category_type} завершено! Обработано: {len(processed_data)} элементов")
+    if writer.items:
+        logger.info(f"🎉 {category_type} завершено! Обработано: {written}, всего в CSV: {writer.items} элементов")
     else:
         logger.warning(f"❌ Не удалось обработать ни одного элемента для {category_type}")
 
-    return processed_data
+    return writer.items
 
 
 def main():
     """Основная функция"""
+    setup_logging("betaren_universal.log", fmt='%(asctime)s - %(levelname)s - %(message)s', mode='w')
     print("🔧 УНИВЕРСАЛЬНЫЙ скрапер Betaren.ru")
     print("   ✅ Обходит ВСЕ культуры и подкатегории")
     print("   ✅ Собирает ВСЕ болезни, вредители, сорняки")
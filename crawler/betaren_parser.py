@@ -0,0 +1,226 @@
+"""
+Extraction of content, images and links from Betaren pages with lxml.
+A page is parsed once and all selectors are XPath expressions compiled at
+import time, so parsing a detail page costs one pass of the C parser plus a
+few compiled queries instead of repeated BeautifulSoup tree searches.
+"""
+
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from term_tagger import KIND_SECTION, get_term_tagger
+
+logger = logging.getLogger("betaren_parser")
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# Теги, текст которых не относится к содержимому страницы
+SKIPPED_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+
+# Разделы детальной страницы (ключи заголовков в словаре term_tagger) и поля записи
+SECTION_FIELDS = {
+    'description': 'description_ru',
+    'symptoms': 'symptoms_ru',
+    'development': 'development_conditions_ru',
+    'control': 'control_measures_ru',
+}
+
+
+def _class(name: str) -> str:
+    """XPath condition matching an element with the CSS class name."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_TITLE = etree.XPath('(//h1)[1]')
+_DETAIL_TEXT = etree.XPath(f"(//div[{_class('harmful-detail__text')}])[1]")
+_SCIENTIFIC_NAME = etree.XPath('(.//i)[1]')
+_TEXT_BLOCKS = etree.XPath('.//*[self::p or self::div or self::h3]')
+_CONTENT_AREA = etree.XPath(f"(//div[{_class('content__inner')}])[1]")
+_MAIN = etree.XPath('(//main)[1]')
+_MAIN_IMAGE = etree.XPath(f"(//div[{_class('harmful-detail__picture')}]//img)[1]")
+_GALLERY_IMAGES = etree.XPath(f"//div[{_class('swiper-slide')}]//img[{_class('gallery__img')}]")
+_GALLERY_LINKS = etree.XPath(f"//a[{_class('gallery__link')}][@href]")
+_ALL_IMAGES = etree.XPath('//img')
+_AGRO_ITEMS = etree.XPath(f"//div[{_class('agro-item')}]")
+_ITEM_TITLE_LINK = etree.XPath(f"(.//a[{_class('title')}])[1]")
+_ITEM_LINK = etree.XPath('(.//a)[1]')
+_STRINGS = etree.XPath('.//text()')
+
+
+class DetailPage(NamedTuple):
+    """Fields of a disease, pest or weed page and the URLs of its images."""
+    title: str
+    scientific_name: str
+    description_ru: str
+    symptoms_ru: str
+    development_conditions_ru: str
+    control_measures_ru: str
+    image_urls: List[str]
+
+    def content(self) -> Dict[str, str]:
+        """Returns the text fields as a dict (without image_urls)."""
+        fields = self._asdict()
+        del fields['image_urls']
+        return fields
+
+
+def parse_html(page_source: str) -> Optional[etree._Element]:
+    """Parses a page; returns None for an empty or unparsable document."""
+    try:
+        return lxml_html.document_fromstring(page_source)
+    except (etree.ParserError, ValueError) as e:
+        logger.warning(f"Не удалось разобрать страницу: {e}")
+        return None
+
+
+def _strings(element: etree._Element) -> List[str]:
+    """Returns the stripped non-empty text pieces of an element, skipping scripts and styles."""
+    result = []
+    for text in _STRINGS(element):
+        parent = text.getparent()
+        if text.is_text and parent.tag in SKIPPED_TEXT_TAGS:
+            continue
+        text = text.strip()
+        if text:
+            result.append(text)
+    return result
+
+
+def text_of(element: Optional[etree._Element], separator: str = '') -> str:
+    """Returns the text of an element like BeautifulSoup get_text(separator, strip=True)."""
+    if element is None:
+        return ''
+    return separator.join(_strings(element))
+
+
+def _first(query: etree.XPath, element: etree._Element) -> Optional[etree._Element]:
+    found = query(element)
+    return found[0] if found else None
+
+
+def split_sections(all_content: str) -> Dict[str, str]:
+    """
+    Splits the text of a detail page into description, symptoms, development conditions
+    and control measures by the section headings of the term dictionary.
+
+    Returns:
+        Mapping of content field name to text; if no heading is found, the whole
+        text (up to 1500 characters) is the description
+    """
+    tagger = get_term_tagger()
+    sections = {field: [] for field in SECTION_FIELDS.values()}
+    current = 'description'
+    for line in all_content.split('\n\n'):
+        line = line.strip()
+        if len(line) < 20:
+            continue
+        heading = tagger.first_tag(line, KIND_SECTION)
+        if heading:
+            current = heading
+            continue
+        sections[SECTION_FIELDS[current]].append(line)
+
+    result = {field: ' '.join(lines) for field, lines in sections.items()}
+    if not any(result[SECTION_FIELDS[section]] for section in ('symptoms', 'development', 'control')):
+        result['description_ru'] = all_content[:1500]
+    return result
+
+
+def extract_image_urls(root: etree._Element, page_url: str) -> List[str]:
+    """
+    Returns the image URLs of a detail page without duplicates.
+
+    Order: main picture, gallery images, full-size gallery links, then any other
+    image with a known extension.
+    """
+    image_urls = []
+    seen = set()
+
+    def add(src: str, check_extension: bool) -> None:
+        url = urljoin(page_url, src)
+        if url in seen or (check_extension and not any(ext in url.lower() for ext in IMAGE_EXTENSIONS)):
+            return
+        seen.add(url)
+        image_urls.append(url)
+
+    main_image = _first(_MAIN_IMAGE, root)
+    if main_image is not None and main_image.get('src'):
+        add(main_image.get('src'), False)
+    for img in _GALLERY_IMAGES(root):
+        if img.get('src'):
+            add(img.get('src'), False)
+    for link in _GALLERY_LINKS(root):
+        href = link.get('href', '')
+        if any(ext in href.lower() for ext in IMAGE_EXTENSIONS):
+            add(href, False)
+    for img in _ALL_IMAGES(root):
+        if img.get('src'):
+            add(img.get('src'), True)
+    return image_urls
+
+
+def parse_detail_page(page_source: str, page_url: str) -> Optional[DetailPage]:
+    """
+    Extracts the title, scientific name, text sections and images of a detail page.
+
+    Args:
+        page_source: Page HTML
+        page_url: Page URL (base for relative image URLs)
+
+    Returns:
+        Parsed page, or None if the document could not be parsed
+    """
+    root = parse_html(page_source)
+    if root is None:
+        return None
+
+    detail_text = _first(_DETAIL_TEXT, root)
+    scientific_name = text_of(_first(_SCIENTIFIC_NAME, detail_text)) if detail_text is not None else ''
+
+    all_content = ''
+    if detail_text is not None:
+        for block in _TEXT_BLOCKS(detail_text):
+            text = text_of(block)
+            if len(text) > 10:
+                all_content += text + "\n\n"
+    if not all_content:
+        content_area = _first(_CONTENT_AREA, root)
+        if content_area is None:
+            content_area = _first(_MAIN, root)
+        all_content = text_of(content_area, '\n\n')
+
+    sections = split_sections(all_content)
+    return DetailPage(
+        title=text_of(_first(_TITLE, root)),
+        scientific_name=scientific_name,
+        description_ru=sections['description_ru'].strip(),
+        symptoms_ru=sections['symptoms_ru'].strip(),
+        development_conditions_ru=sections['development_conditions_ru'].strip(),
+        control_measures_ru=sections['control_measures_ru'].strip(),
+        image_urls=extract_image_urls(root, page_url)
+    )
+
+
+def extract_agro_links(page_source: str) -> List[Tuple[str, str]]:
+    """
+    Returns the links of the catalogue cards (div.agro-item) of a listing page.
+
+    The link of a card is its a.title, or its first link.
+
+    Returns:
+        (link text, href) pairs in page order
+    """
+    root = parse_html(page_source)
+    if root is None:
+        return []
+    links = []
+    for item in _AGRO_ITEMS(root):
+        link = _first(_ITEM_TITLE_LINK, item)
+        if link is None:
+            link = _first(_ITEM_LINK, item)
+        if link is not None and link.get('href'):
+            links.append((text_of(link), link.get('href')))
+    return links
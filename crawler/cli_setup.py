@@ -0,0 +1,35 @@
+"""
+Process setup for the crawler command-line scripts.
+Importing a crawler module configures nothing: log files, console handlers
+and the console encoding are set up by the script's main() through
+setup_logging, so tests and other modules can import the scrapers freely.
+"""
+
+import sys
+import logging
+from typing import Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def setup_logging(log_file: Optional[str] = None, level: int = logging.INFO, fmt: str = DEFAULT_FORMAT,
+                  mode: str = 'a') -> None:
+    """
+    Configures root logging to the console and optionally to a file.
+
+    Does nothing if the root logger already has handlers, so the first script
+    to call it (or a test runner) keeps its configuration.
+
+    Args:
+        log_file: Log file, or None for console only
+        level: Logging level
+        fmt: Record format
+        mode: File open mode ('a' to append, 'w' to start a new log)
+    """
+    # Кириллица в консоли Windows выводится корректно только в UTF-8
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8')
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file, encoding='utf-8', mode=mode))
+    logging.basicConfig(level=level, format=fmt, handlers=handlers)
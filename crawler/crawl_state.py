@@ -0,0 +1,180 @@
+"""
+Persistent crawl state for ImageCrawler.
+Records finished risks, resolved search queries, discovered image URLs and the
+outcome of every download in a SQLite file, so an interrupted crawl resumes
+where it stopped instead of starting over.
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("crawl_state")
+
+STATE_FILE_NAME = "crawl_state.db"
+
+# Исходы загрузки URL
+URL_PENDING = 'pending'
+URL_DOWNLOADED = 'downloaded'
+URL_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS risks (
+    risk_key TEXT PRIMARY KEY,
+    max_images INTEGER NOT NULL,
+    downloaded INTEGER NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    engine TEXT NOT NULL,
+    query TEXT NOT NULL,
+    url_count INTEGER NOT NULL,
+    requested INTEGER NOT NULL DEFAULT 0,
+    resolved_at REAL NOT NULL,
+    PRIMARY KEY (engine, query)
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    query TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    path TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_by_query ON urls (engine, query, position);
+"""
+
+
+class CrawlState:
+    """
+    Thread-safe SQLite store of crawl progress.
+
+    A risk is finished once it has enough images for the requested limit, a query
+    is resolved once it returned at least one URL, and a URL is never requested
+    again after its download succeeded or failed permanently.
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(queries)")}
+        if 'requested' not in columns:
+            # Файл состояния от предыдущей версии
+            self._conn.execute("ALTER TABLE queries ADD COLUMN requested INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
+
+    def is_risk_finished(self, risk_key: str, max_images: int) -> bool:
+        """Returns True if the risk was finished with at least the given image limit."""
+        with self._lock:
+            row = self._conn.execute("SELECT max_images, downloaded FROM risks WHERE risk_key = ?",
+                                     (risk_key,)).fetchone()
+        return row is not None and (row[0] >= max_images or row[1] >= max_images)
+
+    def finish_risk(self, risk_key: str, max_images: int, downloaded: int) -> None:
+        """Marks a risk as finished for the given image limit."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO risks VALUES (?, ?, ?, ?)",
+                               (risk_key, max_images, downloaded, time.time()))
+            self._conn.commit()
+
+    def get_query_urls(self, engine: str, query: str, max_images: int) -> Optional[List[str]]:
+        """
+        Returns the URLs found by a resolved query in search order.
+
+        Returns None if the query has not been resolved, or if it was resolved for
+        fewer images than requested now and its result may have been truncated.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT url_count, requested FROM queries WHERE engine = ? AND query = ?",
+                                     (engine, query)).fetchone()
+            if row is None or (row[0] < max_images and row[1] < max_images):
+                return None
+            rows = self._conn.execute("SELECT url FROM urls WHERE engine = ? AND query = ? ORDER BY position",
+                                      (engine, query)).fetchall()
+        return [row[0] for row in rows]
+
+    def save_query(self, engine: str, query: str, urls: List[str], requested: int) -> None:
+        """
+        Records the result of a search query and the URLs it discovered.
+
+        Empty results are not recorded as resolved: they are usually caused by
+        blocking or a captcha, so the query is retried on the next run.
+
+        Args:
+            engine: Search engine name
+            query: Search query
+            urls: URLs in search order
+            requested: Maximum number of URLs the search was asked for
+        """
+        if not urls:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO urls (url, engine, query, position, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(url, engine, query, position, URL_PENDING, now) for position, url in enumerate(urls)]
+            )
+            self._conn.execute("INSERT OR REPLACE INTO queries (engine, query, url_count, requested, resolved_at) "
+                               "VALUES (?, ?, ?, ?, ?)", (engine, query, len(urls), requested, now))
+            self._conn.commit()
+
+    def url_statuses(self, urls: List[str]) -> Dict[str, str]:
+        """Returns the recorded status of each known URL."""
+        statuses = {}
+        with self._lock:
+            # SQLite ограничивает число параметров в запросе
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                statuses.update(self._conn.execute(
+                    f"SELECT url, status FROM urls WHERE url IN ({placeholders})", chunk
+                ).fetchall())
+        return statuses
+
+    def is_url_done(self, url: str) -> bool:
+        """Returns True if the URL was already downloaded or is known to be bad."""
+        return self.url_statuses([url]).get(url, URL_PENDING) != URL_PENDING
+
+    def record_url(self, url: str, path: Optional[Path], success: bool) -> None:
+        """
+        Records the outcome of a download.
+
+        Transient failures should not be recorded, so the URL is retried by the next crawl.
+        """
+        status = URL_DOWNLOADED if success else URL_FAILED
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO urls (url, engine, query, position, status, path, updated_at) VALUES (?, '', '', 0, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET status = excluded.status, path = excluded.path, "
+                "updated_at = excluded.updated_at",
+                (url, status, str(path) if success and path else None, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of finished risks, resolved queries and URLs per status."""
+        with self._lock:
+            stats = {
+                'risks': self._conn.execute("SELECT COUNT(*) FROM risks").fetchone()[0],
+                'queries': self._conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0],
+            }
+            stats.update(self._conn.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall())
+        return stats
@@ -8,51 +8,16 @@ import time
 import uuid
 import logging
 import random
-import requests
 from datetime import datetime
-from bs4 import BeautifulSoup
-import dotenv
 from urllib.parse import urljoin, urlparse
-from tqdm import tqdm
-import socket
-import socks
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# Загрузка переменных окружения
-dotenv.load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("../agriscouting_parse_log.txt", encoding='utf-8', mode='w'),
-        logging.StreamHandler()
-    ]
-)
+import http_client
+from rate_limiter import get_rate_limiter
+from cli_setup import setup_logging
+
 logger = logging.getLogger("agriscouting_parse")
 
 # Папка для результатов
 OUTPUT_DIR = "../agriscouting_data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-for folder in ["diseases", "pests", "weeds"]:
-    os.makedirs(os.path.join(OUTPUT_DIR, "images", folder), exist_ok=True)
-
-# Настройка прокси
-proxy_url = os.getenv("HTTP_PROXY", "")
-if proxy_url:
-    logger.info(f"Используется прокси: {proxy_url}")
-    parsed_proxy = urlparse(proxy_url)
-    proxy_host = parsed_proxy.hostname
-    proxy_port = parsed_proxy.port or 8080
-    proxies = {"http": proxy_url, "https": proxy_url}
-    if parsed_proxy.scheme == 'socks5':
-        socks.set_default_proxy(socks.SOCKS5, proxy_host, proxy_port, username=parsed_proxy.username, password=parsed_proxy.password)
-        socket.socket = socks.socksocket
-else:
-    proxies = None
-    logger.info("Прокси не используется. Для доступа к .ru используйте VPN.")
 
 # User-Agents для эмуляции браузера
 USER_AGENTS = [
@@ -98,10 +63,32 @@ TARGET_SITES = {
     ]
 }
 
+def init():
+    """Загружает .env, настраивает логирование и создает папки результатов"""
+    import dotenv
+    import urllib3
+
+    dotenv.load_dotenv()
+    setup_logging("../agriscouting_parse_log.txt", mode='w')
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for folder in ["diseases", "pests", "weeds"]:
+        os.makedirs(os.path.join(OUTPUT_DIR, "images", folder), exist_ok=True)
+
+    # Прокси (HTTP_PROXY, в том числе socks5://) настраивается в http_client
+    if os.getenv("HTTP_PROXY"):
+        logger.info(f"Используется прокси: {os.getenv('HTTP_PROXY')}")
+    else:
+        logger.info("Прокси не используется. Для доступа к .ru используйте VPN.")
+
 def get_random_user_agent():
     return random.choice(USER_AGENTS)
 
 def get_soup_from_url(url, max_retries=3):
+    from bs4 import BeautifulSoup
+
+    limiter = get_rate_limiter()
     for retry in range(max_retries):
         try:
             headers = {
@@ -110,18 +97,18 @@ def get_soup_from_url(url, max_retries=3):
                 'Accept-Language': 'en-US,en;q=0.9,ru;q=0.8,uk;q=0.7',
                 'Referer': 'https://www.google.com/'
             }
-            response = requests.get(url, headers=headers, timeout=15, proxies=proxies, verify=False)
+            response = http_client.get(url, headers=headers, timeout=15, verify=False)
             logger.info(f"Запрос: {url} | Статус: {response.status_code}")
             if response.status_code == 200:
                 if 'captcha' in response.text.lower():
                     logger.warning(f"Обнаружена CAPTCHA на {url}")
-                    time.sleep(5)
+                    # CAPTCHA - признак слишком частых запросов, замедляем хост
+                    limiter.report(url, 429)
                     continue
                 encoding = response.encoding if response.encoding != 'ISO-8859-1' else 'utf-8'
                 return BeautifulSoup(response.content, 'html.parser', from_encoding=encoding)
             elif response.status_code in [403, 429]:
                 logger.warning(f"Ошибка {response.status_code} на {url}")
-                time.sleep(2 + retry)
             else:
                 logger.warning(f"Ошибка {response.status_code} на {url}")
                 return None
@@ -152,7 +139,7 @@ def download_image(url, folder, filename, source_url):
         url = urljoin(base_url, url)
     try:
         headers = {'User-Agent': get_random_user_agent(), 'Referer': source_url}
-        response = requests.get(url, headers=headers, timeout=10, proxies=proxies, verify=False)
+        response = http_client.get(url, headers=headers, timeout=10, verify=False)
         if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
             with open(file_path, 'wb') as f:
                 f.write(response.content)
@@ -164,6 +151,8 @@ def download_image(url, folder, filename, source_url):
     return None
 
 def parse_syngenta_diseases(base_url, crops):
+    from tqdm import tqdm
+
     diseases = []
     descriptions = []
     images = []
@@ -270,6 +259,8 @@ def parse_syngenta_diseases(base_url, crops):
     return diseases, descriptions, images, disease_crops
 
 def parse_betaren(base_url, data_type, crops):
+    from tqdm import tqdm
+
     items = []
     descriptions = []
     images = []
@@ -439,6 +430,7 @@ def save_to_csv(data, filename, fieldnames):
         logger.error(f"Ошибка сохранения в {filename}: {e}")
 
 def main():
+    init()
     logger.info("Запуск парсинга данных для AgriScouting")
 
     # Инициализация данных
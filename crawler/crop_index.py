@@ -0,0 +1,96 @@
+"""
+In-memory index of scraped entities (diseases, pests, weeds) and their crops.
+Each entity is stored once by ID together with its description and image
+rows, and the entity-crop relation is kept in two dictionaries, by entity and
+by crop. The CSV tables and the per-category JSON report are both read from
+the index, so building them is linear in the number of rows.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+
+class EntityCropIndex:
+    """
+    Entities of one kind with their description and image rows and crop links.
+
+    Entities keep the order in which they were first added; adding an entity
+    with a known ID replaces its rows but not its position.
+    """
+
+    def __init__(self, link_field: str):
+        """
+        Args:
+            link_field: Name of the entity ID column in the dependent tables ('disease_id', 'vermin_id', ...)
+        """
+        self.link_field = link_field
+        self._entities: Dict[str, dict] = {}
+        self._descriptions: Dict[str, dict] = {}
+        self._images: Dict[str, dict] = {}
+        # ID сущности -> культуры и культура -> ID сущностей (в порядке добавления)
+        self._crops_by_entity: Dict[str, Dict[str, None]] = {}
+        self._entities_by_crop: Dict[str, Dict[str, None]] = {}
+        self._position: Dict[str, int] = {}
+
+    def add(self, entity: dict, description: Optional[dict] = None) -> None:
+        """
+        Adds or replaces an entity and its description.
+
+        Args:
+            entity: Main table row with an 'id' field
+            description: Description table row, if any
+        """
+        entity_id = entity['id']
+        self._position.setdefault(entity_id, len(self._position))
+        self._entities[entity_id] = entity
+        if description is not None:
+            self._descriptions[entity_id] = description
+
+    def add_image(self, image: dict) -> None:
+        """Adds or replaces an image table row (keyed by its own 'id')."""
+        self._images[image['id']] = image
+
+    def link(self, entity_id: str, crops: Iterable[str]) -> None:
+        """Links an entity to crops; repeated links are ignored."""
+        for crop in crops:
+            self._crops_by_entity.setdefault(entity_id, {})[crop] = None
+            self._entities_by_crop.setdefault(crop, {})[entity_id] = None
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def entities(self) -> List[dict]:
+        """Returns the main table rows."""
+        return list(self._entities.values())
+
+    def descriptions(self) -> List[dict]:
+        """Returns the description table rows."""
+        return list(self._descriptions.values())
+
+    def images(self) -> List[dict]:
+        """Returns the image table rows."""
+        return list(self._images.values())
+
+    def crop_rows(self) -> List[dict]:
+        """Returns the entity-crop table rows ({link_field: id, 'crops': crop})."""
+        return [{self.link_field: entity_id, 'crops': crop}
+                for entity_id, crops in self._crops_by_entity.items() for crop in crops]
+
+    def crops_of(self, entity_id: str) -> List[str]:
+        """Returns the crops linked to an entity."""
+        return list(self._crops_by_entity.get(entity_id, ()))
+
+    def with_crops(self, crops: Iterable[str]) -> List[dict]:
+        """
+        Returns the entities linked to any of the crops.
+
+        Args:
+            crops: Crop names
+
+        Returns:
+            Main table rows in the order the entities were added, each at most once
+        """
+        ids = set()
+        for crop in crops:
+            ids.update(self._entities_by_crop.get(crop, ()))
+        return [self._entities[entity_id] for entity_id in sorted(ids, key=self._position.__getitem__)
+                if entity_id in self._entities]
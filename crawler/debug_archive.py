@@ -0,0 +1,248 @@
+"""
+Opt-in archive of downloaded HTML pages for debugging the scrapers.
+Instead of one debug_*.html file per page, sampled pages are appended to a
+single compressed archive: every page is a separate gzip member (or zstd
+frame), so the archive can be read record by record and `zcat` shows all of a
+gzip archive (`zstdcat` a zstd one), and a JSON Lines index next to it maps
+URLs to record offsets. The archive is off
+unless DEBUG_ARCHIVE is set, and unsampled pages cost one hash of the URL.
+
+Usage:
+    python debug_archive.py cache/debug_pages.gz                 # list archived pages
+    python debug_archive.py cache/debug_pages.gz URL -o page.html  # extract the latest copy of a page
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("debug_archive")
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+DEFAULT_SAMPLE_RATE = 1.0
+
+
+class ArchiveEntry(NamedTuple):
+    """Index record of an archived page."""
+    url: str
+    label: str
+    offset: int
+    length: int
+    codec: str
+    saved_at: float
+
+
+def _zstd():
+    """Returns the zstandard module, or None if it is not installed."""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def index_path(archive_path: Path) -> Path:
+    """Returns the path of the index file of an archive."""
+    return archive_path.with_name(archive_path.name + '.idx')
+
+
+def is_sampled(url: str, sample_rate: float) -> bool:
+    """
+    Decides whether a page is archived.
+
+    The decision depends only on the URL, so the same pages are sampled in every run.
+    """
+    if sample_rate >= 1.0:
+        return True
+    if sample_rate <= 0.0:
+        return False
+    bucket = int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+    return bucket / 2 ** 64 < sample_rate
+
+
+class DebugArchive:
+    """Append-only compressed archive of HTML pages with an index by URL."""
+
+    def __init__(self, path: Path, sample_rate: float = DEFAULT_SAMPLE_RATE,
+                 compression: str = COMPRESSION_GZIP):
+        """
+        Args:
+            path: Archive file (created if missing); the index is stored next to it
+            sample_rate: Share of pages to archive, from 0 to 1
+            compression: 'gzip' or 'zstd' (requires the zstandard package)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        if compression == COMPRESSION_ZSTD and _zstd() is None:
+            logger.warning("Пакет zstandard не установлен, архив сжимается gzip")
+            compression = COMPRESSION_GZIP
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._data = open(self.path, 'ab')
+        self._index = open(index_path(self.path), 'a', encoding='utf-8')
+        self.saved = 0
+
+    def _compress(self, data: bytes) -> bytes:
+        # Страницы сжимаются вне блокировки из нескольких потоков, а объект ZstdCompressor
+        # не потокобезопасен, поэтому он создается на каждый вызов
+        if self.compression == COMPRESSION_ZSTD:
+            return _zstd().ZstdCompressor().compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def wants(self, url: str) -> bool:
+        """Returns whether a page with this URL would be archived."""
+        return is_sampled(url, self.sample_rate)
+
+    def add(self, url: str, html: Optional[str], label: str = '') -> bool:
+        """
+        Archives a page if it is sampled.
+
+        Args:
+            url: Page URL
+            html: Page HTML as downloaded
+            label: Kind of page ('culture', 'disease', ...)
+
+        Returns:
+            True if the page was written
+        """
+        if not html or not self.wants(url):
+            return False
+        record = self._compress(html.encode('utf-8'))
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(record)
+            self._data.flush()
+            # Запись индекса добавляется после данных: оборванная запись данных не попадет в индекс
+            entry = ArchiveEntry(url, label, offset, len(record), self.compression, time.time())
+            self._index.write(json.dumps(entry._asdict(), ensure_ascii=False) + '\n')
+            self._index.flush()
+            self.saved += 1
+        return True
+
+    def close(self) -> None:
+        """Closes the archive files."""
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+
+def read_index(archive_path: Path) -> List[ArchiveEntry]:
+    """
+    Returns the index records of an archive in the order the pages were written.
+
+    Records pointing past the end of the archive (an interrupted write) are skipped.
+    """
+    archive_path = Path(archive_path)
+    size = archive_path.stat().st_size if archive_path.exists() else 0
+    entries = []
+    try:
+        with open(index_path(archive_path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = ArchiveEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue
+                if entry.offset + entry.length <= size:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_page(archive_path: Path, entry: ArchiveEntry) -> str:
+    """Reads and decompresses one archived page."""
+    with open(archive_path, 'rb') as f:
+        f.seek(entry.offset)
+        record = f.read(entry.length)
+    if entry.codec == COMPRESSION_ZSTD:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("Для чтения записи нужен пакет zstandard")
+        data = zstandard.ZstdDecompressor().decompress(record)
+    else:
+        data = gzip.decompress(record)
+    return data.decode('utf-8')
+
+
+def latest_by_url(archive_path: Path) -> Dict[str, ArchiveEntry]:
+    """Returns the most recent index record of every archived URL."""
+    return {entry.url: entry for entry in read_index(archive_path)}
+
+
+_archive: Optional[DebugArchive] = None
+_archive_loaded = False
+_archive_lock = threading.Lock()
+
+
+def get_debug_archive() -> Optional[DebugArchive]:
+    """
+    Returns the process-wide debug archive, or None if archiving is off.
+
+    Settings are read on first use: DEBUG_ARCHIVE (archive path; empty - off),
+    DEBUG_ARCHIVE_SAMPLE (share of pages, default 1) and DEBUG_ARCHIVE_COMPRESSION
+    (gzip or zstd).
+    """
+    global _archive, _archive_loaded
+    with _archive_lock:
+        if not _archive_loaded:
+            _archive_loaded = True
+            path = os.getenv('DEBUG_ARCHIVE', '').strip()
+            if path:
+                _archive = DebugArchive(
+                    Path(path),
+                    float(os.getenv('DEBUG_ARCHIVE_SAMPLE', DEFAULT_SAMPLE_RATE)),
+                    os.getenv('DEBUG_ARCHIVE_COMPRESSION', COMPRESSION_GZIP).strip().lower()
+                )
+                logger.info(f"Отладочный архив страниц: {path}")
+        return _archive
+
+
+def archive_page(url: str, html: Optional[str], label: str = '') -> bool:
+    """
+    Archives a page if the debug archive is on and the page is sampled.
+
+    Returns:
+        True if the page was written
+    """
+    archive = get_debug_archive()
+    return archive is not None and archive.add(url, html, label)
+
+
+def main():
+    """Lists the pages of an archive or extracts one of them."""
+    parser = argparse.ArgumentParser(description='List or extract pages of a scraper debug archive.')
+    parser.add_argument('archive', help='Archive file (DEBUG_ARCHIVE)')
+    parser.add_argument('url', nargs='?', help='Extract the latest copy of this page')
+    parser.add_argument('-o', '--output', help='Write the page to this file instead of stdout')
+    args = parser.parse_args()
+
+    if not args.url:
+        for entry in read_index(Path(args.archive)):
+            saved_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.saved_at))
+            print(f"{saved_at}  {entry.label or '-':10}  {entry.length:>8}  {entry.url}")
+        return
+
+    entry = latest_by_url(Path(args.archive)).get(args.url)
+    if entry is None:
+        print(f"Страница не найдена в архиве: {args.url}", file=sys.stderr)
+        sys.exit(1)
+    html = read_page(Path(args.archive), entry)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(html)
+    else:
+        sys.stdout.write(html)
+
+
+if __name__ == '__main__':
+    main()
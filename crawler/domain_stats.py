@@ -0,0 +1,204 @@
+"""
+Persistent per-domain scoreboard of image downloads.
+Every download attempt updates the statistics of its domain (attempts,
+successes, total time and bytes) and the most recent failure reasons are kept,
+so later crawls rank URL candidates by the expected yield of their domain and
+skip domains that keep failing (403 responses, HTML pages, undersized images).
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("domain_stats")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DB_PATH = BASE_DIR / "crawler" / "cache" / "domain_stats.db"
+# Домен считается негодным после стольких попыток с долей успеха ниже порога
+DEFAULT_MIN_ATTEMPTS = 5
+DEFAULT_BAD_RATE = 0.1
+# Через сколько часов после последней попытки негодный домен пробуется снова
+DEFAULT_RETRY_HOURS = 24.0
+# Время загрузки, при котором ожидаемый выход домена снижается вдвое
+REFERENCE_SECONDS = 2.0
+# Сколько последних причин отказа хранится для домена
+RECENT_FAILURES = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    successes INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    last_attempt_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    domain TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failures_by_domain ON failures (domain, failed_at);
+"""
+
+
+def domain_of(url: str) -> str:
+    """Returns the host of a URL without a leading 'www.'."""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class DomainScore(NamedTuple):
+    """Accumulated download statistics of one domain."""
+    domain: str
+    attempts: int = 0
+    successes: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    last_attempt_at: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        """Smoothed success rate, (successes + 1) / (attempts + 2); 0.5 for an unknown domain."""
+        return (self.successes + 1) / (self.attempts + 2)
+
+    @property
+    def mean_seconds(self) -> float:
+        """Mean duration of a download attempt."""
+        return self.seconds / self.attempts if self.attempts else 0.0
+
+    @property
+    def mean_bytes(self) -> float:
+        """Mean number of bytes received per attempt."""
+        return self.bytes / self.attempts if self.attempts else 0.0
+
+
+class DomainStats:
+    """
+    Thread-safe SQLite store of download statistics per domain.
+
+    Scores are kept in memory for ranking and written through on every update.
+    """
+
+    def __init__(self, db_path: Path, min_attempts: int = DEFAULT_MIN_ATTEMPTS, bad_rate: float = DEFAULT_BAD_RATE,
+                 retry_hours: float = DEFAULT_RETRY_HOURS):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+            min_attempts: Attempts needed before a domain can be judged bad
+            bad_rate: A domain whose share of successful attempts is below this is bad
+            retry_hours: A bad domain is tried again this long after its last attempt
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.min_attempts = min_attempts
+        self.bad_rate = bad_rate
+        self.retry_seconds = retry_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._scores: Dict[str, DomainScore] = {
+            row[0]: DomainScore(*row) for row in self._conn.execute(
+                "SELECT domain, attempts, successes, seconds, bytes, last_attempt_at FROM domains")
+        }
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
+
+    def record(self, url: str, success: bool, seconds: float, size: int = 0, reason: Optional[str] = None) -> None:
+        """
+        Records a download attempt.
+
+        Args:
+            url: Downloaded URL
+            success: Whether the image was saved
+            seconds: Duration of the attempt
+            size: Bytes received
+            reason: Why the attempt failed
+        """
+        domain = domain_of(url)
+        now = time.time()
+        with self._lock:
+            score = self._scores.get(domain, DomainScore(domain))
+            score = score._replace(attempts=score.attempts + 1, successes=score.successes + int(success),
+                                   seconds=score.seconds + seconds, bytes=score.bytes + size, last_attempt_at=now)
+            self._scores[domain] = score
+            self._conn.execute("INSERT OR REPLACE INTO domains VALUES (?, ?, ?, ?, ?, ?)", score)
+            if not success:
+                self._conn.execute("INSERT INTO failures VALUES (?, ?, ?)", (domain, reason or 'unknown', now))
+                self._conn.execute(
+                    "DELETE FROM failures WHERE domain = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM failures WHERE domain = ? ORDER BY failed_at DESC, rowid DESC LIMIT ?)",
+                    (domain, domain, RECENT_FAILURES)
+                )
+            self._conn.commit()
+
+    def get(self, domain: str) -> DomainScore:
+        """Returns the statistics of a domain (empty for an unknown one)."""
+        with self._lock:
+            return self._scores.get(domain, DomainScore(domain))
+
+    def expected_yield(self, domain: str) -> float:
+        """
+        Returns the expected yield of a download from the domain (higher is better).
+
+        The smoothed success rate is divided by 1 + mean time / REFERENCE_SECONDS,
+        so between equally reliable domains the faster one goes first.
+        """
+        score = self.get(domain)
+        return score.success_rate / (1 + score.mean_seconds / REFERENCE_SECONDS)
+
+    def is_bad(self, domain: str) -> bool:
+        """Returns True if downloads from the domain keep failing and its retry time has not come yet."""
+        score = self.get(domain)
+        if score.attempts < self.min_attempts or score.successes >= self.bad_rate * score.attempts:
+            return False
+        return time.time() - score.last_attempt_at < self.retry_seconds
+
+    def recent_failures(self, domain: str) -> List[str]:
+        """Returns the most recent failure reasons of a domain, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT reason FROM failures WHERE domain = ? ORDER BY failed_at DESC, rowid DESC", (domain,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def bad_domains(self) -> List[DomainScore]:
+        """Returns the domains currently skipped, most attempted first."""
+        with self._lock:
+            domains = list(self._scores)
+        scores = [self.get(domain) for domain in domains if self.is_bad(domain)]
+        return sorted(scores, key=lambda score: score.attempts, reverse=True)
+
+
+_stats: Optional[DomainStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_domain_stats() -> DomainStats:
+    """
+    Returns the process-wide domain scoreboard.
+
+    Settings are read on first use: DOMAIN_STATS_DB, DOMAIN_STATS_MIN_ATTEMPTS,
+    DOMAIN_STATS_BAD_RATE and DOMAIN_STATS_RETRY_HOURS.
+    """
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = DomainStats(
+                Path(os.getenv('DOMAIN_STATS_DB', str(DEFAULT_DB_PATH))),
+                int(os.getenv('DOMAIN_STATS_MIN_ATTEMPTS', DEFAULT_MIN_ATTEMPTS)),
+                float(os.getenv('DOMAIN_STATS_BAD_RATE', DEFAULT_BAD_RATE)),
+                float(os.getenv('DOMAIN_STATS_RETRY_HOURS', DEFAULT_RETRY_HOURS))
+            )
+        return _stats
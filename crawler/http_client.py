@@ -0,0 +1,122 @@
+"""
+Shared pooled HTTP client for all crawler modules.
+Connections are kept alive and reused per host; retries, proxies and
+per-host rate limiting are configured in one place. requests is imported on
+the first request, so importing this module is cheap.
+"""
+
+import os
+import random
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
+
+from rate_limiter import get_rate_limiter
+
+if TYPE_CHECKING:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("http_client")
+
+DEFAULT_TIMEOUT = 15
+# 403/429 не повторяются здесь: на них реагирует ограничитель частоты запросов
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_adapter: Optional['HTTPAdapter'] = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_adapter() -> 'HTTPAdapter':
+    """Returns the process-wide adapter, whose connection pools are shared by all threads."""
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Настройки читаются при первом запросе, чтобы учесть .env, загруженный вызывающим модулем
+            retries = Retry(
+                total=int(os.getenv('HTTP_MAX_RETRIES', '3')),
+                backoff_factor=0.5,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            _adapter = HTTPAdapter(
+                pool_connections=int(os.getenv('HTTP_POOL_HOSTS', '32')),  # сколько хостов держать в пуле
+                pool_maxsize=int(os.getenv('HTTP_POOL_PER_HOST', '8')),  # максимум соединений на хост
+                pool_block=True,
+                max_retries=retries
+            )
+        return _adapter
+
+
+def get_session() -> 'requests.Session':
+    """
+    Returns the calling thread's session.
+
+    Sessions are per thread (cookies are not thread-safe), but all of them
+    share one adapter, so keep-alive connections are reused across threads.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        adapter = _get_adapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def get_proxies() -> Optional[Dict[str, str]]:
+    """
+    Returns the proxies for the next request, or None if no proxy is configured.
+
+    A random entry of PROXY_LIST (comma-separated) is used if set, otherwise HTTP_PROXY
+    (http, https or socks5 URL).
+    """
+    proxy_list = [p.strip() for p in os.getenv('PROXY_LIST', '').split(',') if p.strip()]
+    proxy = random.choice(proxy_list) if proxy_list else os.getenv('HTTP_PROXY', '')
+    if not proxy:
+        return None
+    return {'http': proxy, 'https': proxy}
+
+
+def request(method: str, url: str, rate_limited: bool = True, **kwargs) -> 'requests.Response':
+    """
+    Sends a request through the pooled session.
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        rate_limited: Whether to respect the per-host rate limiter
+        **kwargs: Arguments passed to requests.Session.request
+
+    Returns:
+        Response object (closed by the caller when stream=True)
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    if 'proxies' not in kwargs:
+        kwargs['proxies'] = get_proxies()
+
+    limiter = get_rate_limiter()
+    if rate_limited:
+        limiter.wait(url)
+    response = get_session().request(method, url, **kwargs)
+    if rate_limited:
+        limiter.report(url, response.status_code, response.headers.get('Retry-After'))
+    return response
+
+
+def get(url: str, **kwargs) -> 'requests.Response':
+    """Sends a GET request through the pooled session."""
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> 'requests.Response':
+    """Sends a POST request through the pooled session."""
+    return request('POST', url, **kwargs)
@@ -0,0 +1,200 @@
+"""
+Early validation of streamed image downloads.
+The format is detected from magic bytes and the dimensions are read from the
+image header, so undersized, oversized or non-image responses are rejected
+after the first few kilobytes instead of after the full transfer.
+"""
+
+import os
+import struct
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("image_probe")
+
+DEFAULT_MIN_WIDTH = 200
+DEFAULT_MIN_HEIGHT = 200
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+# Сколько байт начала файла можно прочитать в поисках размеров (метаданные JPEG бывают большими)
+HEADER_LIMIT = 256 * 1024
+
+FORMAT_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp'}
+
+
+class ImageRejected(Exception):
+    """Raised when a streamed download is not an acceptable image."""
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Detects the image format from magic bytes ('jpeg', 'png', 'gif', 'webp') or returns None."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            # Байты заполнения перед маркером
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', head[pos + 2:pos + 4])[0]
+        # SOF0-SOF15, кроме DHT (C4), JPG (C8) и DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > len(head):
+                return None
+            height, width = struct.unpack('>HH', head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def parse_dimensions(head: bytes, image_format: str) -> Optional[Tuple[int, int]]:
+    """
+    Reads (width, height) from the beginning of an image file without decoding it.
+
+    Args:
+        head: First bytes of the file
+        image_format: Format returned by sniff_format
+
+    Returns:
+        Dimensions, or None if the header is incomplete or not understood
+    """
+    if image_format == 'png' and len(head) >= 24:
+        return struct.unpack('>II', head[16:24])
+    if image_format == 'gif' and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10])
+    if image_format == 'webp' and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b'VP8X':
+            width = int.from_bytes(head[24:27], 'little') + 1
+            height = int.from_bytes(head[27:30], 'little') + 1
+            return width, height
+        if chunk == b'VP8L' and head[20] == 0x2F:
+            bits = int.from_bytes(head[21:25], 'little')
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+            width, height = struct.unpack('<HH', head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        return None
+    if image_format == 'jpeg':
+        return _jpeg_dimensions(head)
+    return None
+
+
+class ImageProbe:
+    """
+    Validates a chunked download while it streams.
+
+    read_head() buffers only as many chunks as needed to identify the format and
+    dimensions; stream() then yields the whole body and stops at the byte limit.
+    """
+
+    def __init__(self, min_width: int = DEFAULT_MIN_WIDTH, min_height: int = DEFAULT_MIN_HEIGHT,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            min_width: Minimum accepted width in pixels
+            min_height: Minimum accepted height in pixels
+            max_bytes: Maximum accepted file size in bytes (0 - unlimited)
+        """
+        self.min_width = min_width
+        self.min_height = min_height
+        self.max_bytes = max_bytes
+        self.format: Optional[str] = None
+        self.size: Optional[Tuple[int, int]] = None
+        self.bytes_read = 0
+
+    @property
+    def extension(self) -> str:
+        """File extension matching the detected format."""
+        return FORMAT_EXTENSIONS.get(self.format, '.jpg')
+
+    def check_content_length(self, value: Optional[str]) -> None:
+        """Rejects a response whose declared length already exceeds the limit."""
+        try:
+            length = int(value) if value else 0
+        except ValueError:
+            return
+        if self.max_bytes and length > self.max_bytes:
+            raise ImageRejected(f"слишком большой файл ({length} байт)")
+
+    def read_head(self, chunks: Iterator[bytes]) -> List[bytes]:
+        """
+        Consumes chunks until the format and dimensions are known.
+
+        Args:
+            chunks: Iterator over the response body
+
+        Returns:
+            Chunks consumed so far, to be written before the rest of the body
+
+        Raises:
+            ImageRejected: If the data is not an image or is too small
+        """
+        buffered: List[bytes] = []
+        head = b''
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffered.append(chunk)
+            head += chunk
+            self._count(len(chunk))
+            if self.format is None and len(head) >= 12:
+                self.format = sniff_format(head)
+                if self.format is None:
+                    raise ImageRejected("не изображение (неизвестная сигнатура файла)")
+            if self.format is not None:
+                self.size = parse_dimensions(head, self.format)
+                if self.size is not None:
+                    break
+            if len(head) >= HEADER_LIMIT:
+                break
+
+        if self.format is None:
+            raise ImageRejected(f"не изображение ({len(head)} байт)")
+        if self.size is None:
+            raise ImageRejected(f"не удалось определить размеры {self.format}")
+        width, height = self.size
+        if width < self.min_width or height < self.min_height:
+            raise ImageRejected(f"слишком маленькое разрешение {width}x{height}")
+        return buffered
+
+    def stream(self, buffered: List[bytes], chunks: Iterator[bytes]) -> Iterable[bytes]:
+        """Yields the buffered head and the rest of the body, enforcing the byte limit."""
+        yield from buffered
+        for chunk in chunks:
+            if chunk:
+                self._count(len(chunk))
+                yield chunk
+
+    def _count(self, size: int) -> None:
+        self.bytes_read += size
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise ImageRejected(f"превышен максимальный размер {self.max_bytes} байт")
+
+
+def get_image_probe() -> ImageProbe:
+    """
+    Returns a probe configured from the environment.
+
+    Settings: IMAGE_MIN_WIDTH, IMAGE_MIN_HEIGHT and IMAGE_MAX_BYTES.
+    """
+    return ImageProbe(
+        int(os.getenv('IMAGE_MIN_WIDTH', DEFAULT_MIN_WIDTH)),
+        int(os.getenv('IMAGE_MIN_HEIGHT', DEFAULT_MIN_HEIGHT)),
+        int(os.getenv('IMAGE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    )
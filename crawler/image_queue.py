@@ -0,0 +1,143 @@
+"""
+Persistent queue of image downloads for the Betaren photo downloader.
+Stage one records the image URLs found on every source page, stage two
+downloads them. Both are kept in a SQLite file: a page whose images were
+queued is not fetched again, an image URL is queued only once however many
+pages show it, and finished downloads are skipped after a restart.
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger("image_queue")
+
+# Состояния загрузки
+JOB_PENDING = 'pending'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Сколько запусков подряд повторяется неудачная загрузка
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_url TEXT PRIMARY KEY,
+    image_count INTEGER NOT NULL,
+    extracted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    image_url TEXT PRIMARY KEY,
+    page_url TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    method TEXT,
+    path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, queued_at);
+"""
+
+
+class ImageJob(NamedTuple):
+    """One image to download: its URL, the page it was found on and the target file."""
+    image_url: str
+    page_url: str
+    folder: str
+    filename: str
+
+
+class ImageQueue:
+    """Thread-safe SQLite store of extracted pages and image downloads."""
+
+    def __init__(self, db_path: Path, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+            max_attempts: Failed downloads are retried until they failed this many times
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
+
+    def extracted_pages(self) -> set:
+        """Returns the URLs of the pages whose images are already queued."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT page_url FROM pages")}
+
+    def add_page(self, page_url: str, jobs: Sequence[ImageJob]) -> List[ImageJob]:
+        """
+        Queues the images of a page and marks the page as extracted, in one transaction.
+
+        Returns:
+            Jobs that were not queued before (images already queued from other pages are skipped)
+        """
+        now = time.time()
+        added = []
+        with self._lock:
+            for job in jobs:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (image_url, page_url, folder, filename, status, queued_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job.image_url, job.page_url, job.folder, job.filename, JOB_PENDING, now, now)
+                )
+                if cursor.rowcount:
+                    added.append(job)
+            self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (page_url, len(jobs), now))
+            self._conn.commit()
+        return added
+
+    def pending(self) -> List[ImageJob]:
+        """Returns the jobs still to download (including failed ones with attempts left) in queue order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT image_url, page_url, folder, filename FROM jobs "
+                "WHERE status = ? OR (status = ? AND attempts < ?) ORDER BY queued_at, rowid",
+                (JOB_PENDING, JOB_FAILED, self.max_attempts)
+            ).fetchall()
+        return [ImageJob(*row) for row in rows]
+
+    def record(self, image_url: str, path: Optional[str], method: Optional[str] = None) -> None:
+        """
+        Records the outcome of a download.
+
+        Args:
+            image_url: Image URL
+            path: Saved file, or None if the download failed
+            method: How the image was obtained ('http', 'browser', 'existing')
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, path = ?, method = ?, attempts = attempts + ?, updated_at = ? "
+                "WHERE image_url = ?",
+                (JOB_DONE if path else JOB_FAILED, path, method, 0 if path else 1, time.time(), image_url)
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of extracted pages and of jobs per status and download method."""
+        with self._lock:
+            stats = {'pages': self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]}
+            stats.update(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            stats.update(self._conn.execute(
+                "SELECT 'via_' || method, COUNT(*) FROM jobs WHERE status = ? AND method IS NOT NULL GROUP BY method",
+                (JOB_DONE,)
+            ).fetchall())
+        return stats
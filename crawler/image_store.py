@@ -0,0 +1,263 @@
+"""
+Content-addressed store for downloaded images.
+Every image is written once under its SHA-256 hash; per-risk folders reference
+the stored blob through hardlinks (or copies where hardlinks are not supported),
+and every reference is recorded in an append-only manifest.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger("image_store")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_STORE_DIR = BASE_DIR / "crawler" / "download" / "store"
+MANIFEST_NAME = "manifest.jsonl"
+# Сколько разных папок рисков может ссылаться на один блоб (0 - без ограничения).
+# Одно фото нередко иллюстрирует несколько рисков, поэтому ограничение включается явно,
+# например чтобы отсечь логотипы и заглушки сайтов
+DEFAULT_MAX_REFS = 0
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+class ImageStore:
+    """
+    SHA-256 addressed blob store with hardlinked references.
+
+    The layout is <root>/blobs/<first two hex digits>/<sha256><ext>; the manifest
+    <root>/manifest.jsonl holds one {"sha256", "path"} record per reference.
+    """
+
+    def __init__(self, root: Path, max_refs: int = DEFAULT_MAX_REFS):
+        """
+        Args:
+            root: Store directory (must be on the same filesystem as the image folders for hardlinks)
+            max_refs: Maximum number of distinct folders that may reference one blob (0 - unlimited)
+        """
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.manifest_path = self.root / MANIFEST_NAME
+        self.max_refs = max_refs
+        self._lock = threading.Lock()
+        # sha256 -> множество путей (относительно хранилища), ссылающихся на блоб
+        self._refs: Dict[str, Set[str]] = {}
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._load_manifest()
+
+    def _load_manifest(self) -> None:
+        if not self.manifest_path.exists():
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._refs.setdefault(record['sha256'], set()).add(record['path'])
+
+    def blob_path(self, digest: str, ext: str) -> Path:
+        """Returns the path of the blob with the given hash and extension."""
+        return self.blobs_dir / digest[:2] / f"{digest}{ext.lower()}"
+
+    def _find_blob(self, digest: str) -> Optional[Path]:
+        shard = self.blobs_dir / digest[:2]
+        if shard.exists():
+            for candidate in shard.glob(f"{digest}.*"):
+                return candidate
+        return None
+
+    def _relative(self, path: Path) -> str:
+        try:
+            return Path(os.path.relpath(path, self.root)).as_posix()
+        except ValueError:
+            # Другой диск в Windows: храним абсолютный путь
+            return Path(path).resolve().as_posix()
+
+    def _link(self, blob: Path, dest: Path) -> None:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+        except OSError:
+            # Файловая система без жестких ссылок или другой том
+            shutil.copy2(blob, dest)
+
+    def _record(self, digest: str, dest: Path) -> None:
+        relative = self._relative(dest)
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'sha256': digest, 'path': relative}, ensure_ascii=False) + '\n')
+        self._refs.setdefault(digest, set()).add(relative)
+
+    def _check_refs(self, digest: str, dest: Path) -> Optional[str]:
+        """Returns the reason why the blob must not be linked into dest, or None."""
+        folders = {str(Path(path).parent) for path in self._refs.get(digest, set())}
+        if str(Path(self._relative(dest)).parent) in folders:
+            return "уже есть в этой папке"
+        if self.max_refs and len(folders) >= self.max_refs:
+            return f"встречается в {len(folders)} папках (вероятно, логотип или заглушка)"
+        return None
+
+    def add_stream(self, chunks: Iterable[bytes], dest: Path, min_size: int = 0,
+                   accept: Optional[Callable[[Path], bool]] = None) -> Optional[Path]:
+        """
+        Stores streamed image data and links it to dest.
+
+        Data is hashed while it is written to a temporary file, so a duplicate is
+        discarded before it reaches the store or the image folder.
+
+        Args:
+            chunks: Iterable of byte chunks (e.g. response.iter_content())
+            dest: Path of the image in the per-risk folder
+            min_size: Minimum accepted size in bytes
+            accept: Optional check of the downloaded file before it is stored
+
+        Returns:
+            dest if the image was stored or linked, None if it was rejected
+        """
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in chunks:
+                    if chunk:
+                        sha256.update(chunk)
+                        tmp.write(chunk)
+                        size += len(chunk)
+            if size < min_size:
+                logger.warning(f"Пропуск {dest.name}: подозрительно маленький размер ({size} байт)")
+                return None
+            if accept is not None and not accept(Path(tmp_name)):
+                return None
+            return self._commit(sha256.hexdigest(), Path(tmp_name), dest, move=True)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def add_file(self, path: Path, dest: Optional[Path] = None) -> Optional[Path]:
+        """
+        Moves an existing file into the store and replaces it with a link.
+
+        Args:
+            path: Existing image file
+            dest: Reference path (defaults to the file's own path)
+
+        Returns:
+            The reference path if it was kept, None if the file was a duplicate and removed
+        """
+        dest = Path(dest or path)
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                sha256.update(chunk)
+        result = self._commit(sha256.hexdigest(), Path(path), dest, move=False)
+        if result is None and Path(path).exists() and Path(path) == dest:
+            Path(path).unlink()
+        return result
+
+    def _commit(self, digest: str, source: Path, dest: Path, move: bool) -> Optional[Path]:
+        with self._lock:
+            if self._relative(dest) in self._refs.get(digest, set()) and dest.exists():
+                # Ссылка уже учтена (например, повторная миграция)
+                return dest
+            reason = self._check_refs(digest, dest)
+            if reason:
+                logger.info(f"Дубликат {dest.name} ({digest[:12]}) отброшен: {reason}")
+                return None
+
+            blob = self._find_blob(digest)
+            if blob is None:
+                blob = self.blob_path(digest, dest.suffix or '.jpg')
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                if move:
+                    os.replace(source, blob)
+                else:
+                    shutil.copy2(source, blob)
+            else:
+                logger.debug(f"Блоб {digest[:12]} уже в хранилище, создаем только ссылку")
+
+            self._link(blob, dest)
+            self._record(digest, dest)
+            return dest
+
+    def stats(self) -> Tuple[int, int]:
+        """Returns (number of blobs, number of references)."""
+        with self._lock:
+            return len(self._refs), sum(len(paths) for paths in self._refs.values())
+
+
+def migrate(images_dir: Path, store: ImageStore) -> Tuple[int, int]:
+    """
+    Moves an existing image tree into the store, removing duplicates.
+
+    Args:
+        images_dir: Root of the per-risk image folders
+        store: Target store
+
+    Returns:
+        (number of files kept, number of duplicates removed)
+    """
+    kept = removed = 0
+    for path in sorted(Path(images_dir).rglob('*')):
+        if not path.is_file() or path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        if path.stat().st_size == 0:
+            # Пустые файлы остаются после прерванных загрузок
+            path.unlink()
+            removed += 1
+            continue
+        if store.add_file(path) is None:
+            removed += 1
+        else:
+            kept += 1
+    return kept, removed
+
+
+_store: Optional[ImageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageStore:
+    """
+    Returns the process-wide image store.
+
+    Settings are read on first use: IMAGE_STORE_DIR and IMAGE_STORE_MAX_REFS.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore(
+                Path(os.getenv('IMAGE_STORE_DIR', str(DEFAULT_STORE_DIR))),
+                int(os.getenv('IMAGE_STORE_MAX_REFS', DEFAULT_MAX_REFS))
+            )
+        return _store
+
+
+def main():
+    """Migrates an existing download tree into the store."""
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Deduplicate downloaded images into the content-addressed store.')
+    parser.add_argument('--images-dir', type=str, default=str(BASE_DIR / "crawler" / "download" / "images"),
+                        help='Root of the per-risk image folders')
+    args = parser.parse_args()
+
+    store = get_image_store()
+    kept, removed = migrate(Path(args.images_dir), store)
+    blobs, refs = store.stats()
+    logger.info(f"Оставлено файлов: {kept}, удалено дубликатов: {removed}; блобов: {blobs}, ссылок: {refs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Page loading strategy for the Betaren scrapers.
+A page is first requested with a plain pooled HTTP GET and rendered in a
+headless browser only if the response is empty, a CAPTCHA or lacks the
+markup the parsers expect. The method that worked is remembered per URL
+pattern, so pages that need a browser do not pay for a useless HTTP request.
+"""
+
+import os
+import random
+import logging
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+from urllib.parse import urlparse
+
+import http_client
+
+logger = logging.getLogger("page_fetcher")
+
+METHOD_HTTP = 'http'
+METHOD_BROWSER = 'browser'
+
+# Разметка, по которой видно, что страница отдана полностью (списки и детальные страницы)
+DEFAULT_MARKERS = ('agro-item', 'harmful-detail')
+CAPTCHA_MARKERS = ('g-recaptcha', 'smartcaptcha', 'captcha-form', 'cf-challenge')
+MIN_PAGE_LENGTH = 512
+# Через сколько загрузок браузером для шаблона снова пробуется HTTP
+HTTP_RETRY_INTERVAL = 25
+# Сегменты пути глубже этого уровня заменяются на * в шаблоне URL
+PATTERN_DEPTH = 2
+
+DEFAULT_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+
+class FetchedPage(NamedTuple):
+    """Result of a page load; html is None when the server answered 304 Not Modified."""
+    html: Optional[str]
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def url_pattern(url: str) -> str:
+    """
+    Returns the pattern grouping pages with the same layout.
+
+    Path segments below PATTERN_DEPTH are replaced with '*', so
+    /harmful/bolezni/pshenitsa/rzhavchina becomes betaren.ru/harmful/bolezni/*/*.
+    """
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split('/') if s]
+    segments = segments[:PATTERN_DEPTH] + ['*'] * (len(segments) - PATTERN_DEPTH)
+    pattern = parsed.netloc.lower() + '/' + '/'.join(segments)
+    if segments and parsed.path.endswith('/'):
+        pattern += '/'
+    return pattern
+
+
+def page_problem(html: Optional[str], markers: Sequence[str] = DEFAULT_MARKERS) -> Optional[str]:
+    """
+    Checks whether a page is usable by the parsers.
+
+    Returns:
+        Reason the page is unusable, or None if it is fine
+    """
+    if not html or len(html) < MIN_PAGE_LENGTH:
+        return "пустая страница"
+    # Обычные страницы betaren.ru содержат невидимую reCAPTCHA формы обратной связи,
+    # поэтому капча считается проблемой только при отсутствии содержимого
+    if markers and any(marker in html for marker in markers):
+        return None
+    lowered = html.lower()
+    if any(marker in lowered for marker in CAPTCHA_MARKERS):
+        return "CAPTCHA"
+    if markers:
+        return "нет ожидаемой разметки"
+    return None
+
+
+class PageFetcher:
+    """
+    Loads pages over HTTP with a fallback to a browser.
+
+    The fallback is any function taking a URL and returning the rendered HTML,
+    for example one that uses a driver from webdriver_pool.
+    """
+
+    def __init__(self, browser_fetch: Callable[[str], Optional[str]], mode: str = 'auto',
+                 markers: Sequence[str] = DEFAULT_MARKERS, user_agents: Sequence[str] = (DEFAULT_USER_AGENT,)):
+        """
+        Args:
+            browser_fetch: Function rendering a page in a browser
+            mode: 'auto' (HTTP first), 'http' (never use the browser) or 'browser' (always use it)
+            markers: Substrings of which at least one must be present in a complete page
+            user_agents: User-Agent values for HTTP requests
+        """
+        self.browser_fetch = browser_fetch
+        self.mode = mode
+        self.markers = tuple(markers)
+        self.user_agents = list(user_agents)
+        # шаблон URL -> способ, который сработал последним
+        self._methods: Dict[str, str] = {}
+        # шаблон URL -> число загрузок браузером с последней попытки HTTP
+        self._browser_runs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.counts = {METHOD_HTTP: 0, METHOD_BROWSER: 0}
+
+    def method_for(self, url: str) -> Optional[str]:
+        """Returns the remembered method for the URL's pattern, if any."""
+        with self._lock:
+            return self._methods.get(url_pattern(url))
+
+    def _use_http(self, pattern: str) -> bool:
+        if self.mode != 'auto':
+            return self.mode == METHOD_HTTP
+        with self._lock:
+            if self._methods.get(pattern) != METHOD_BROWSER:
+                return True
+            # Периодически проверяем, не стала ли страница снова доступна без браузера
+            runs = self._browser_runs.get(pattern, 0) + 1
+            self._browser_runs[pattern] = 0 if runs >= HTTP_RETRY_INTERVAL else runs
+            return runs >= HTTP_RETRY_INTERVAL
+
+    def _remember(self, pattern: str, method: str) -> None:
+        with self._lock:
+            if self._methods.get(pattern) != method:
+                logger.info(f"Шаблон {pattern}: загрузка через {method}")
+            self._methods[pattern] = method
+            self.counts[method] += 1
+
+    def _fetch_http(self, url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> Optional[FetchedPage]:
+        headers = {
+            'User-Agent': random.choice(self.user_agents),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+        }
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = http_client.get(url, headers=headers)
+        except Exception as e:
+            logger.debug(f"HTTP-запрос {url} не удался: {e}")
+            return None
+        validators = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if response.status_code == 304 and (etag or last_modified):
+            return FetchedPage(None, True, validators[0] or etag, validators[1] or last_modified)
+        if response.status_code != 200:
+            logger.debug(f"HTTP {response.status_code} для {url}")
+            return None
+        return FetchedPage(response.text, False, *validators)
+
+    def fetch_page(self, url: str, etag: Optional[str] = None,
+                   last_modified: Optional[str] = None) -> FetchedPage:
+        """
+        Loads a page, sending a conditional request when validators of a previous load are known.
+
+        Args:
+            url: Page URL
+            etag: ETag of the stored copy
+            last_modified: Last-Modified of the stored copy
+
+        Returns:
+            Loaded page; not_modified is set if the server confirmed the stored copy is current
+        """
+        pattern = url_pattern(url)
+        if self._use_http(pattern):
+            page = self._fetch_http(url, etag, last_modified)
+            if page is not None and page.not_modified:
+                self._remember(pattern, METHOD_HTTP)
+                return page
+            html = page.html if page else None
+            problem = page_problem(html, self.markers)
+            if problem is None:
+                self._remember(pattern, METHOD_HTTP)
+                return page
+            if self.mode == METHOD_HTTP:
+                logger.warning(f"{url}: {problem}")
+                return FetchedPage(html)
+            logger.info(f"{url}: {problem}, загружаем через браузер")
+
+        html = self.browser_fetch(url)
+        if page_problem(html, self.markers) is None:
+            self._remember(pattern, METHOD_BROWSER)
+        return FetchedPage(html)
+
+    def fetch(self, url: str) -> Optional[str]:
+        """
+        Returns the HTML of a page, using a browser only when plain HTTP is not enough.
+
+        Args:
+            url: Page URL
+
+        Returns:
+            Page HTML, or None if neither method returned anything
+        """
+        return self.fetch_page(url).html
+
+
+_fetchers: Dict[str, PageFetcher] = {}
+_fetchers_lock = threading.Lock()
+
+
+def get_page_fetcher(name: str, browser_fetch: Callable[[str], Optional[str]],
+                     user_agents: Sequence[str] = (DEFAULT_USER_AGENT,)) -> PageFetcher:
+    """
+    Returns the process-wide fetcher with the given name, creating it on first use.
+
+    The mode is read on first use from PAGE_FETCH_MODE (auto, http or browser).
+
+    Args:
+        name: Fetcher name (one per scraper)
+        browser_fetch: Browser fallback of this scraper
+        user_agents: User-Agent values for HTTP requests
+    """
+    with _fetchers_lock:
+        fetcher = _fetchers.get(name)
+        if fetcher is None:
+            mode = os.getenv('PAGE_FETCH_MODE', 'auto').strip().lower()
+            if mode not in ('auto', METHOD_HTTP, METHOD_BROWSER):
+                logger.warning(f"Неизвестный PAGE_FETCH_MODE={mode}, используется auto")
+                mode = 'auto'
+            fetcher = _fetchers[name] = PageFetcher(browser_fetch, mode, user_agents=user_agents)
+        return fetcher
@@ -0,0 +1,153 @@
+"""
+Incremental re-scraping support for the Betaren scrapers.
+For every source URL the HTTP validators (ETag, Last-Modified), a fingerprint
+of the page content and the record built from it are stored in SQLite, so an
+unchanged page is answered from the store without parsing, translating or
+downloading images again. Record IDs are derived from the source URL and stay
+the same between runs.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("page_state")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_STATE_PATH = BASE_DIR / "crawler" / "cache" / "betaren_pages.db"
+# Пространство имен для стабильных идентификаторов записей
+ID_NAMESPACE = uuid.NAMESPACE_URL
+
+# Части страницы, которые меняются при каждой загрузке и не относятся к содержимому:
+# скрипты, токены форм и капчи, метатеги
+_VOLATILE = re.compile(
+    r'<(script|style|noscript|textarea)\b.*?</\1\s*>|<(?:input|meta|link)\b[^>]*>|<!--.*?-->',
+    re.IGNORECASE | re.DOTALL
+)
+_TAGS = re.compile(r'<[^>]+>')
+_SPACES = re.compile(r'\s+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT NOT NULL,
+    parser_version INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+def stable_id(*parts: str) -> str:
+    """
+    Returns a UUID derived from the source URL and optional qualifiers.
+
+    The same arguments always give the same ID, so records of successive runs can be
+    compared and merged: stable_id(url) for an item, stable_id(url, 'image', image_url)
+    for one of its rows.
+    """
+    return str(uuid.uuid5(ID_NAMESPACE, '\n'.join(parts)))
+
+
+def page_fingerprint(html: str) -> str:
+    """
+    Returns a hash of the visible content of a page.
+
+    Scripts, form fields, meta tags and markup are dropped before hashing, so
+    per-request tokens do not make an unchanged page look modified.
+    """
+    text = _TAGS.sub(' ', _VOLATILE.sub(' ', html))
+    return hashlib.sha256(_SPACES.sub(' ', text).strip().encode('utf-8')).hexdigest()
+
+
+class PageState:
+    """Thread-safe SQLite store of fetched pages and the records built from them."""
+
+    def __init__(self, db_path: Path, parser_version: int = 1):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+            parser_version: Version of the parsing code; records of other versions are rebuilt
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.parser_version = parser_version
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored state of a page built by the current parser version.
+
+        Returns:
+            Dict with etag, last_modified, content_hash and record, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash, record FROM pages WHERE url = ? AND parser_version = ?",
+                (url, self.parser_version)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2], 'record': json.loads(row[3])}
+
+    def save(self, url: str, content_hash: str, record: Dict[str, Any],
+             etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Stores the validators, fingerprint and record of a freshly parsed page."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, parser_version, record, "
+                "fetched_at, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, self.parser_version,
+                 json.dumps(record, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Records that a page was checked and found unchanged, refreshing its validators."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET checked_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url)
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
+
+
+_states: Dict[int, PageState] = {}
+_states_lock = threading.Lock()
+
+
+def get_page_state(parser_version: int = 1) -> PageState:
+    """
+    Returns the process-wide page store for a parser version.
+
+    The file is read on first use from BETAREN_PAGE_STATE.
+    """
+    with _states_lock:
+        state = _states.get(parser_version)
+        if state is None:
+            state = _states[parser_version] = PageState(
+                Path(os.getenv('BETAREN_PAGE_STATE', str(DEFAULT_STATE_PATH))), parser_version
+            )
+        return state
@@ -0,0 +1,336 @@
+"""
+Perceptual-hash index for near-duplicate detection of downloaded images.
+Images are hashed with dHash and kept in a multi-index hash table, so a lookup
+only compares the few candidates sharing part of the hash instead of the whole collection.
+The index is persisted next to the image tree and updated incrementally.
+"""
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger("phash_index")
+
+HASH_SIZE = 8  # 8x8 = 64-битный хеш
+# Максимальное расстояние Хэмминга, при котором изображения считаются почти одинаковыми
+DEFAULT_MAX_DISTANCE = 6
+INDEX_NAME = "phash_index.json"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+def dhash(image: Union[str, Path, 'Image.Image'], hash_size: int = HASH_SIZE) -> int:
+    """
+    Computes the difference hash of an image.
+
+    The image is reduced to (hash_size + 1) x hash_size grayscale pixels and every
+    bit records whether a pixel is brighter than its right neighbour, so the hash
+    survives resizing, recompression and small watermarks.
+
+    Args:
+        image: Image file path or PIL image
+        hash_size: Hash side length in bits
+
+    Returns:
+        Hash as an integer of hash_size * hash_size bits
+    """
+    from PIL import Image
+
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as img:
+            return dhash(img, hash_size)
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    """Returns the number of differing bits of two hashes."""
+    return bin(a ^ b).count('1')
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing table for Hamming-radius queries.
+
+    The hash is split into max_distance + 1 disjoint bit ranges. Two hashes that
+    differ in at most max_distance bits agree exactly on at least one range, so
+    a query only checks the keys sharing one of its range values instead of the
+    whole collection.
+    """
+
+    def __init__(self, max_distance: int, bits: int = HASH_SIZE * HASH_SIZE):
+        """
+        Args:
+            max_distance: Largest radius answered through the tables (larger radii fall back to a scan)
+            bits: Hash length in bits
+        """
+        self.max_distance = max_distance
+        parts = max_distance + 1
+        width, extra = divmod(bits, parts)
+        self._ranges: List[Tuple[int, int]] = []  # (сдвиг, маска)
+        shift = 0
+        for part in range(parts):
+            part_width = width + (1 if part < extra else 0)
+            self._ranges.append((shift, (1 << part_width) - 1))
+            shift += part_width
+        self._tables: List[Dict[int, Set[str]]] = [{} for _ in self._ranges]
+        self._values: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: int, key: str) -> None:
+        """Adds a key with the given hash, replacing its previous hash."""
+        self.discard(key)
+        self._values[key] = value
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            table.setdefault((value >> shift) & mask, set()).add(key)
+
+    def discard(self, key: str) -> None:
+        """Removes a key, if present."""
+        value = self._values.pop(key, None)
+        if value is None:
+            return
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            bucket = table.get((value >> shift) & mask)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[(value >> shift) & mask]
+
+    def search(self, value: int, max_distance: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Yields (distance, key) for all keys within max_distance of the hash."""
+        radius = self.max_distance if max_distance is None else max_distance
+        if radius > self.max_distance:
+            candidates = self._values.keys()
+        else:
+            candidates = set()
+            for table, (shift, mask) in zip(self._tables, self._ranges):
+                candidates.update(table.get((value >> shift) & mask, ()))
+        for key in candidates:
+            distance = hamming(value, self._values[key])
+            if distance <= radius:
+                yield distance, key
+
+
+class PHashIndex:
+    """
+    Persistent near-duplicate index over an image tree.
+
+    Keys are POSIX paths relative to the image root, so the same index file can be
+    used by the crawler and by the dataset preparation tools.
+    """
+
+    def __init__(self, images_dir: Path, index_path: Optional[Path] = None,
+                 max_distance: int = DEFAULT_MAX_DISTANCE):
+        """
+        Args:
+            images_dir: Root of the per-risk image folders
+            index_path: Index file (defaults to phash_index.json next to images_dir)
+            max_distance: Maximum Hamming distance for near-duplicates
+        """
+        self.images_dir = Path(images_dir)
+        self.index_path = Path(index_path) if index_path else self.images_dir.parent / INDEX_NAME
+        self.max_distance = max_distance
+        # ключ -> (хеш, mtime, размер файла)
+        self._entries: Dict[str, Tuple[int, float, int]] = {}
+        self._hashes = MultiIndexHash(max_distance)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать индекс {self.index_path}, он будет перестроен: {e}")
+            return
+        for key, (hex_hash, mtime, size) in data.get('items', {}).items():
+            value = int(hex_hash, 16)
+            self._entries[key] = (value, mtime, size)
+            self._hashes.add(value, key)
+
+    def key(self, path: Path) -> str:
+        """Returns the index key of an image path."""
+        return Path(os.path.relpath(path, self.images_dir)).as_posix()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: Path) -> bool:
+        return self.key(path) in self._entries
+
+    def get(self, path: Path) -> Optional[int]:
+        """Returns the stored hash of an image, or None if it is not indexed."""
+        entry = self._entries.get(self.key(path))
+        return entry[0] if entry else None
+
+    def add(self, path: Path, value: Optional[int] = None) -> Optional[int]:
+        """
+        Adds or refreshes an image.
+
+        Args:
+            path: Image path inside the image root
+            value: Precomputed hash (computed from the file if omitted)
+
+        Returns:
+            The image hash, or None if the file could not be decoded
+        """
+        path = Path(path)
+        if value is None:
+            try:
+                value = dhash(path)
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить хеш {path}: {e}")
+                return None
+        stat = path.stat() if path.exists() else None
+        key = self.key(path)
+        with self._lock:
+            self._entries[key] = (value, stat.st_mtime if stat else 0.0, stat.st_size if stat else 0)
+            self._hashes.add(value, key)
+            self._dirty = True
+        return value
+
+    def remove(self, path: Path) -> None:
+        """Removes an image from the index."""
+        key = self.key(path)
+        with self._lock:
+            if self._entries.pop(key, None):
+                self._hashes.discard(key)
+                self._dirty = True
+
+    def find(self, value: int, max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Returns (distance, key) pairs of indexed images near the hash, closest first.
+
+        Args:
+            value: Image hash
+            max_distance: Search radius (defaults to the index setting)
+        """
+        with self._lock:
+            return sorted(self._hashes.search(value, max_distance))
+
+    def add_if_unique(self, path: Path, value: int) -> Optional[str]:
+        """
+        Adds the image unless a near-duplicate already exists in the same folder.
+
+        The check and the insertion are atomic, so concurrent downloads of two
+        copies of one photo cannot both pass.
+
+        Returns:
+            Key of the existing near-duplicate, or None if the image was added
+        """
+        key = self.key(path)
+        folder = key.rpartition('/')[0]
+        with self._lock:
+            for _, other in sorted(self._hashes.search(value)):
+                if other != key and other.rpartition('/')[0] == folder:
+                    return other
+            self._entries[key] = (value, 0.0, 0)
+            self._hashes.add(value, key)
+            self._dirty = True
+        return None
+
+    def update(self) -> Tuple[int, int]:
+        """
+        Synchronises the index with the image tree.
+
+        Only new or modified files are hashed; entries of deleted files are dropped.
+
+        Returns:
+            (number of hashed files, number of removed entries)
+        """
+        seen: Set[str] = set()
+        hashed = 0
+        for path in self.images_dir.rglob('*'):
+            if not path.is_file() or path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            key = self.key(path)
+            seen.add(key)
+            stat = path.stat()
+            entry = self._entries.get(key)
+            if entry and entry[1] == stat.st_mtime and entry[2] == stat.st_size:
+                continue
+            if self.add(path) is not None:
+                hashed += 1
+        removed = 0
+        for key in set(self._entries) - seen:
+            self.remove(self.images_dir / key)
+            removed += 1
+        if hashed or removed:
+            logger.info(f"Индекс перцептивных хешей обновлен: +{hashed}, -{removed}, всего {len(self)}")
+        return hashed, removed
+
+    def clusters(self) -> Dict[str, str]:
+        """
+        Groups all indexed images into clusters of near-duplicates.
+
+        Returns:
+            Mapping of key to cluster id (the key of one cluster member)
+        """
+        with self._lock:
+            parent = {key: key for key in self._entries}
+
+            def find_root(key):
+                while parent[key] != key:
+                    parent[key] = parent[parent[key]]
+                    key = parent[key]
+                return key
+
+            for key, (value, _, _) in self._entries.items():
+                for _, other in self._hashes.search(value):
+                    if other in parent:
+                        a, b = find_root(key), find_root(other)
+                        if a != b:
+                            parent[max(a, b)] = min(a, b)
+            return {key: find_root(key) for key in parent}
+
+    def save(self) -> None:
+        """Writes the index to disk if it has changed."""
+        # Запись файла сериализуется отдельно, чтобы не блокировать поиск на время записи
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                items = {key: [f"{value:016x}", mtime, size] for key, (value, mtime, size) in self._entries.items()}
+                self._dirty = False
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'hash_size': HASH_SIZE, 'items': items}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+
+_indexes: Dict[Path, PHashIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_phash_index(images_dir: Path) -> PHashIndex:
+    """
+    Returns the process-wide index for an image tree.
+
+    The search radius is read on first use from PHASH_MAX_DISTANCE.
+    """
+    images_dir = Path(images_dir).resolve()
+    with _indexes_lock:
+        index = _indexes.get(images_dir)
+        if index is None:
+            index = _indexes[images_dir] = PHashIndex(
+                images_dir, max_distance=int(os.getenv('PHASH_MAX_DISTANCE', DEFAULT_MAX_DISTANCE))
+            )
+        return index
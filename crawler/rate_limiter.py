@@ -0,0 +1,189 @@
+"""
+Per-host token-bucket rate limiter shared by all crawler modules.
+Each host gets its own bucket, so requests to unrelated hosts never wait for each other.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger("rate_limiter")
+
+# Значения по умолчанию: запросов в секунду на хост и размер "пачки"
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+
+# Статусы, на которые сервер отвечает при слишком частых запросах
+BACKOFF_STATUSES = (403, 429)
+MIN_RATE = 0.05
+MAX_BACKOFF = 300.0
+
+
+def get_host(url: str) -> str:
+    """Returns the lower-cased host of a URL (or the string itself if it is already a host)."""
+    host = urlparse(url).hostname if '//' in url else url
+    return (host or url).lower()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given in seconds; HTTP dates are ignored."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket for a single host with adaptive backoff.
+
+    The rate is halved on every 403/429 response and grows back towards
+    the configured rate with each successful response.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Takes one token and returns how many seconds the caller must wait before using it.
+        Tokens may go negative, which queues callers fairly behind each other.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def penalize(self, retry_after: Optional[float] = None) -> float:
+        """Slows the bucket down after a throttling response and returns the pause in seconds."""
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        pause = min(MAX_BACKOFF, retry_after if retry_after is not None else 1.0 / self.rate)
+        self.blocked_until = max(self.blocked_until, now + pause)
+        return pause
+
+    def reward(self) -> None:
+        """Recovers the rate additively after a successful response."""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+
+class HostRateLimiter:
+    """
+    Thread-safe collection of token buckets keyed by host.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 host_limits: Optional[Dict[str, Tuple[float, int]]] = None):
+        """
+        Args:
+            rate: Default number of requests per second for a host
+            burst: Default number of requests that may be sent without waiting
+            host_limits: Per-host overrides as {host: (rate, burst)}
+        """
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = {get_host(host): limits for host, limits in (host_limits or {}).items()}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            bucket = self._buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+    def configure_host(self, host: str, rate: float, burst: int = 1) -> None:
+        """Sets an individual limit for a host (e.g. a search engine)."""
+        host = get_host(host)
+        with self._lock:
+            self.host_limits[host] = (rate, burst)
+            self._buckets[host] = TokenBucket(rate, burst)
+
+    def wait(self, url: str) -> float:
+        """
+        Blocks until a request to the URL's host is allowed.
+
+        Returns:
+            Number of seconds spent waiting
+        """
+        host = get_host(url)
+        with self._lock:
+            delay = self._bucket(host).reserve()
+        if delay > 0:
+            logger.debug(f"Ожидание {delay:.2f} с перед запросом к {host}")
+            time.sleep(delay)
+        return delay
+
+    def report(self, url: str, status_code: Optional[int], retry_after: Optional[str] = None) -> None:
+        """
+        Adapts the host's rate to the response status.
+
+        Args:
+            url: Requested URL
+            status_code: HTTP status of the response
+            retry_after: Value of the Retry-After header, if any
+        """
+        host = get_host(url)
+        with self._lock:
+            bucket = self._bucket(host)
+            if status_code in BACKOFF_STATUSES:
+                pause = bucket.penalize(parse_retry_after(retry_after))
+                logger.warning(f"Хост {host} ответил {status_code}, снижаем частоту до "
+                               f"{bucket.rate:.2f} запр/с, пауза {pause:.1f} с")
+            elif isinstance(status_code, int) and status_code < 400:
+                bucket.reward()
+
+
+def parse_host_limits(value: str) -> Dict[str, Tuple[float, int]]:
+    """Parses the RATE_LIMIT_HOSTS setting ("host=rate:burst,...")."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        try:
+            host, spec = entry.split('=', 1)
+            rate, _, burst = spec.partition(':')
+            limits[host.strip()] = (float(rate), int(burst or 1))
+        except ValueError:
+            logger.warning(f"Некорректная настройка лимита: {entry}")
+    return limits
+
+
+_limiter: Optional[HostRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> HostRateLimiter:
+    """
+    Returns the process-wide rate limiter shared by all crawlers.
+
+    Settings are read on first use, after the calling module has loaded its .env:
+    RATE_LIMIT_PER_HOST, RATE_LIMIT_BURST and RATE_LIMIT_HOSTS
+    (per-host overrides, e.g. "yandex.ru=0.2:1,www.google.com=0.5:1").
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = HostRateLimiter(
+                float(os.getenv('RATE_LIMIT_PER_HOST', DEFAULT_RATE)),
+                int(os.getenv('RATE_LIMIT_BURST', DEFAULT_BURST)),
+                parse_host_limits(os.getenv('RATE_LIMIT_HOSTS', ''))
+            )
+        return _limiter
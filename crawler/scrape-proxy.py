@@ -2,11 +2,12 @@ import requests
 from bs4 import BeautifulSoup
 import json
 import re
-import random
 import time
 from urllib.parse import urljoin
 import os
 from dotenv import load_dotenv
+import http_client
+from rate_limiter import get_rate_limiter
 
 # Загрузка настроек из .env
 load_dotenv()
@@ -14,29 +15,25 @@ load_dotenv()
 # Получение настроек
 SLEEP_BETWEEN_REQUESTS = float(os.getenv('SLEEP_BETWEEN_REQUESTS', 1.5))
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
-PROXY_LIST = os.getenv('PROXY_LIST', '').split(',') if os.getenv('PROXY_LIST') else []
-
-
-def get_random_proxy():
-    """Возвращает случайный прокси из списка или None, если список пуст."""
-    return random.choice(PROXY_LIST) if PROXY_LIST else None
 
 
 def fetch_page_content(url, retries=0):
     """Загружает содержимое страницы с использованием прокси и повторными попытками."""
-    proxy = get_random_proxy()
-    proxies = {'http': proxy, 'https': proxy} if proxy else None
+    # Прокси из PROXY_LIST и задержку между запросами к хосту обеспечивает http_client
+    proxies = http_client.get_proxies()
+    proxy = proxies['http'] if proxies else None
 
     try:
-        response = requests.get(url, timeout=30, proxies=proxies)
+        response = http_client.get(url, timeout=30, proxies=proxies)
         response.raise_for_status()
-        time.sleep(SLEEP_BETWEEN_REQUESTS)  # Задержка между запросами
         return response.text
     except requests.RequestException as e:
         print(f"Ошибка при загрузке {url} (прокси: {proxy}): {e}")
         if retries < MAX_RETRIES:
             print(f"Повторная попытка {retries + 1}/{MAX_RETRIES} для {url}")
-            time.sleep(SLEEP_BETWEEN_REQUESTS * (retries + 1))
+            if e.response is None or e.response.status_code not in (403, 429):
+                # На 403/429 ограничитель сам замедляет хост, в остальных случаях ждем сами
+                time.sleep(SLEEP_BETWEEN_REQUESTS * (retries + 1))
             return fetch_page_content(url, retries + 1)
         return None
 
@@ -115,6 +112,8 @@ def parse_weeds(url):
 
 def main():
     base_url = 'https://betaren.ru'
+    if SLEEP_BETWEEN_REQUESTS > 0:
+        get_rate_limiter().configure_host(base_url, rate=1.0 / SLEEP_BETWEEN_REQUESTS, burst=1)
     urls = {
         'diseases': f'{base_url}/harmful/bolezni/',
         'pests': f'{base_url}/harmful/vrediteli/',
@@ -3,8 +3,7 @@ from bs4 import BeautifulSoup
 import json
 import re
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import http_client
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,15 +15,14 @@ logging.basicConfig(
 
 
 def setup_session():
-    session = requests.Session()
-    retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-    session.mount('https://', HTTPAdapter(max_retries=retries))
-    return session
+    # Общая сессия с пулом соединений и повторными попытками
+    return http_client.get_session()
 
 
 def fetch_page_content(url, session, timeout=30):
     try:
-        response = session.get(url, timeout=timeout)
+        # Запрос через http_client, чтобы учитывать ограничение частоты и замедление при 403/429
+        response = http_client.get(url, timeout=timeout)
         response.raise_for_status()
         if not response.text.strip():
             logging.warning(f"Пустой ответ от {url}")
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
-from bs4 import BeautifulSoup
 import json
 import re
 import random
@@ -10,25 +8,19 @@ import time
 from urllib.parse import urljoin
 import os
 import csv
-import uuid
 import logging
 from dotenv import load_dotenv
-from openai import OpenAI
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from twocaptcha import TwoCaptcha
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("betaren_scrape.log", encoding='utf-8', mode='w'),
-        logging.StreamHandler()
-    ]
-)
+import http_client
+from rate_limiter import get_rate_limiter
+from webdriver_pool import get_webdriver_pool
+from page_fetcher import get_page_fetcher
+from translator import get_translator
+from page_state import stable_id
+from crop_index import EntityCropIndex
+from debug_archive import archive_page
+from term_tagger import CROP_GROUPS
+from cli_setup import setup_logging
+
 logger = logging.getLogger("BetarenScraper")
 
 # Загрузка настроек из .env
@@ -36,6 +28,7 @@ load_dotenv()
 
 # Настройки
 SLEEP_RANGE = (5.0, 10.0)
+BASE_URL = 'https://betaren.ru'
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 5))
 OUTPUT_DIR = os.getenv('DOWNLOAD_DIR', 'downloads')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -43,20 +36,6 @@ TWOCAPTCHA_API_KEY = os.getenv('TWOCAPTCHA_API_KEY', '')
 PROXY_LIST = os.getenv('PROXY_LIST', '').split(',') if os.getenv('PROXY_LIST') else []
 CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', 'D:/crawler_risks/chromedriver.exe')
 
-# Проверка ключей API
-if not OPENAI_API_KEY:
-    logger.warning("OPENAI_API_KEY не задан. Переводы не будут выполняться.")
-else:
-    logger.info("OPENAI_API_KEY настроен успешно.")
-
-if not TWOCAPTCHA_API_KEY:
-    logger.warning("TWOCAPTCHA_API_KEY не задан. Обход капчи невозможен.")
-else:
-    logger.info("TWOCAPTCHA_API_KEY настроен успешно.")
-
-# Инициализация OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 # Список User-Agent
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -64,64 +43,45 @@ USER_AGENTS = [
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36'
 ]
 
-# GUID культур
-crop_guids = {
-    "пшеница": "501933b1-b43d-11e9-a3c5-00155d012200",
-    "ячмень": "ed8d52db-9b99-4ac3-9691-082829953c46",
-    "кукуруза": "c61ecabe-229e-4361-921a-081125d5c3c1",
-    "овес": "c593d0c4-653c-418b-9ac4-35d58f3ff627",
-    "рапс": "f503750b-f20d-4bf7-af68-ce922974018c",
-    "горчица": "4f091a7c-30f4-4825-a76a-1ffffb89483b",
-    "соя": "soy_guid_placeholder",
-    "сахарная свекла": "sugar_beet_guid_placeholder",
-    "подсолнечник": "sunflower_guid_placeholder",
-    "горох": "pea_guid_placeholder",
-    "нут": "nut_guid_placeholder",
-    "лен": "flax_guid_placeholder",
-    "картофель": "potato_guid_placeholder",
-    "садовые культуры": "orchard_guid_placeholder",
-    "виноградники": "vineyard_guid_placeholder"
-}
-
-# Создание директорий
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-for folder in ["diseases", "pests", "weeds"]:
-    os.makedirs(os.path.join(OUTPUT_DIR, "images", folder), exist_ok=True)
+def init():
+    """Настраивает логирование, проверяет ключи API и создает папки результатов"""
+    setup_logging("betaren_scrape.log", level=logging.DEBUG,
+                  fmt='%(asctime)s - %(levelname)s - %(message)s', mode='w')
+
+    # Проверка ключей API
+    if not OPENAI_API_KEY:
+        logger.warning("OPENAI_API_KEY не задан. Переводы не будут выполняться.")
+    else:
+        logger.info("OPENAI_API_KEY настроен успешно.")
+
+    if not TWOCAPTCHA_API_KEY:
+        logger.warning("TWOCAPTCHA_API_KEY не задан. Обход капчи невозможен.")
+    else:
+        logger.info("TWOCAPTCHA_API_KEY настроен успешно.")
+
+    # Создание директорий
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for folder in ["diseases", "pests", "weeds"]:
+        os.makedirs(os.path.join(OUTPUT_DIR, "images", folder), exist_ok=True)
 
 def translate_text(text, target_lang):
-    if not text or not client:
+    if not text:
         return ''
-    try:
-        max_length = 1000
-        if len(text) > max_length:
-            parts = [text[i:i+max_length] for i in range(0, len(text), max_length)]
-            translated_parts = []
-            for part in parts:
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "Ты профессиональный переводчик, специализирующийся на сельскохозяйственной терминологии."},
-                        {"role": "user", "content": f"Переведи следующий текст с русского на {target_lang}, сохраняя агрономическую терминологию:\n\n{part}"}
-                    ],
-                    max_tokens=2000,
-                    temperature=0.2
-                )
-                translated_parts.append(response.choices[0].message.content.strip())
-            return ' '.join(translated_parts)
+    return get_translator().translate(text, target_lang)
+
+def add_translations(record):
+    """Заполняет поля *_ua и *_en записи по полям *_ru и name пакетными запросами"""
+    fields = {key[:-3]: value for key, value in record.items() if key.endswith('_ru') and value}
+    if record.get('name'):
+        fields['name'] = record['name']
+    translated = get_translator().translate_fields(fields, ('ua', 'en'))
+    for field in fields:
+        if field == 'name':
+            record['name_en'] = translated['en'][field]
         else:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Ты профессиональный переводчик, специализирующийся на сельскохозяйственной терминологии."},
-                    {"role": "user", "content": f"Переведи следующий текст с русского на {target_lang}, сохраняя агрономическую терминологию:\n\n{text}"}
-                ],
-                max_tokens=2000,
-                temperature=0.2
-            )
-            return response.choices[0].message.content.strip()
-    except Exception as e:
-        logger.error(f"Ошибка перевода текста: {e}")
-        return ''
+            record[f'{field}_ua'] = translated['ua'][field]
+            record[f'{field}_en'] = translated['en'][field]
+    return record
 
 def solve_recaptcha(site_key, url):
     """Решает reCAPTCHA с использованием 2Captcha."""
@@ -129,6 +89,7 @@ def solve_recaptcha(site_key, url):
         logger.warning("TWOCAPTCHA_API_KEY не задан, пропускаем решение капчи.")
         return None
 
+    from twocaptcha import TwoCaptcha
     solver = TwoCaptcha(TWOCAPTCHA_API_KEY)
     try:
         result = solver.recaptcha(sitekey=site_key, url=url)
@@ -138,7 +99,10 @@ def solve_recaptcha(site_key, url):
         logger.error(f"Ошибка при решении reCAPTCHA: {e}")
         return None
 
-def fetch_page_content(url):
+def create_webdriver():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
     options = webdriver.ChromeOptions()
     user_agent = random.choice(USER_AGENTS)  # Исправление: выбор случайного User-Agent
     options.add_argument(f'user-agent={user_agent}')
@@ -147,44 +111,55 @@ def fetch_page_content(url):
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument('--disable-geolocation')
 
+    # Прокси выбирается при запуске браузера и меняется при его перезапуске пулом
     if PROXY_LIST:
         proxy = random.choice([p for p in PROXY_LIST if p])
         logger.debug(f"Используется прокси: {proxy}")
         options.add_argument(f'--proxy-server={proxy}')
 
     service = Service(CHROMEDRIVER_PATH)
-    driver = webdriver.Chrome(service=service, options=options)
+    return webdriver.Chrome(service=service, options=options)
 
-    try:
-        driver.get(url)
-        time.sleep(random.uniform(5.0, 10.0))
+def render_page_content(url):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
 
-        # Проверка reCAPTCHA
-        if 'g-recaptcha' in driver.page_source:
-            logger.debug("Обнаружена reCAPTCHA, пытаемся решить...")
-            try:
-                site_key = driver.find_element(By.CLASS_NAME, 'g-recaptcha').get_attribute('data-sitekey')
-                captcha_response = solve_recaptcha(site_key, url)
-                if captcha_response:
-                    driver.execute_script(f'document.getElementById("g-recaptcha-response").innerHTML="{captcha_response}";')
-                    driver.find_element(By.ID, 'feedback-form').submit()
-                    time.sleep(random.uniform(5.0, 10.0))
-                    logger.debug("reCAPTCHA решена")
-                else:
-                    logger.warning("Не удалось решить reCAPTCHA")
-            except Exception as e:
-                logger.error(f"Ошибка при решении reCAPTCHA: {e}")
+    try:
+        with get_webdriver_pool('scrape_betaren', create_webdriver).driver() as driver:
+            get_rate_limiter().wait(url)
+            driver.get(url)
+            WebDriverWait(driver, 15).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
 
-        html_content = driver.page_source
-        with open('debug_page.html', 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        logger.debug(f"HTML сохранен в debug_page.html для {url}")
-        return html_content
+            # Проверка reCAPTCHA
+            if 'g-recaptcha' in driver.page_source:
+                logger.debug("Обнаружена reCAPTCHA, пытаемся решить...")
+                try:
+                    site_key = driver.find_element(By.CLASS_NAME, 'g-recaptcha').get_attribute('data-sitekey')
+                    captcha_response = solve_recaptcha(site_key, url)
+                    if captcha_response:
+                        driver.execute_script(f'document.getElementById("g-recaptcha-response").innerHTML="{captcha_response}";')
+                        driver.find_element(By.ID, 'feedback-form').submit()
+                        time.sleep(random.uniform(5.0, 10.0))
+                        logger.debug("reCAPTCHA решена")
+                    else:
+                        logger.warning("Не удалось решить reCAPTCHA")
+                except Exception as e:
+                    logger.error(f"Ошибка при решении reCAPTCHA: {e}")
+
+            return driver.page_source
     except Exception as e:
         logger.error(f"Ошибка при загрузке страницы {url}: {e}")
         return None
-    finally:
-        driver.quit()
+
+def fetch_page_content(url):
+    # Браузер запускается, только если обычный запрос вернул капчу или неполную страницу
+    html_content = get_page_fetcher('scrape_betaren', render_page_content, USER_AGENTS).fetch(url)
+    # Страницы сохраняются для отладки, только если включен архив DEBUG_ARCHIVE
+    archive_page(url, html_content, 'page')
+    return html_content
 
 def download_image(url, folder, filename, referer):
     if not url:
@@ -197,7 +172,7 @@ def download_image(url, folder, filename, referer):
             'User-Agent': random.choice(USER_AGENTS),
             'Referer': referer
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url, headers=headers, timeout=10)
         response.raise_for_status()
 
         image_path = os.path.join(OUTPUT_DIR, folder, filename)
@@ -211,6 +186,8 @@ def download_image(url, folder, filename, referer):
 
 def parse_diseases(url, crop):
     """Парсит данные о болезнях с общей и детальных страниц."""
+    from bs4 import BeautifulSoup
+
     html_content = fetch_page_content(url)
     if not html_content:
         logger.debug(f"Не удалось загрузить контент для {url}")
@@ -277,44 +254,41 @@ def parse_diseases(url, crop):
                 logger.debug(f"Пропущена запись для {name}: отсутствует описание и симптомы")
                 continue
 
-            disease_id = str(uuid.uuid4())
+            disease_id = stable_id(detail_url, crop)
             image_filename = f"disease_{name.replace(' ', '_').replace('/', '_')}_{disease_id}.jpg"
             image_path = download_image(image_url, 'diseases', image_filename, detail_url) if image_url else ''
 
-            diseases.append({
+            diseases.append(add_translations({
                 'id': disease_id,
                 'name': name,
-                'name_en': translate_text(name, 'en') if name else '',
+                'name_en': '',
                 'scientific_name': '',
                 'is_active': True,
                 'description_ru': description,
-                'description_ua': translate_text(description, 'ua') if description else '',
-                'description_en': translate_text(description, 'en') if description else '',
+                'description_ua': '',
+                'description_en': '',
                 'symptoms_ru': symptoms,
-                'symptoms_ua': translate_text(symptoms, 'ua') if symptoms else '',
-                'symptoms_en': translate_text(symptoms, 'en') if symptoms else '',
+                'symptoms_ua': '',
+                'symptoms_en': '',
                 'development_conditions_ru': conditions,
-                'development_conditions_ua': translate_text(conditions, 'ua') if conditions else '',
-                'development_conditions_en': translate_text(conditions, 'en') if conditions else '',
+                'development_conditions_ua': '',
+                'development_conditions_en': '',
                 'control_measures_ru': measures,
-                'control_measures_ua': translate_text(measures, 'ua') if measures else '',
-                'control_measures_en': translate_text(measures, 'en') if measures else '',
+                'control_measures_ua': '',
+                'control_measures_en': '',
                 'photo_path': image_path,
                 'source_urls': detail_url,
                 'crops': crop
-            })
+            }))
             logger.info(f"Добавлена болезнь: {name} для {crop}")
 
-            # Сохранить HTML для отладки
-            with open(f'debug_disease_{disease_id}.html', 'w', encoding='utf-8') as f:
-                f.write(detail_soup.prettify())
-            logger.debug(f"HTML детальной страницы сохранен в debug_disease_{disease_id}.html")
-
     logger.debug(f"Итоговый список болезней: {len(diseases)} записей")
     return diseases
 
 def parse_pests(url, crop):
     """Парсит данные о вредителях с общей и детальных страниц."""
+    from bs4 import BeautifulSoup
+
     html_content = fetch_page_content(url)
     if not html_content:
         logger.debug(f"Не удалось загрузить контент для {url}")
@@ -363,43 +337,41 @@ def parse_pests(url, crop):
                 logger.debug(f"Пропущен некорректный заголовок: {name}")
                 continue
 
-            pest_id = str(uuid.uuid4())
+            pest_id = stable_id(detail_url, crop)
             image_filename = f"pest_{name.replace(' ', '_').replace('/', '_')}_{pest_id}.jpg"
             image_path = download_image(image_url, 'pests', image_filename, detail_url) if image_url else ''
 
-            pests.append({
+            pests.append(add_translations({
                 'id': pest_id,
                 'name': name,
-                'name_en': translate_text(name, 'en') if name else '',
+                'name_en': '',
                 'scientific_name': '',
                 'is_active': True,
                 'description_ru': description,
-                'description_ua': translate_text(description, 'ua') if description else '',
-                'description_en': translate_text(description, 'en') if description else '',
+                'description_ua': '',
+                'description_en': '',
                 'damage_symptoms_ru': damage,
-                'damage_symptoms_ua': translate_text(damage, 'ua') if damage else '',
-                'damage_symptoms_en': translate_text(damage, 'en') if damage else '',
+                'damage_symptoms_ua': '',
+                'damage_symptoms_en': '',
                 'biology_ru': biology,
-                'biology_ua': translate_text(biology, 'ua') if biology else '',
-                'biology_en': translate_text(biology, 'en') if biology else '',
+                'biology_ua': '',
+                'biology_en': '',
                 'control_measures_ru': measures,
-                'control_measures_ua': translate_text(measures, 'ua') if measures else '',
-                'control_measures_en': translate_text(measures, 'en') if measures else '',
+                'control_measures_ua': '',
+                'control_measures_en': '',
                 'photo_path': image_path,
                 'source_urls': detail_url,
                 'crops': crop
-            })
+            }))
             logger.info(f"Добавлен вредитель: {name} для {crop}")
 
-            with open(f'debug_pest_{pest_id}.html', 'w', encoding='utf-8') as f:
-                f.write(detail_soup.prettify())
-            logger.debug(f"HTML детальной страницы сохранен в debug_pest_{pest_id}.html")
-
     logger.debug(f"Итоговый список вредителей: {len(pests)} записей")
     return pests
 
 def parse_weeds(url):
     """Парсит данные о сорняках с общей и детальных страниц."""
+    from bs4 import BeautifulSoup
+
     html_content = fetch_page_content(url)
     if not html_content:
         logger.debug(f"Не удалось загрузить контент для {url}")
@@ -450,37 +422,33 @@ def parse_weeds(url):
                 logger.debug(f"Пропущен некорректный заголовок: {name}")
                 continue
 
-            weed_id = str(uuid.uuid4())
+            weed_id = stable_id(detail_url)
             image_filename = f"weed_{name.replace(' ', '_').replace('/', '_')}_{weed_id}.jpg"
             image_path = download_image(image_url, 'weeds', image_filename, detail_url) if image_url else ''
 
-            weeds.append({
+            weeds.append(add_translations({
                 'id': weed_id,
                 'name': name,
-                'name_en': translate_text(name, 'en') if name else '',
+                'name_en': '',
                 'scientific_name': scientific_name,
                 'is_active': True,
                 'description_ru': description,
-                'description_ua': translate_text(description, 'ua') if description else '',
-                'description_en': translate_text(description, 'en') if description else '',
+                'description_ua': '',
+                'description_en': '',
                 'biological_features_ru': features,
-                'biological_features_ua': translate_text(features, 'ua') if features else '',
-                'biological_features_en': translate_text(features, 'en') if features else '',
+                'biological_features_ua': '',
+                'biological_features_en': '',
                 'harmfulness_ru': harmfulness,
-                'harmfulness_ua': translate_text(harmfulness, 'ua') if harmfulness else '',
-                'harmfulness_en': translate_text(harmfulness, 'en') if harmfulness else '',
+                'harmfulness_ua': '',
+                'harmfulness_en': '',
                 'control_measures_ru': measures,
-                'control_measures_ua': translate_text(measures, 'ua') if measures else '',
-                'control_measures_en': translate_text(measures, 'en') if measures else '',
+                'control_measures_ua': '',
+                'control_measures_en': '',
                 'photo_path': image_path,
                 'source_urls': detail_url
-            })
+            }))
             logger.info(f"Добавлен сорняк: {name}")
 
-            with open(f'debug_weed_{weed_id}.html', 'w', encoding='utf-8') as f:
-                f.write(detail_soup.prettify())
-            logger.debug(f"HTML детальной страницы сохранен в debug_weed_{weed_id}.html")
-
     logger.debug(f"Итоговый список сорняков: {len(weeds)} записей")
     return weeds
 
@@ -498,7 +466,10 @@ def save_to_csv(data, filename, fieldnames):
         logger.error(f"Ошибка при сохранении CSV {filename}: {e}")
 
 def main():
-    base_url = 'https://betaren.ru'
+    init()
+    base_url = BASE_URL
+    # Интервал между запросами к betaren.ru задает общий ограничитель по хостам
+    get_rate_limiter().configure_host(BASE_URL, rate=1.0 / SLEEP_RANGE[0], burst=1)
     urls = {
         'diseases': {
             'cereals': f'{base_url}/harmful/bolezni/bolezni-zernovykh-kultur/',
@@ -529,34 +500,13 @@ def main():
         'weeds': f'{base_url}/harmful/sornyaki/'
     }
 
-    # Инициализация списков для данных
-    diseases = []
-    disease_descriptions = []
-    disease_crops = []
-    disease_images = []
-    pests = []
-    pest_descriptions = []
-    pest_crops = []
-    pest_images = []
-    weeds = []
-    weed_descriptions = []
-    weed_crops = []
-    weed_images = []
+    # Индексы сущностей, их описаний, изображений и связей с культурами
+    diseases = EntityCropIndex('disease_id')
+    pests = EntityCropIndex('vermin_id')
+    weeds = EntityCropIndex('weed_id')
 
     # Соответствие категорий и культур
-    crop_mapping = {
-        'cereals': ['пшеница', 'ячмень', 'овес'],
-        'rapeseed': ['рапс'],
-        'corn': ['кукуруза'],
-        'soy': ['соя'],
-        'sugar_beet': ['сахарная свекла'],
-        'sunflower': ['подсолнечник'],
-        'pea_nut': ['горох', 'нут'],
-        'flax': ['лен'],
-        'potato': ['картофель'],
-        'orchard': ['садовые культуры'],
-        'vineyard': ['виноградники']
-    }
+    crop_mapping = CROP_GROUPS
 
     # Парсинг болезней
     for category, crop_url in urls['diseases'].items():
@@ -568,18 +518,16 @@ def main():
                 
                 for disease in crop_diseases:
                     disease_id = disease['id']
-                    desc_id = str(uuid.uuid4())
-                    img_id = str(uuid.uuid4())
+                    desc_id = stable_id(disease_id, 'description')
+                    img_id = stable_id(disease_id, 'image')
 
-                    diseases.append({
+                    diseases.add({
                         'id': disease_id,
                         'name': disease['name'],
                         'name_en': disease['name_en'],
                         'scientific_name': disease['scientific_name'],
                         'is_active': disease['is_active']
-                    })
-
-                    disease_descriptions.append({
+                    }, {
                         'id': desc_id,
                         'disease_id': disease_id,
                         'description_ru': disease['description_ru'],
@@ -599,19 +547,16 @@ def main():
                         'version': 1
                     })
 
-                    disease_crops.append({
-                        'disease_id': disease_id,
-                        'crops': crop_name
-                    })
-
                     if disease['photo_path']:
-                        disease_images.append({
+                        diseases.add_image({
                             'id': img_id,
                             'disease_id': disease_id,
                             'image_url': disease['source_urls'],
                             'image_path': disease['photo_path'],
                             'version': 1
                         })
+
+                    diseases.link(disease_id, [crop_name])
             except Exception as e:
                 logger.error(f"Ошибка при парсинге болезней для {crop_name}: {e}")
 
@@ -625,18 +570,16 @@ def main():
                 
                 for pest in crop_pests:
                     pest_id = pest['id']
-                    desc_id = str(uuid.uuid4())
-                    img_id = str(uuid.uuid4())
+                    desc_id = stable_id(pest_id, 'description')
+                    img_id = stable_id(pest_id, 'image')
 
-                    pests.append({
+                    pests.add({
                         'id': pest_id,
                         'name': pest['name'],
                         'name_en': pest['name_en'],
                         'scientific_name': pest['scientific_name'],
                         'is_active': pest['is_active']
-                    })
-
-                    pest_descriptions.append({
+                    }, {
                         'id': desc_id,
                         'vermin_id': pest_id,
                         'description_ru': pest['description_ru'],
@@ -656,19 +599,16 @@ def main():
                         'version': 1
                     })
 
-                    pest_crops.append({
-                        'vermin_id': pest_id,
-                        'crops': crop_name
-                    })
-
                     if pest['photo_path']:
-                        pest_images.append({
+                        pests.add_image({
                             'id': img_id,
                             'vermin_id': pest_id,
                             'image_url': pest['source_urls'],
                             'image_path': pest['photo_path'],
                             'version': 1
                         })
+
+                    pests.link(pest_id, [crop_name])
             except Exception as e:
                 logger.error(f"Ошибка при парсинге вредителей для {crop_name}: {e}")
 
@@ -680,18 +620,16 @@ def main():
         
         for weed in crop_weeds:
             weed_id = weed['id']
-            desc_id = str(uuid.uuid4())
-            img_id = str(uuid.uuid4())
+            desc_id = stable_id(weed_id, 'description')
+            img_id = stable_id(weed_id, 'image')
 
-            weeds.append({
+            weeds.add({
                 'id': weed_id,
                 'name': weed['name'],
                 'name_en': weed['name_en'],
                 'scientific_name': weed['scientific_name'],
                 'is_active': weed['is_active']
-            })
-
-            weed_descriptions.append({
+            }, {
                 'id': desc_id,
                 'weed_id': weed_id,
                 'description_ru': weed['description_ru'],
@@ -711,76 +649,63 @@ def main():
                 'version': 1
             })
 
-            for crop in ['пшеница', 'ячмень', 'кукуруза', 'овес', 'рапс', 'горчица', 'соя', 'сахарная свекла', 'подсолнечник', 'горох', 'нут', 'лен', 'картофель']:
-                weed_crops.append({
-                    'weed_id': weed_id,
-                    'crops': crop
-                })
-
             if weed['photo_path']:
-                weed_images.append({
+                weeds.add_image({
                     'id': img_id,
                     'weed_id': weed_id,
                     'image_url': weed['source_urls'],
                     'image_path': weed['photo_path'],
                     'version': 1
                 })
+
+            weeds.link(weed_id, ['пшеница', 'ячмень', 'кукуруза', 'овес', 'рапс', 'горчица', 'соя', 'сахарная свекла', 'подсолнечник', 'горох', 'нут', 'лен', 'картофель'])
     except Exception as e:
         logger.error(f"Ошибка при парсинге сорняков: {e}")
 
     # Отладочный вывод перед сохранением
-    logger.debug(f"Общее количество болезней: {len(diseases)}")
-    logger.debug(f"Общее количество описаний болезней: {len(disease_descriptions)}")
-    logger.debug(f"Общее количество культур для болезней: {len(disease_crops)}")
-    logger.debug(f"Общее количество изображений болезней: {len(disease_images)}")
-    logger.debug(f"Общее количество вредителей: {len(pests)}")
-    logger.debug(f"Общее количество описаний вредителей: {len(pest_descriptions)}")
-    logger.debug(f"Общее количество культур для вредителей: {len(pest_crops)}")
-    logger.debug(f"Общее количество изображений вредителей: {len(pest_images)}")
-    logger.debug(f"Общее количество сорняков: {len(weeds)}")
-    logger.debug(f"Общее количество описаний сорняков: {len(weed_descriptions)}")
-    logger.debug(f"Общее количество культур для сорняков: {len(weed_crops)}")
-    logger.debug(f"Общее количество изображений сорняков: {len(weed_images)}")
+    for label, index in (('болезней', diseases), ('вредителей', pests), ('сорняков', weeds)):
+        logger.debug(f"Общее количество {label}: {len(index)}, описаний: {len(index.descriptions())}, "
+                     f"связей с культурами: {len(index.crop_rows())}, изображений: {len(index.images())}")
 
     # Сохранение данных в CSV
     try:
-        save_to_csv(diseases, os.path.join(OUTPUT_DIR, 'diseases.csv'),
+        save_to_csv(diseases.entities(), os.path.join(OUTPUT_DIR, 'diseases.csv'),
                     ['id', 'name', 'name_en', 'scientific_name', 'is_active'])
-        save_to_csv(disease_descriptions, os.path.join(OUTPUT_DIR, 'disease_descriptions.csv'),
+        save_to_csv(diseases.descriptions(), os.path.join(OUTPUT_DIR, 'disease_descriptions.csv'),
                     ['id', 'disease_id', 'description_ru', 'description_ua', 'description_en',
                      'symptoms_ru', 'symptoms_ua', 'symptoms_en',
                      'development_conditions_ru', 'development_conditions_ua', 'development_conditions_en',
                      'control_measures_ru', 'control_measures_ua', 'control_measures_en',
                      'photo_path', 'source_urls', 'version'])
-        save_to_csv(disease_crops, os.path.join(OUTPUT_DIR, 'disease_crops.csv'),
+        save_to_csv(diseases.crop_rows(), os.path.join(OUTPUT_DIR, 'disease_crops.csv'),
                     ['disease_id', 'crops'])
-        save_to_csv(disease_images, os.path.join(OUTPUT_DIR, 'disease_images.csv'),
+        save_to_csv(diseases.images(), os.path.join(OUTPUT_DIR, 'disease_images.csv'),
                     ['id', 'disease_id', 'image_url', 'image_path', 'version'])
 
-        save_to_csv(pests, os.path.join(OUTPUT_DIR, 'vermins.csv'),
+        save_to_csv(pests.entities(), os.path.join(OUTPUT_DIR, 'vermins.csv'),
                     ['id', 'name', 'name_en', 'scientific_name', 'is_active'])
-        save_to_csv(pest_descriptions, os.path.join(OUTPUT_DIR, 'vermin_descriptions.csv'),
+        save_to_csv(pests.descriptions(), os.path.join(OUTPUT_DIR, 'vermin_descriptions.csv'),
                     ['id', 'vermin_id', 'description_ru', 'description_ua', 'description_en',
                      'damage_symptoms_ru', 'damage_symptoms_ua', 'damage_symptoms_en',
                      'biology_ru', 'biology_ua', 'biology_en',
                      'control_measures_ru', 'control_measures_ua', 'control_measures_en',
                      'photo_path', 'source_urls', 'version'])
-        save_to_csv(pest_crops, os.path.join(OUTPUT_DIR, 'vermin_crops.csv'),
+        save_to_csv(pests.crop_rows(), os.path.join(OUTPUT_DIR, 'vermin_crops.csv'),
                     ['vermin_id', 'crops'])
-        save_to_csv(pest_images, os.path.join(OUTPUT_DIR, 'vermin_images.csv'),
+        save_to_csv(pests.images(), os.path.join(OUTPUT_DIR, 'vermin_images.csv'),
                     ['id', 'vermin_id', 'image_url', 'image_path', 'version'])
 
-        save_to_csv(weeds, os.path.join(OUTPUT_DIR, 'weeds.csv'),
+        save_to_csv(weeds.entities(), os.path.join(OUTPUT_DIR, 'weeds.csv'),
                     ['id', 'name', 'name_en', 'scientific_name', 'is_active'])
-        save_to_csv(weed_descriptions, os.path.join(OUTPUT_DIR, 'weed_descriptions.csv'),
+        save_to_csv(weeds.descriptions(), os.path.join(OUTPUT_DIR, 'weed_descriptions.csv'),
                     ['id', 'weed_id', 'description_ru', 'description_ua', 'description_en',
                      'biological_features_ru', 'biological_features_ua', 'biological_features_en',
                      'harmfulness_ru', 'harmfulness_ua', 'harmfulness_en',
                      'control_measures_ru', 'control_measures_ua', 'control_measures_en',
                      'photo_path', 'source_urls', 'version'])
-        save_to_csv(weed_crops, os.path.join(OUTPUT_DIR, 'weed_crops.csv'),
+        save_to_csv(weeds.crop_rows(), os.path.join(OUTPUT_DIR, 'weed_crops.csv'),
                     ['weed_id', 'crops'])
-        save_to_csv(weed_images, os.path.join(OUTPUT_DIR, 'weed_images.csv'),
+        save_to_csv(weeds.images(), os.path.join(OUTPUT_DIR, 'weed_images.csv'),
                     ['id', 'weed_id', 'image_url', 'image_path', 'version'])
     except Exception as e:
         logger.error(f"Ошибка при сохранении CSV-файлов: {e}")
@@ -788,33 +713,9 @@ def main():
     # Создание JSON-отчета
     try:
         data = {
-            'diseases': {
-                'cereals': [d for d in diseases if any(c['crops'] in ['пшеница', 'ячмень', 'овес'] for c in disease_crops if c['disease_id'] == d['id'])],
-                'rapeseed': [d for d in diseases if any(c['crops'] == 'рапс' for c in disease_crops if c['disease_id'] == d['id'])],
-                'corn': [d for d in diseases if any(c['crops'] == 'кукуруза' for c in disease_crops if c['disease_id'] == d['id'])],
-                'soy': [d for d in diseases if any(c['crops'] == 'соя' for c in disease_crops if c['disease_id'] == d['id'])],
-                'sugar_beet': [d for d in diseases if any(c['crops'] == 'сахарная свекла' for c in disease_crops if c['disease_id'] == d['id'])],
-                'sunflower': [d for d in diseases if any(c['crops'] == 'подсолнечник' for c in disease_crops if c['disease_id'] == d['id'])],
-                'pea_nut': [d for d in diseases if any(c['crops'] in ['горох', 'нут'] for c in disease_crops if c['disease_id'] == d['id'])],
-                'flax': [d for d in diseases if any(c['crops'] == 'лен' for c in disease_crops if c['disease_id'] == d['id'])],
-                'potato': [d for d in diseases if any(c['crops'] == 'картофель' for c in disease_crops if c['disease_id'] == d['id'])],
-                'orchard': [d for d in diseases if any(c['crops'] == 'садовые культуры' for c in disease_crops if c['disease_id'] == d['id'])],
-                'vineyard': [d for d in diseases if any(c['crops'] == 'виноградники' for c in disease_crops if c['disease_id'] == d['id'])]
-            },
-            'pests': {
-                'cereals': [p for p in pests if any(c['crops'] in ['пшеница', 'ячмень', 'овес'] for c in pest_crops if c['vermin_id'] == p['id'])],
-                'rapeseed': [p for p in pests if any(c['crops'] == 'рапс' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'corn': [p for p in pests if any(c['crops'] == 'кукуруза' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'soy': [p for p in pests if any(c['crops'] == 'соя' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'sugar_beet': [p for p in pests if any(c['crops'] == 'сахарная свекла' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'sunflower': [p for p in pests if any(c['crops'] == 'подсолнечник' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'pea_nut': [p for p in pests if any(c['crops'] in ['горох', 'нут'] for c in pest_crops if c['vermin_id'] == p['id'])],
-                'flax': [p for p in pests if any(c['crops'] == 'лен' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'potato': [p for p in pests if any(c['crops'] == 'картофель' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'orchard': [p for p in pests if any(c['crops'] == 'садовые культуры' for c in pest_crops if c['vermin_id'] == p['id'])],
-                'vineyard': [p for p in pests if any(c['crops'] == 'виноградники' for c in pest_crops if c['vermin_id'] == p['id'])]
-            },
-            'weeds': weeds
+            'diseases': {category: diseases.with_crops(crops) for category, crops in crop_mapping.items()},
+            'pests': {category: pests.with_crops(crops) for category, crops in crop_mapping.items()},
+            'weeds': weeds.entities()
         }
 
         with open(os.path.join(OUTPUT_DIR, 'betaren_data.json'), 'w', encoding='utf-8') as f:
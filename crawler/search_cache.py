@@ -0,0 +1,123 @@
+"""
+On-disk cache of search engine result pages.
+Entries are keyed by engine and normalized query and hold the gzip-compressed
+raw HTML together with the extracted image URLs, so repeated runs do not
+send any search traffic until the entry expires.
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger("search_cache")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_DIR = BASE_DIR / "crawler" / "cache" / "search"
+DEFAULT_TTL_HOURS = 24 * 7
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query so that trivially different spellings share one cache entry."""
+    query = unicodedata.normalize('NFC', query).lower().replace('ё', 'е')
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+class SearchCache:
+    """
+    Directory of cached search result pages with a time-to-live.
+
+    Each entry is two files: <key>.html.gz with the raw response and <key>.json
+    with the query, fetch time and extracted URLs.
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float = DEFAULT_TTL_HOURS * 3600):
+        """
+        Args:
+            cache_dir: Cache directory
+            ttl: Entry lifetime in seconds (0 - entries never expire)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+
+    def _paths(self, engine: str, query: str):
+        key = hashlib.sha1(f"{engine}\n{normalize_query(query)}".encode('utf-8')).hexdigest()
+        folder = self.cache_dir / engine / key[:2]
+        return folder / f"{key}.json", folder / f"{key}.html.gz"
+
+    def _load_meta(self, engine: str, query: str) -> Optional[dict]:
+        meta_path, _ = self._paths(engine, query)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if self.ttl and time.time() - meta.get('fetched_at', 0) > self.ttl:
+            logger.debug(f"Запись кеша для '{query}' ({engine}) устарела")
+            return None
+        return meta
+
+    def get(self, engine: str, query: str) -> Optional[List[str]]:
+        """Returns the cached image URLs for a query, or None if there is no fresh entry."""
+        meta = self._load_meta(engine, query)
+        return meta['urls'] if meta else None
+
+    def get_html(self, engine: str, query: str) -> Optional[str]:
+        """Returns the cached raw result page for a query, or None if there is no fresh entry."""
+        if self._load_meta(engine, query) is None:
+            return None
+        _, html_path = self._paths(engine, query)
+        try:
+            with gzip.open(html_path, 'rt', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, engine: str, query: str, html: str, urls: List[str]) -> None:
+        """
+        Stores a result page and its extracted URLs.
+
+        Args:
+            engine: Search engine name
+            query: Search query as sent
+            html: Raw response text
+            urls: Image URLs extracted from the page (the first ones, if the extraction was limited)
+        """
+        meta_path, html_path = self._paths(engine, query)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        # Пишем во временные файлы и переименовываем, чтобы параллельные потоки не видели половину записи
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(f"{html_path}{suffix}", 'wt', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(f"{html_path}{suffix}", html_path)
+        with open(f"{meta_path}{suffix}", 'w', encoding='utf-8') as f:
+            json.dump({'engine': engine, 'query': query, 'fetched_at': time.time(), 'urls': urls},
+                      f, ensure_ascii=False)
+        os.replace(f"{meta_path}{suffix}", meta_path)
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """
+    Returns the process-wide search cache.
+
+    Settings are read on first use: SEARCH_CACHE_DIR and SEARCH_CACHE_TTL_HOURS.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache(
+                Path(os.getenv('SEARCH_CACHE_DIR', str(DEFAULT_CACHE_DIR))),
+                float(os.getenv('SEARCH_CACHE_TTL_HOURS', DEFAULT_TTL_HOURS)) * 3600
+            )
+        return _cache
@@ -0,0 +1,119 @@
+"""
+Extraction of image URLs from search engine result pages.
+Result pages are scanned as text with precompiled patterns, without building
+a DOM: every pattern starts with a literal, so the regex engine jumps between
+candidate URLs instead of trying every position. URLs escaped inside embedded
+JSON (\\/, \\u003d, \\x26, &amp;) are decoded, duplicates are dropped while
+scanning, and scanning stops as soon as the requested number of URLs is found.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Pattern
+
+# Расширения изображений без учета регистра; флаг IGNORECASE не используется,
+# так как он отключает поиск по буквальному префиксу шаблона
+_EXTENSION = r'(?:[jJ][pP][eE]?[gG]|[pP][nN][gG]|[wW][eE][bB][pP])'
+
+
+def _url_until_extension(chars: str, end: str) -> str:
+    """
+    Pattern of a URL body made of chars that ends with an image extension followed by end.
+
+    The body is matched segment by segment between dots with possessive quantifiers:
+    a dot not starting the final extension is consumed at once, so the pattern never
+    backtracks, unlike a lazy .*? that tries the extension after every character.
+    """
+    segment = f'[^{chars}.]*+'
+    return rf'{segment}(?:\.(?!{_EXTENSION}{end}){segment})*+\.{_EXTENSION}'
+
+
+# Google: любой URL изображения в разметке или в JSON, в том числе со слешами вида \/.
+# URL заканчивается на расширении, параметры после него отбрасываются
+_WORD_END = r'(?![0-9A-Za-z])'
+GOOGLE_URL_PATTERN = re.compile(
+    r'(?P<url>https?:(?:\\?/){2}' + _url_until_extension(r'\s"\'<>', _WORD_END) + ')' + _WORD_END
+)
+
+# Яндекс: поле orig_url JSON-состояния выдачи, в атрибуте data-state кавычки могут быть &quot;
+_QUOTE = r'(?:\\?"|&quot;)'
+YANDEX_URL_PATTERN = re.compile(
+    r'orig_url' + _QUOTE + ':' + _QUOTE + r'(?P<url>https?:' + _url_until_extension(r'"\s<>', f'(?={_QUOTE})')
+    + f')(?={_QUOTE})'
+)
+
+_ESCAPE = re.compile(r'\\u([0-9a-fA-F]{4})|\\x([0-9a-fA-F]{2})|\\(.)|&amp;', re.DOTALL)
+
+
+def _unescape(match: re.Match) -> str:
+    code = match.group(1) or match.group(2)
+    if code:
+        return chr(int(code, 16))
+    if match.group(3) is not None:
+        return match.group(3)
+    return '&'
+
+
+def decode_url(url: str) -> str:
+    """Decodes JSON and JavaScript escapes (\\/, \\uXXXX, \\xXX) and &amp; in a URL."""
+    if '\\' not in url and '&amp;' not in url:
+        return url
+    # Чаще всего в URL экранированы только слеши
+    url = url.replace('\\/', '/')
+    if '\\' in url or '&amp;' in url:
+        url = _ESCAPE.sub(_unescape, url)
+    return url
+
+
+def scan_urls(pattern: Pattern, html: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Returns the decoded 'url' groups of a pattern in page order without duplicates.
+
+    Args:
+        pattern: Compiled pattern with a named group 'url'
+        html: Result page text
+        limit: Stop after this many URLs (None - scan the whole page)
+    """
+    if limit is not None and limit <= 0:
+        return []
+    urls = []
+    seen = set()
+    for match in pattern.finditer(html):
+        url = decode_url(match.group('url'))
+        if url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+        if limit is not None and len(urls) >= limit:
+            break
+    return urls
+
+
+def extract_google_image_urls(html: str, limit: Optional[int] = None) -> List[str]:
+    """Extracts image URLs from a Google Images result page."""
+    return scan_urls(GOOGLE_URL_PATTERN, html, limit)
+
+
+def extract_yandex_image_urls(html: str, limit: Optional[int] = None) -> List[str]:
+    """Extracts original image URLs from a Yandex Images result page."""
+    return scan_urls(YANDEX_URL_PATTERN, html, limit)
+
+
+EXTRACTORS: Dict[str, Callable[[str, Optional[int]], List[str]]] = {
+    'google': extract_google_image_urls,
+    'yandex': extract_yandex_image_urls,
+}
+
+
+def extract_image_urls(engine: str, html: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Extracts image URLs from a result page of a search engine.
+
+    Args:
+        engine: 'google' or 'yandex'
+        html: Result page text
+        limit: Maximum number of URLs (None - all)
+
+    Returns:
+        Distinct image URLs in page order
+    """
+    return EXTRACTORS[engine](html, limit)
@@ -0,0 +1,124 @@
+"""
+Concurrent search across several image search engines.
+All enabled engines are queried at once and their URLs are streamed to the
+caller as soon as each engine answers, deduplicated across engines. URLs that
+arrived but were not taken yet are ranked by engine priority, position in the
+engine's results and the expected download yield of their domain, so the first
+downloads start on the fastest engine's results and better candidates from a
+slower engine still go ahead of the remaining weaker ones.
+"""
+
+import os
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from domain_stats import domain_of
+
+logger = logging.getLogger("search_fanout")
+
+# Вес поисковой системы в ранжировании; Яндекс, как и раньше в режиме both, идет первым
+ENGINE_PRIORITY = {'yandex': 1.0, 'google': 0.9}
+# Во сколько раз снижается вес каждой следующей позиции в выдаче
+POSITION_DECAY = 0.97
+# Оценка домена, когда функция оценки не задана
+NEUTRAL_RATE = 0.5
+# Число одновременных поисковых запросов во всем процессе
+DEFAULT_SEARCH_WORKERS = 8
+
+
+class RankedUrl(NamedTuple):
+    """Image URL found by a search engine with its ranking score."""
+    url: str
+    engine: str
+    position: int
+    score: float
+
+
+def rank_score(engine: str, position: int, domain_rate: float,
+               priorities: Optional[Dict[str, float]] = None) -> float:
+    """
+    Returns the ranking score of a found URL (higher is better).
+
+    Args:
+        engine: Engine that found the URL
+        position: Position of the URL in the engine's results (from 0)
+        domain_rate: Expected download yield of the URL's domain
+        priorities: Engine weights (default ENGINE_PRIORITY)
+    """
+    priority = (priorities or ENGINE_PRIORITY).get(engine, 1.0)
+    return priority * domain_rate * POSITION_DECAY ** position
+
+
+def stream_image_urls(query: str, engines: Sequence[str], max_images: int,
+                      search: Callable[[str, str, int], List[str]],
+                      success_rate: Optional[Callable[[str], float]] = None,
+                      priorities: Optional[Dict[str, float]] = None) -> Iterator[RankedUrl]:
+    """
+    Queries the engines concurrently and yields their URLs as they arrive.
+
+    Each call of next() returns the best-ranked URL among those already received
+    and waits for the next engine only if none is left. A URL found by several
+    engines is returned once. Closing the generator cancels searches not started yet.
+
+    Args:
+        query: Search query
+        engines: Engines to query
+        max_images: Number of URLs to request from each engine
+        search: Function (engine, query, max_images) returning URLs in search order
+        success_rate: Function returning the expected download yield of a domain
+            (default: the same for every domain)
+        priorities: Engine weights (default ENGINE_PRIORITY)
+
+    Yields:
+        Ranked URLs, best first among the received ones
+    """
+    success_rate = success_rate or (lambda domain: NEUTRAL_RATE)
+    executor = get_search_executor()
+    futures = {executor.submit(search, engine, query, max_images): engine for engine in dict.fromkeys(engines)}
+    pending = set(futures)
+    candidates = []
+    order = itertools.count()
+    seen = set()
+    try:
+        while pending or candidates:
+            done = {future for future in pending if future.done()}
+            if not done and not candidates:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                engine = futures[future]
+                try:
+                    urls = future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка поиска '{query}' ({engine}): {e}")
+                    continue
+                logger.debug(f"{engine}: найдено {len(urls)} URL для '{query}'")
+                for position, url in enumerate(urls):
+                    if url in seen:
+                        continue
+                    seen.add(url)
+                    score = rank_score(engine, position, success_rate(domain_of(url)), priorities)
+                    heapq.heappush(candidates, (-score, next(order), RankedUrl(url, engine, position, score)))
+            if candidates:
+                yield heapq.heappop(candidates)[2]
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Returns the process-wide pool of search requests (SEARCH_FANOUT_WORKERS threads)."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = int(os.getenv('SEARCH_FANOUT_WORKERS', DEFAULT_SEARCH_WORKERS))
+            _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='search')
+        return _executor
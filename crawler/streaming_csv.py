@@ -0,0 +1,149 @@
+"""
+Append-only CSV output with crash-safe checkpoints.
+A scraper writes the rows of every finished item to a set of related CSV
+files that stay open for the whole run. At a checkpoint the files are
+fsynced and their sizes recorded; after a crash the files are truncated
+back to the last checkpoint and the run continues from there, so neither
+memory nor checkpoint cost grows with the number of items.
+"""
+
+import os
+import csv
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger("streaming_csv")
+
+DEFAULT_CHECKPOINT_EVERY = 5
+
+
+class StreamingCsvWriter:
+    """
+    Writes related CSV tables row by row with periodic durable checkpoints.
+
+    The checkpoint file holds the committed size of every table. Resuming an
+    unfinished run drops the rows written after the last checkpoint, so the
+    tables never contain half of an item.
+    """
+
+    def __init__(self, tables: Dict[str, Tuple[Path, Sequence[str]]], checkpoint_path: Path,
+                 checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, resume: bool = True):
+        """
+        Args:
+            tables: Mapping of table name to (CSV path, field names)
+            checkpoint_path: JSON file with the committed table sizes
+            checkpoint_every: Items between automatic checkpoints
+            resume: Continue an unfinished run instead of starting the tables anew
+        """
+        self.tables = {name: (Path(path), list(fields)) for name, (path, fields) in tables.items()}
+        self.checkpoint_path = Path(checkpoint_path)
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.items = 0
+        self.resumed = False
+        self._pending = 0
+        self._broken = False
+        self._files = {}
+        self._writers = {}
+
+        committed = self._load_checkpoint() if resume else None
+        for name, (path, fields) in self.tables.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if committed is not None:
+                # Строки, записанные после последней контрольной точки, отбрасываются
+                os.truncate(path, committed['sizes'][name])
+                f = open(path, 'a', encoding='utf-8', newline='')
+            else:
+                f = open(path, 'w', encoding='utf-8', newline='')
+            self._files[name] = f
+            self._writers[name] = csv.DictWriter(f, fieldnames=fields)
+            if committed is None:
+                self._writers[name].writeheader()
+
+        if committed is not None:
+            self.items = committed['items']
+            self.resumed = True
+            logger.info(f"Продолжение записи с контрольной точки: {self.items} элементов")
+        else:
+            self.checkpoint()
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get('complete') or set(data.get('sizes', {})) != set(self.tables):
+            return None
+        for name, (path, _) in self.tables.items():
+            if not path.exists() or path.stat().st_size < data['sizes'][name]:
+                logger.warning(f"{path} короче контрольной точки, запись начинается заново")
+                return None
+        return data
+
+    def read_column(self, table: str, field: str) -> Set[str]:
+        """Returns the values of a column in the committed rows of a table (for skipping finished items)."""
+        path, _ = self.tables[table]
+        self._files[table].flush()
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return {row[field] for row in csv.DictReader(f)}
+
+    def write_item(self, rows: Dict[str, List[dict]]) -> None:
+        """
+        Appends all rows of one item and checkpoints every checkpoint_every items.
+
+        Args:
+            rows: Mapping of table name to the item's rows in that table
+        """
+        try:
+            for name, table_rows in rows.items():
+                self._writers[name].writerows(table_rows)
+        except Exception:
+            # Часть строк элемента могла быть записана: такие строки не должны попасть в контрольную точку
+            self._broken = True
+            raise
+        self.items += 1
+        self._pending += 1
+        if self._pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self, complete: bool = False) -> None:
+        """Makes all rows written so far durable and records the table sizes."""
+        if self._broken:
+            raise RuntimeError("Запись элемента была прервана, контрольная точка невозможна")
+        sizes = {}
+        for name, f in self._files.items():
+            f.flush()
+            os.fsync(f.fileno())
+            sizes[name] = os.fstat(f.fileno()).st_size
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'items': self.items, 'sizes': sizes, 'complete': complete}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self._pending = 0
+
+    def close(self, complete: bool = True) -> None:
+        """
+        Writes the final checkpoint and closes the tables.
+
+        Args:
+            complete: Whether the run finished; the next run then starts the tables anew
+        """
+        if not self._files:
+            return
+        if not self._broken:
+            self.checkpoint(complete)
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # При ошибке запуск остается незавершенным и может быть продолжен; уже записанные
+        # элементы сохраняются, а после аварийного завершения процесса файлы обрезаются до контрольной точки
+        self.close(complete=exc_type is None)
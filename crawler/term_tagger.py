@@ -0,0 +1,344 @@
+"""
+Multilingual term dictionary and Aho-Corasick tagger for scraped texts.
+Crop names, section headings and risk names in Russian, Ukrainian and English
+are compiled into one automaton, so a text is scanned once, in time linear in
+its length, however many terms the dictionary holds. Scrapers use it to find
+the crops mentioned in a description and to recognise section headings. Risk
+names come from a built-in list of common risks and from the names of the
+scraped risks in the CSV files (name and its English translation).
+"""
+
+import os
+import csv
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger("term_tagger")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# CSV файлы собранных рисков, из которых берутся названия рисков
+DEFAULT_RISK_CSV_DIR = BASE_DIR / "crawler" / "csv_output"
+# Колонки CSV с названием риска на разных языках
+RISK_NAME_COLUMNS = ('name', 'name_ua', 'name_en', 'english_name')
+
+KIND_CROP = 'crop'
+KIND_SECTION = 'section'
+KIND_RISK = 'risk'
+
+# Культуры: ключ (название в CSV и базе) -> формы на русском, украинском и английском.
+# Форма со звездочкой - основа слова (совпадение с начала слова), без звездочки - слово целиком
+CROP_TERMS = {
+    'пшеница': ('пшениц*', 'пшеничн*', 'wheat*'),
+    'рожь': ('рожь*', 'ржи', 'ржан*', 'жито', 'rye'),
+    'ячмень': ('ячмен*', 'ячмін*', 'barley*'),
+    'овес': ('овес', 'овса', 'овсу', 'овсом', 'овсе', 'овсян*', 'вівс*', 'oat', 'oats'),
+    'кукуруза': ('кукуруз*', 'кукурудз*', 'maize', 'corn'),
+    'подсолнечник': ('подсолнечн*', 'подсолнух*', 'соняшник*', 'sunflower*'),
+    'соя': ('соя', 'сои', 'сою', 'соей', 'сое', 'соев*', 'сої', 'соєв*', 'soy*'),
+    'рапс': ('рапс*', 'ріпак*', 'rapeseed*', 'canola', 'oilseed rape'),
+    'горчица': ('горчиц*', 'гірчиц*', 'mustard*'),
+    'сахарная свекла': ('свекл*', 'свекол*', 'буряк*', 'beet*'),
+    'горох': ('горох*', 'pea', 'peas'),
+    'нут': ('нут', 'нута', 'нуту', 'нутом', 'нуте', 'chickpea*'),
+    'лен': ('лен', 'льна', 'льну', 'льном', 'льне', 'льнян*', 'льон*', 'flax*', 'linseed'),
+    'картофель': ('картофел*', 'картопл*', 'potato*'),
+    'садовые культуры': ('садов*', 'плодовых культур*', 'плодовые культур*', 'сад', 'сады', 'садах', 'саду',
+                         'садів', 'orchard*'),
+    'виноградники': ('виноград*', 'vineyard*', 'grape*'),
+}
+
+# Группы культур, по которым betaren.ru раскладывает болезни и вредителей
+CROP_GROUPS = {
+    'cereals': ['пшеница', 'ячмень', 'овес'],
+    'rapeseed': ['рапс'],
+    'corn': ['кукуруза'],
+    'soy': ['соя'],
+    'sugar_beet': ['сахарная свекла'],
+    'sunflower': ['подсолнечник'],
+    'pea_nut': ['горох', 'нут'],
+    'flax': ['лен'],
+    'potato': ['картофель'],
+    'orchard': ['садовые культуры'],
+    'vineyard': ['виноградники']
+}
+
+# GUID культур в базе рисков
+CROP_GUIDS = {
+    "пшеница": "501933b1-b43d-11e9-a3c5-00155d012200",
+    "ячмень": "ed8d52db-9b99-4ac3-9691-082829953c46",
+    "кукуруза": "c61ecabe-229e-4361-921a-081125d5c3c1",
+    "овес": "c593d0c4-653c-418b-9ac4-35d58f3ff627",
+    "рапс": "f503750b-f20d-4bf7-af68-ce922974018c",
+    "горчица": "4f091a7c-30f4-4825-a76a-1ffffb89483b",
+    "соя": "soy_guid_placeholder",
+    "сахарная свекла": "sugar_beet_guid_placeholder",
+    "подсолнечник": "sunflower_guid_placeholder",
+    "горох": "pea_guid_placeholder",
+    "нут": "nut_guid_placeholder",
+    "лен": "flax_guid_placeholder",
+    "картофель": "potato_guid_placeholder",
+    "садовые культуры": "orchard_guid_placeholder",
+    "виноградники": "vineyard_guid_placeholder"
+}
+
+# Заголовки разделов детальных страниц; ищутся в любом месте строки.
+# Порядок ключей задает приоритет, если в строке несколько заголовков
+SECTION_TERMS = {
+    'symptoms': ('симптомы болезни', 'симптомы', 'признаки болезни', 'симптоми', 'ознаки хвороби', 'symptoms'),
+    'development': ('факторы', 'условия развития', 'развитие болезни', 'фактори', 'умови розвитку',
+                    'розвиток хвороби', 'development conditions', 'risk factors'),
+    'control': ('меры защиты', 'меры борьбы', 'защита', 'заходи захисту', 'заходи боротьби', 'захист',
+                'control measures', 'protection'),
+}
+
+# Распространенные риски: ключ (название на русском) -> формы на русском, украинском и английском
+RISK_TERMS = {
+    'бурая ржавчина': ('бурая ржавчина', 'бурой ржавчины', 'бурую ржавчину', 'бурой ржавчиной', 'бура іржа',
+                       'бурої іржі', 'leaf rust', 'brown rust'),
+    'стеблевая ржавчина': ('стеблевая ржавчина', 'стеблевой ржавчины', 'стеблова іржа', 'стеблової іржі',
+                           'stem rust', 'black rust'),
+    'желтая ржавчина': ('желтая ржавчина', 'желтой ржавчины', 'жовта іржа', 'жовтої іржі', 'stripe rust',
+                        'yellow rust'),
+    'септориоз': ('септориоз*', 'септоріоз*', 'septoria*'),
+    'мучнистая роса': ('мучнистая роса', 'мучнистой росы', 'мучнистую росу', 'мучнистой росой', 'борошниста роса',
+                       'борошнистої роси', 'powdery mildew'),
+    'фузариоз': ('фузариоз*', 'фузаріоз*', 'fusarium*'),
+    'пиренофороз': ('пиренофороз*', 'піренофороз*', 'tan spot'),
+    'гельминтоспориоз': ('гельминтоспориоз*', 'гельмінтоспоріоз*', 'helminthosporium*'),
+    'твердая головня': ('твердая головня', 'твердой головни', 'тверда сажка', 'твердої сажки', 'common bunt'),
+    'пыльная головня': ('пыльная головня', 'пыльной головни', 'летюча сажка', 'летючої сажки', 'loose smut'),
+    'корневые гнили': ('корневые гнили', 'корневых гнилей', 'корневая гниль', 'коренева гниль', 'кореневі гнилі',
+                       'root rot', 'root rots'),
+    'альтернариоз': ('альтернариоз*', 'альтернаріоз*', 'alternaria*'),
+    'церкоспороз': ('церкоспороз*', 'cercospora*'),
+    'фитофтороз': ('фитофтороз*', 'фітофтороз*', 'late blight', 'phytophthora*'),
+    'склеротиниоз': ('склеротиниоз*', 'склеротиніоз*', 'белая гниль', 'белой гнили', 'біла гниль', 'sclerotinia*',
+                     'white mold', 'white mould'),
+    'вредная черепашка': ('вредная черепашка', 'вредной черепашки', 'шкідлива черепашка', 'шкідливої черепашки',
+                          'sunn pest'),
+    'злаковая тля': ('злаковая тля', 'злаковой тли', 'злакова попелиця', 'злакової попелиці', 'cereal aphid*'),
+    'пьявица': ('пьявиц*', 'cereal leaf beetle*'),
+    'хлебная жужелица': ('хлебная жужелица', 'хлебной жужелицы', 'хлібна жужелиця', 'хлібної жужелиці',
+                         'ground beetle*'),
+    'проволочник': ('проволочник*', 'дротяник*', 'wireworm*'),
+    'кукурузный мотылек': ('кукурузный мотылек', 'кукурузного мотылька', 'стебловий метелик', 'стеблового метелика',
+                           'corn borer', 'european corn borer'),
+    'рапсовый цветоед': ('рапсовый цветоед', 'рапсового цветоеда', 'ріпаковий квітоїд', 'ріпакового квітоїда',
+                         'pollen beetle*'),
+    'луговой мотылек': ('луговой мотылек', 'лугового мотылька', 'лучний метелик', 'лучного метелика', 'beet webworm'),
+    'колорадский жук': ('колорадский жук', 'колорадского жука', 'колорадський жук', 'колорадського жука',
+                        'colorado potato beetle'),
+}
+
+
+class TermMatch(NamedTuple):
+    """Occurrence of a dictionary term; positions refer to the normalized text."""
+    kind: str
+    key: str
+    start: int
+    end: int
+
+
+class _Pattern(NamedTuple):
+    kind: str
+    key: str
+    length: int
+    # 'word' - слово целиком, 'stem' - с начала слова, 'substring' - в любом месте
+    mode: str
+
+
+def normalize(text: str) -> str:
+    """Lower-cases a text and replaces 'ё' with 'е'."""
+    return text.lower().replace('ё', 'е')
+
+
+class TermTagger:
+    """
+    Aho-Corasick automaton over a dictionary of terms grouped by kind and key.
+
+    Terms can be added at any time; the automaton is rebuilt on the next search.
+    """
+
+    def __init__(self):
+        self._forms: List[str] = []
+        self._patterns: List[_Pattern] = []
+        # Порядок ключей в словаре: (вид, ключ) -> номер
+        self._order: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._automaton: Optional[Tuple[List[Dict[str, int]], List[Tuple[int, ...]]]] = None
+
+    def add(self, kind: str, key: str, forms: Iterable[str], substring: bool = False) -> None:
+        """
+        Adds the forms of a term.
+
+        Args:
+            kind: Term kind (KIND_CROP, KIND_SECTION, KIND_RISK or another)
+            key: Canonical value reported for all forms
+            forms: Word forms; 'stem*' matches words starting with the stem, other forms whole words
+            substring: Match the forms anywhere in the text, ignoring word boundaries
+        """
+        with self._lock:
+            self._order.setdefault((kind, key), len(self._order))
+            for form in forms:
+                if substring:
+                    mode = 'substring'
+                elif form.endswith('*'):
+                    form, mode = form[:-1], 'stem'
+                else:
+                    mode = 'word'
+                form = normalize(form)
+                if form:
+                    self._forms.append(form)
+                    self._patterns.append(_Pattern(kind, key, len(form), mode))
+            self._automaton = None
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _build(self) -> Tuple[List[Dict[str, int]], List[int], List[Tuple[int, ...]]]:
+        """Builds the trie of all forms, its failure links and the outputs of every state."""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for index, form in enumerate(self._forms):
+            state = 0
+            for char in form:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        # Обход в ширину: ссылка неудачи ведет в состояние меньшей глубины, которое уже обработано,
+        # поэтому его выходы можно сразу добавить к выходам текущего состояния
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0) if state else 0
+                outputs[child].extend(outputs[fail[child]])
+        return goto, fail, [tuple(output) for output in outputs]
+
+    def find(self, text: str) -> List[TermMatch]:
+        """
+        Returns all dictionary terms occurring in a text, in order of their end position.
+
+        Args:
+            text: Any text; matching ignores case and 'ё'/'е'
+        """
+        with self._lock:
+            if self._automaton is None:
+                self._automaton = self._build()
+            goto, fail, outputs = self._automaton
+            patterns = self._patterns
+
+        text = normalize(text)
+        matches = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                pattern = patterns[index]
+                start = end - pattern.length
+                if pattern.mode != 'substring':
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if pattern.mode == 'word' and end < len(text) and text[end].isalnum():
+                        continue
+                matches.append(TermMatch(pattern.kind, pattern.key, start, end))
+        return matches
+
+    def tags(self, text: str, kind: str) -> List[str]:
+        """
+        Returns the keys of a kind found in a text.
+
+        Returns:
+            Distinct keys in dictionary order
+        """
+        keys = {match.key for match in self.find(text) if match.kind == kind}
+        return sorted(keys, key=lambda key: self._order[(kind, key)])
+
+    def first_tag(self, text: str, kind: str) -> Optional[str]:
+        """Returns the first key of a kind (in dictionary order) found in a text, or None."""
+        keys = self.tags(text, kind)
+        return keys[0] if keys else None
+
+
+def load_risk_terms(csv_files: Iterable[Path]) -> List[Tuple[str, str, List[str]]]:
+    """
+    Reads risk names and their translations from scraped CSV files.
+
+    Args:
+        csv_files: CSV files with a 'name' column and optionally name_ua, name_en or english_name
+
+    Returns:
+        (KIND_RISK, normalized Russian name, all names) entries for build_default_tagger
+    """
+    terms = {}
+    for path in csv_files:
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    name = (row.get('name') or '').strip()
+                    if not name:
+                        continue
+                    # Ключ в нижнем регистре совпадает с ключами встроенного словаря RISK_TERMS
+                    forms = terms.setdefault(normalize(name), [name])
+                    for column in RISK_NAME_COLUMNS[1:]:
+                        name = (row.get(column) or '').strip()
+                        if name and name not in forms:
+                            forms.append(name)
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            logger.warning(f"Не удалось прочитать названия рисков из {path}: {e}")
+    return [(KIND_RISK, key, forms) for key, forms in terms.items()]
+
+
+def build_default_tagger(extra_terms: Sequence[Tuple[str, str, Sequence[str]]] = ()) -> TermTagger:
+    """
+    Builds a tagger with the crop, section and built-in risk dictionaries.
+
+    Args:
+        extra_terms: Additional (kind, key, forms) entries, e.g. scraped risk names from load_risk_terms
+    """
+    tagger = TermTagger()
+    for key, forms in CROP_TERMS.items():
+        tagger.add(KIND_CROP, key, forms)
+    # Заголовки разделов, как и раньше, ищутся как подстроки
+    for key, forms in SECTION_TERMS.items():
+        tagger.add(KIND_SECTION, key, forms, substring=True)
+    for key, forms in RISK_TERMS.items():
+        tagger.add(KIND_RISK, key, forms)
+    for kind, key, forms in extra_terms:
+        tagger.add(kind, key, forms)
+    return tagger
+
+
+_tagger: Optional[TermTagger] = None
+_tagger_lock = threading.Lock()
+
+
+def get_term_tagger() -> TermTagger:
+    """
+    Returns the process-wide tagger with the default dictionary.
+
+    The names of scraped risks are read on first use from the CSV files in
+    TERM_TAGGER_RISK_CSV_DIR (default csv_output).
+    """
+    global _tagger
+    with _tagger_lock:
+        if _tagger is None:
+            csv_dir = Path(os.getenv('TERM_TAGGER_RISK_CSV_DIR', str(DEFAULT_RISK_CSV_DIR)))
+            csv_files = sorted(csv_dir.glob('*.csv')) if csv_dir.is_dir() else []
+            _tagger = build_default_tagger(load_risk_terms(csv_files))
+        return _tagger
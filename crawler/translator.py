@@ -0,0 +1,307 @@
+"""
+Cached, batched machine translation of scraped descriptions.
+Translations are stored in SQLite keyed by the text hash and the language
+pair, so re-scraping unchanged pages costs no API calls. Missing texts are
+packed into a few chat-completion requests that run concurrently; the
+requests go through http_client and so respect the per-host rate limiter.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import http_client
+
+logger = logging.getLogger("translator")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "crawler" / "cache" / "translations.db"
+DEFAULT_MODEL = "gpt-3.5-turbo"
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+# Ограничения одного пакетного запроса
+DEFAULT_BATCH_CHARS = 6000
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_WORKERS = 4
+
+# Разные написания языков в скраперах приводятся к кодам ISO 639-1
+LANGUAGE_CODES = {
+    'ru': 'ru', 'russian': 'ru',
+    'uk': 'uk', 'ua': 'uk', 'ukrainian': 'uk',
+    'en': 'en', 'english': 'en',
+}
+LANGUAGE_NAMES = {'ru': 'Russian', 'uk': 'Ukrainian', 'en': 'English'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    text_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (text_hash, source, target)
+);
+"""
+
+
+def language_code(language: str) -> str:
+    """Normalizes a language name or code ('ua', 'ukrainian', 'en', ...) to ISO 639-1."""
+    return LANGUAGE_CODES.get(language.strip().lower(), language.strip().lower())
+
+
+def text_hash(text: str) -> str:
+    """Returns the cache key of a source text."""
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """Thread-safe SQLite store of translations."""
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def get_many(self, hashes: Sequence[str], source: str, target: str) -> Dict[str, str]:
+        """Returns the cached translations of the given text hashes."""
+        found = {}
+        with self._lock:
+            # SQLite ограничивает число параметров в запросе
+            for start in range(0, len(hashes), 500):
+                chunk = list(hashes[start:start + 500])
+                placeholders = ','.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT text_hash, translation FROM translations "
+                    f"WHERE source = ? AND target = ? AND text_hash IN ({placeholders})",
+                    [source, target] + chunk
+                ).fetchall())
+        return found
+
+    def put_many(self, items: Dict[str, str], source: str, target: str) -> None:
+        """Stores translations keyed by text hash."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                                   [(key, source, target, value, now) for key, value in items.items()])
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
+
+
+class OpenAIBackend:
+    """Translates a batch of texts with one chat-completion request."""
+
+    def __init__(self, api_key: str, model: str = DEFAULT_MODEL, url: str = OPENAI_CHAT_URL):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.calls = 0
+
+    def _request(self, texts: List[str], source: str, target: str) -> List[str]:
+        prompt = (
+            f"Translate every string of the JSON array below from {LANGUAGE_NAMES.get(source, source)} "
+            f"to {LANGUAGE_NAMES.get(target, target)}, preserving agronomic and scientific terminology. "
+            f"Answer with a JSON object {{\"translations\": [...]}} containing exactly {len(texts)} strings "
+            f"in the same order.\n\n{json.dumps(texts, ensure_ascii=False)}"
+        )
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "You are a professional translator of agricultural texts."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.2
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        self.calls += 1
+        response = http_client.post(self.url, headers=headers, json=data, timeout=120)
+        response.raise_for_status()
+        content = response.json()['choices'][0]['message']['content'].strip()
+        # Модель иногда оборачивает ответ в блок кода
+        content = re.sub(r'^```(?:json)?\s*|\s*```$', '', content)
+        translations = json.loads(content)['translations']
+        if len(translations) != len(texts) or not all(isinstance(t, str) for t in translations):
+            raise ValueError(f"получено {len(translations)} переводов вместо {len(texts)}")
+        return [t.strip() for t in translations]
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        """
+        Translates texts, keeping their order.
+
+        If the model breaks the answer format for a batch, its texts are retried one by one.
+        """
+        try:
+            return self._request(texts, source, target)
+        except (ValueError, KeyError, TypeError) as e:
+            if len(texts) == 1:
+                raise
+            logger.warning(f"Некорректный ответ на пакет из {len(texts)} текстов ({e}), переводим по одному")
+            return [self._request([text], source, target)[0] for text in texts]
+
+
+class StubBackend:
+    """Offline translator for tests: returns '[<target>] <text>' and counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        self.calls += 1
+        self.texts += len(texts)
+        return [f"[{target}] {text}" for text in texts]
+
+
+class Translator:
+    """
+    Translation front end: cache lookup, batching and concurrent requests.
+
+    Without a backend only cached translations are returned; other texts
+    translate to an empty string, like the scrapers did without an API key.
+    """
+
+    def __init__(self, backend=None, cache: Optional[TranslationCache] = None,
+                 batch_chars: int = DEFAULT_BATCH_CHARS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS):
+        """
+        Args:
+            backend: Object with translate_batch(texts, source, target), or None
+            cache: Persistent cache (no caching if None)
+            batch_chars: Maximum total characters per request
+            batch_size: Maximum number of texts per request
+            workers: Maximum number of concurrent requests
+        """
+        self.backend = backend
+        self.cache = cache
+        self.batch_chars = batch_chars
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+
+    def _batches(self, texts: List[str]) -> Iterable[List[str]]:
+        batch, size = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or size + len(text) > self.batch_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text)
+        if batch:
+            yield batch
+
+    def _translate_batch(self, batch: List[str], source: str, target: str) -> Dict[str, str]:
+        try:
+            translations = self.backend.translate_batch(batch, source, target)
+        except Exception as e:
+            logger.error(f"Ошибка перевода пакета из {len(batch)} текстов: {e}")
+            return {}
+        return dict(zip(batch, translations))
+
+    def translate_many(self, texts: Sequence[str], target: str, source: str = 'ru') -> List[str]:
+        """
+        Translates texts, requesting only those that are not cached.
+
+        Args:
+            texts: Source texts (empty strings stay empty)
+            target: Target language name or code
+            source: Source language name or code
+
+        Returns:
+            Translations in the order of texts ('' for failed ones, which are retried next time)
+        """
+        source, target = language_code(source), language_code(target)
+        unique = list(dict.fromkeys(t.strip() for t in texts if t and t.strip()))
+        hashes = {text: text_hash(text) for text in unique}
+        done: Dict[str, str] = {}
+        if self.cache is not None and unique:
+            cached = self.cache.get_many(list(hashes.values()), source, target)
+            done = {text: cached[h] for text, h in hashes.items() if h in cached}
+
+        missing = [text for text in unique if text not in done]
+        if missing and self.backend is not None:
+            batches = list(self._batches(missing))
+            logger.info(f"Перевод на {target}: {len(missing)} текстов в {len(batches)} запросах, "
+                        f"из кеша: {len(done)}")
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as executor:
+                results = list(executor.map(lambda b: self._translate_batch(b, source, target), batches))
+            fresh = {text: value for result in results for text, value in result.items() if value}
+            if self.cache is not None and fresh:
+                self.cache.put_many({hashes[text]: value for text, value in fresh.items()}, source, target)
+            done.update(fresh)
+
+        return [done.get(t.strip(), '') if t else '' for t in texts]
+
+    def translate(self, text: str, target: str, source: str = 'ru') -> str:
+        """Translates one text."""
+        return self.translate_many([text], target, source)[0]
+
+    def translate_fields(self, fields: Dict[str, str], targets: Sequence[str],
+                         source: str = 'ru') -> Dict[str, Dict[str, str]]:
+        """
+        Translates all fields of a record into several languages.
+
+        The languages are requested concurrently and all fields of one language go
+        into as few requests as possible.
+
+        Returns:
+            Mapping of target (as given) to a mapping of field name to translation
+        """
+        names = list(fields)
+        values = [fields[name] for name in names]
+        with ThreadPoolExecutor(max_workers=max(1, len(targets))) as executor:
+            results = list(executor.map(lambda target: self.translate_many(values, target, source), targets))
+        return {target: dict(zip(names, result)) for target, result in zip(targets, results)}
+
+
+_translator: Optional[Translator] = None
+_translator_lock = threading.Lock()
+
+
+def get_translator() -> Translator:
+    """
+    Returns the process-wide translator.
+
+    Settings are read on first use: OPENAI_API_KEY, TRANSLATION_MODEL,
+    TRANSLATION_CACHE, TRANSLATION_WORKERS and TRANSLATION_BACKEND
+    ('openai' or 'stub' for offline runs). The stub works without the persistent
+    cache, so its fake translations never reach later real runs.
+    """
+    global _translator
+    with _translator_lock:
+        if _translator is None:
+            workers = int(os.getenv('TRANSLATION_WORKERS', DEFAULT_WORKERS))
+            if os.getenv('TRANSLATION_BACKEND', 'openai').strip().lower() == 'stub':
+                _translator = Translator(StubBackend(), None, workers=workers)
+                return _translator
+            if os.getenv('OPENAI_API_KEY'):
+                backend = OpenAIBackend(os.getenv('OPENAI_API_KEY'), os.getenv('TRANSLATION_MODEL', DEFAULT_MODEL))
+            else:
+                logger.warning("OPENAI_API_KEY не задан: используются только сохраненные переводы")
+                backend = None
+            _translator = Translator(
+                backend,
+                TranslationCache(Path(os.getenv('TRANSLATION_CACHE', str(DEFAULT_CACHE_PATH)))),
+                workers=workers
+            )
+        return _translator
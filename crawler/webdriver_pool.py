@@ -0,0 +1,177 @@
+"""
+Pool of reusable Selenium WebDriver instances for the Betaren scrapers.
+Starting Chrome takes seconds, so drivers are kept between pages instead of
+being created and quit for every URL. The pool bounds the number of live
+browsers, checks a driver before handing it out and recycles it after a
+number of pages to keep memory growth of long sessions in check.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+if TYPE_CHECKING:
+    # Модуль драйвера импортируется долго, а нужен здесь только для аннотаций
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+logger = logging.getLogger("webdriver_pool")
+
+DEFAULT_POOL_SIZE = 2
+# После скольких страниц браузер перезапускается (0 - никогда)
+DEFAULT_MAX_PAGES = 50
+
+
+class _PooledDriver:
+    __slots__ = ('driver', 'pages')
+
+    def __init__(self, driver: 'WebDriver'):
+        self.driver = driver
+        self.pages = 0
+
+
+class WebDriverPool:
+    """
+    Bounded pool of WebDriver instances created by a factory.
+
+    At most `size` drivers exist at a time; driver() blocks while all of them are
+    checked out. A driver that fails the health check or raises a WebDriver error
+    (other than a timeout) is quit and replaced on the next checkout.
+    """
+
+    def __init__(self, factory: Callable[[], 'WebDriver'], size: int = DEFAULT_POOL_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES):
+        """
+        Args:
+            factory: Function creating a new configured driver
+            size: Maximum number of live drivers
+            max_pages: Checkouts after which a driver is recycled (0 - unlimited)
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self._idle: List[_PooledDriver] = []
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.created = 0
+
+    @staticmethod
+    def _is_alive(driver: 'WebDriver') -> bool:
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver: 'WebDriver') -> None:
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии браузера: {e}")
+
+    def _checkout(self) -> _PooledDriver:
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                break
+            if self._is_alive(pooled.driver):
+                return pooled
+            logger.warning("Браузер из пула не отвечает, создаем новый")
+            self._quit(pooled.driver)
+        pooled = _PooledDriver(self.factory())
+        self.created += 1
+        logger.debug(f"Запущен браузер #{self.created}")
+        return pooled
+
+    def _release(self, pooled: _PooledDriver, broken: bool) -> None:
+        pooled.pages += 1
+        recycle = self.max_pages and pooled.pages >= self.max_pages
+        with self._lock:
+            if not (broken or recycle or self._closed):
+                self._idle.append(pooled)
+                return
+        if recycle and not broken:
+            logger.debug(f"Браузер обработал {pooled.pages} страниц, перезапускаем")
+        self._quit(pooled.driver)
+
+    @contextmanager
+    def driver(self) -> Iterator['WebDriver']:
+        """
+        Checks out a driver for one page and returns it to the pool afterwards.
+
+        Usage:
+            with pool.driver() as driver:
+                driver.get(url)
+        """
+        if self._closed:
+            raise RuntimeError("Пул браузеров закрыт")
+        self._slots.acquire()
+        pooled = None
+        broken = False
+        try:
+            pooled = self._checkout()
+            yield pooled.driver
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            if pooled is not None:
+                self._release(pooled, broken)
+            self._slots.release()
+
+    def close(self) -> None:
+        """Quits all idle drivers; drivers in use are quit when they are returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._quit(pooled.driver)
+        if self.created:
+            logger.info(f"Пул браузеров закрыт, всего запущено: {self.created}")
+
+
+_pools: Dict[str, WebDriverPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_webdriver_pool(name: str, factory: Callable[[], 'WebDriver']) -> WebDriverPool:
+    """
+    Returns the process-wide pool with the given name, creating it on first use.
+
+    Settings are read on first use: WEBDRIVER_POOL_SIZE and WEBDRIVER_MAX_PAGES.
+    All pools are closed when the process exits.
+
+    Args:
+        name: Pool name (one per scraper, since browser options differ)
+        factory: Function creating a new driver for this pool
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = WebDriverPool(
+                factory,
+                int(os.getenv('WEBDRIVER_POOL_SIZE', DEFAULT_POOL_SIZE)),
+                int(os.getenv('WEBDRIVER_MAX_PAGES', DEFAULT_MAX_PAGES))
+            )
+        return pool
+
+
+def close_all_pools() -> None:
+    """Quits the drivers of all pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
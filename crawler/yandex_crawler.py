@@ -2,12 +2,13 @@
 
 import logging
 import random
-import re
 import time
 import urllib.parse
 from typing import List, Optional
 
-import requests
+import http_client
+from search_cache import get_search_cache
+from search_extractors import extract_yandex_image_urls
 
 # Получаем логгер из основного модуля
 logger = logging.getLogger("image_crawler")
@@ -20,11 +21,17 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"
 ]
 
+YANDEX_SEARCH_URL = "https://yandex.ru/images/search?text={query}"
+
 
 def get_yandex_image_urls(query: str, max_images: int = 10) -> List[str]:
     """
     Gets image URLs from Yandex Images for a given query.
 
+    Result pages are cached on disk, so a repeated query sends no request
+    until the cache entry expires. Only the first max_images URLs of a page are
+    extracted; a later query asking for more re-reads the cached page.
+
     Args:
         query: Search query
         max_images: Maximum number of images to download
@@ -32,8 +39,17 @@ def get_yandex_image_urls(query: str, max_images: int = 10) -> List[str]:
     Returns:
         List of image URLs
     """
-    query_encoded = urllib.parse.quote(query)
-    search_url = f"https://yandex.ru/images/search?text={query_encoded}"
+    cache = get_search_cache()
+    cached_urls = cache.get('yandex', query)
+    if cached_urls is not None and len(cached_urls) < max_images:
+        html = cache.get_html('yandex', query)
+        if html is not None:
+            cached_urls = extract_yandex_image_urls(html, max_images)
+    if cached_urls is not None:
+        logger.info(f"Результаты Яндекса для '{query}' взяты из кеша ({len(cached_urls)} URL)")
+        return cached_urls[:max_images]
+
+    search_url = YANDEX_SEARCH_URL.format(query=urllib.parse.quote(query))
 
     headers = {
         "User-Agent": random.choice(USER_AGENTS),
@@ -51,36 +67,24 @@ def get_yandex_image_urls(query: str, max_images: int = 10) -> List[str]:
 
     try:
         logger.info(f"Поиск изображений в Яндекс по запросу: {query}")
-        response = requests.get(search_url, headers=headers, timeout=15)
+        response = http_client.get(search_url, headers=headers, timeout=15)
         response.raise_for_status()
 
         # Извлечение URL изображений из HTML
         image_urls = []
-
-        # Регулярное выражение для поиска URL изображений в Яндексе
-        # Яндекс хранит URL в JSON-структуре внутри HTML
-        pattern = r'"orig_url":"(https://[^"]+\.(?:jpg|jpeg|png|webp))"'
         try:
-            found_urls = re.findall(pattern, response.text)
-
-            # Фильтрация URL
-            for url in found_urls:
-                # Удаляем экранирование обратного слеша
-                url = url.replace("\\", "")
-                if any(ext in url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
-                    image_urls.append(url)
-                    if len(image_urls) >= max_images:
-                        break
+            image_urls = extract_yandex_image_urls(response.text, max_images)
 
             if not image_urls:
                 logger.warning(f"Не найдено изображений в Яндексе для запроса: {query}")
             else:
                 logger.info(f"Найдено {len(image_urls)} изображений в Яндексе для запроса: {query}")
+                cache.put('yandex', query, response.text, image_urls)
 
         except Exception as e:
             logger.error(f"Ошибка при поиске URL изображений в ответе Яндекса: {e}")
 
-        return image_urls
+        return image_urls[:max_images]
     except Exception as e:
         logger.error(f"Ошибка при получении изображений из Яндекса: {e}")
         return []
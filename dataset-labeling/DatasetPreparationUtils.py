@@ -4,6 +4,7 @@
 """
 
 import os
+import sys
 import json
 import shutil
 import random
@@ -13,6 +14,13 @@ from typing import Dict, List, Tuple, Optional, Union
 import logging
 import cv2
 
+# Индекс почти дубликатов общий с краулером
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "crawler"))
+try:
+    from phash_index import PHashIndex
+except ImportError:
+    PHashIndex = None
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -102,10 +110,29 @@ def load_classes() -> List[str]:
     logger.info(f"Загружено {len(classes)} классов из {CLASSES_FILE}")
     return classes
 
+def load_duplicate_groups() -> Dict[str, str]:
+    """
+    Группирует изображения в кластеры почти дубликатов по перцептивным хешам.
+    
+    Returns:
+        Словарь "путь изображения относительно IMAGES_SOURCE_DIR -> идентификатор кластера".
+    """
+    if PHashIndex is None:
+        logger.warning("Модуль phash_index недоступен, почти дубликаты не учитываются при разделении")
+        return {}
+    
+    index = PHashIndex(IMAGES_SOURCE_DIR)
+    index.update()
+    index.save()
+    return index.clusters()
+
 def split_dataset(train_ratio: float = 0.7, val_ratio: float = 0.15, test_ratio: float = 0.15) -> Dict[str, List[Path]]:
     """
     Разделяет датасет на обучающую, валидационную и тестовую выборки.
     
+    Почти дубликаты (одно и то же фото в другом размере, сжатии или с водяным знаком)
+    всегда попадают в одну выборку, чтобы не завышать метрики на валидации и тесте.
+    
     Args:
         train_ratio: Доля изображений для обучающей выборки.
         val_ratio: Доля изображений для валидационной выборки.
@@ -131,6 +158,10 @@ def split_dataset(train_ratio: float = 0.7, val_ratio: float = 0.15, test_ratio:
         logger.error("Не удалось загрузить классы")
         return dataset_splits
     
+    # Кластеры почти дубликатов и выборки, в которые они уже попали
+    duplicate_groups = load_duplicate_groups()
+    group_splits = {}
+    
     # Для каждого класса разделяем изображения
     for class_name in classes:
         parts = class_name.split('_')
@@ -156,22 +187,36 @@ def split_dataset(train_ratio: float = 0.7, val_ratio: float = 0.15, test_ratio:
             logger.warning(f"Нет изображений в {images_dir}, пропускаем")
             continue
             
-        # Перемешиваем изображения
-        random.shuffle(images)
+        # Объединяем почти дубликаты в группы
+        groups = {}
+        for image in images:
+            key = image.relative_to(IMAGES_SOURCE_DIR).as_posix()
+            groups.setdefault(duplicate_groups.get(key, key), []).append(image)
+        
+        # Перемешиваем группы
+        group_items = list(groups.items())
+        random.shuffle(group_items)
         
         # Вычисляем количество изображений для каждой выборки
         n_train = int(len(images) * train_ratio)
         n_val = int(len(images) * val_ratio)
         
-        # Разделяем изображения
-        train_images = images[:n_train]
-        val_images = images[n_train:n_train + n_val]
-        test_images = images[n_train + n_val:]
-        
-        # Добавляем пути в словарь
-        dataset_splits['train'].extend(train_images)
-        dataset_splits['val'].extend(val_images)
-        dataset_splits['test'].extend(test_images)
+        # Разделяем группы целиком; группа, уже попавшая в выборку из другого класса, идет туда же
+        counts = {'train': 0, 'val': 0, 'test': 0}
+        for group_id, members in group_items:
+            split = group_splits.get(group_id)
+            if split is None:
+                if counts['train'] < n_train:
+                    split = 'train'
+                elif counts['val'] < n_val:
+                    split = 'val'
+                else:
+                    split = 'test'
+                group_splits[group_id] = split
+            
+            # Добавляем пути в словарь
+            dataset_splits[split].extend(members)
+            counts[split] += len(members)
     
     # Выводим информацию о разделении
     for split, images in dataset_splits.items():